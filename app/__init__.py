@@ -1,9 +1,7 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
-from flask_migrate import Migrate
 from .config import Config, TestingConfig
-from .models import db
 import os
 
 
@@ -13,33 +11,68 @@ def create_app(config_class=Config):
     app.config.from_object(config_class)
     app.jinja_env.globals['os'] = os
 
-    # Initialize database
-    db.init_app(app)
+    # Initialize database, with the engine tuned for its dialect
+    from .database import init_database, init_migrate
+    init_database(app)
 
-    # Initialize Flask-Migrate
-    migrate = Migrate(app, db)
+    # Initialize the per-request SQL instrumentation, when it is turned on
+    from .query_stats import init_query_stats
+    init_query_stats(app)
 
-    # Ensure the database file path exists
-    database_path = os.path.join(app.root_path, 'app.db')
-    if not os.path.exists(database_path):
-        open(database_path, 'w').close()
+    # Initialize Flask-Migrate, which imports Alembic, only for the flask commands.
+    # The schema is managed by the migrations (flask init-db), never at startup
+    if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+        init_migrate(app)
 
-    # Create database tables
-    with app.app_context():
-        db.create_all()
+    # Initialize activity logging
+    from .activity import init_activity_recorder
+    init_activity_recorder(app)
+
+    # Initialize the memoized navbar and its unread notification counter
+    from .nav import init_nav
+    init_nav(app)
+
+    # Initialize the rendered fragment cache
+    from .fragment_cache import init_fragment_cache
+    init_fragment_cache(app)
+
+    # Initialize the resized upload images
+    from .images import init_images
+    init_images(app)
+
+    # Initialize fingerprinted static file serving
+    from .assets import init_assets
+    init_assets(app)
+
+    # Initialize the built-in avatar sprite helpers
+    from .avatars import init_avatars
+    init_avatars(app)
+
+    # Initialize the content-addressed upload storage
+    from .uploads import init_uploads
+    init_uploads(app)
+
+    # Initialize the uploaded image processing queue
+    from .image_jobs import init_image_jobs
+    init_image_jobs(app)
+
+    # Initialize the bounded password hashing pool
+    from .passwords import init_passwords
+    init_passwords(app)
 
     # Initialize login manager
     login_manager = LoginManager()
     login_manager.init_app(app)
     login_manager.login_view = 'login'
 
-    # Load user from database
-    @login_manager.user_loader
-    def load_user(user_id):
-        from .models import User  # Import here to avoid circular dependencies
-        return User.query.get(int(user_id))
+    # Load the logged-in user from the per-process user cache
+    from .identity import init_identity
+    init_identity(app, login_manager)
 
     from .routes import init_app_routes  # Import routes after db to avoid circular import
     init_app_routes(app)  # Initialize routes
 
+    from .commands import init_app_commands
+    init_app_commands(app)  # Register CLI commands
+
     return app
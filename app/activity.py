@@ -0,0 +1,170 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import event, insert
+from .models import db, Activity
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = 'pending_activities'
+_STOP = object()
+
+
+class ActivityRecorder:
+    """Writes Activity rows off the request path.
+
+    Routes call record_activity() before their commit. Rows are held on the session
+    until it commits (so a rolled back request logs nothing), then queued for a
+    background worker that inserts them in batches of ACTIVITY_BATCH_SIZE or every
+    ACTIVITY_FLUSH_INTERVAL seconds. With ACTIVITY_ASYNC off the rows are simply
+    added to the request's own transaction, which is what the tests use.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.asynchronous = app.config['ACTIVITY_ASYNC']
+        self.batch_size = app.config['ACTIVITY_BATCH_SIZE']
+        self.flush_interval = app.config['ACTIVITY_FLUSH_INTERVAL']
+        self._queue = queue.Queue(maxsize=app.config['ACTIVITY_QUEUE_SIZE'])
+        self._lock = threading.Lock()
+        self._metrics_lock = threading.Lock()  # Request threads and the worker all count
+        self._worker = None
+        self._worker_pid = None
+        self.metrics = {'recorded': 0, 'flushed': 0, 'batches': 0, 'overflow': 0, 'failed': 0, 'high_water': 0}
+
+    def record(self, user_id, action, target_user_id=None):
+        row = {'user_id': user_id, 'action': action, 'target_user_id': target_user_id,
+               'timestamp': datetime.utcnow()}
+        if self.asynchronous:
+            db.session.info.setdefault(PENDING_KEY, []).append(row)
+        else:
+            db.session.add(Activity(**row))
+            self._forget_unread([row])
+
+    def enqueue(self, rows):
+        self._ensure_worker()
+        overflow = []
+        for row in rows:
+            try:
+                self._queue.put_nowait(row)
+            except queue.Full:
+                overflow.append(row)
+        with self._metrics_lock:
+            self.metrics['recorded'] += len(rows)
+            self.metrics['high_water'] = max(self.metrics['high_water'], self._queue.qsize())
+            self.metrics['overflow'] += len(overflow)
+
+        # Backpressure: when the worker can't keep up, the request writes its own rows
+        if overflow:
+            self._write(overflow)
+
+    def stats(self):
+        with self._metrics_lock:
+            metrics = dict(self.metrics)
+        return dict(metrics, queue_depth=self._queue.qsize(), queue_size=self._queue.maxsize)
+
+    def flush(self):
+        """Write everything queued so far from the calling thread."""
+        batch = []
+        while True:
+            try:
+                row = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if row is not _STOP:
+                batch.append(row)
+        for start in range(0, len(batch), self.batch_size):
+            self._write(batch[start:start + self.batch_size])
+
+    def shutdown(self, timeout=5.0):
+        worker = self._worker
+        if worker is not None and worker.is_alive():
+            self._queue.put(_STOP)
+            worker.join(timeout)
+        self.flush()
+
+    def _ensure_worker(self):
+        # Started lazily, and again in each forked worker process, which doesn't inherit threads
+        if self._worker is not None and self._worker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker_pid == os.getpid():
+                return
+            self._worker = threading.Thread(target=self._run, name='activity-recorder', daemon=True)
+            self._worker_pid = os.getpid()
+            self._worker.start()
+            atexit.register(self.shutdown)
+
+    def _run(self):
+        while True:
+            batch, stopping = self._next_batch()
+            if batch:
+                self._write(batch)
+            if stopping:
+                return
+
+    def _next_batch(self):
+        # Block for the first row, then keep collecting until the batch is full or the interval is up
+        row = self._queue.get()
+        if row is _STOP:
+            return [], True
+        batch = [row]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                row = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if row is _STOP:
+                return batch, True
+            batch.append(row)
+        return batch, False
+
+    def _write(self, rows):
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as connection:
+                    connection.execute(insert(Activity.__table__), rows)
+            with self._metrics_lock:
+                self.metrics['flushed'] += len(rows)
+                self.metrics['batches'] += 1
+            self._forget_unread(rows)
+        except Exception:
+            with self._metrics_lock:
+                self.metrics['failed'] += len(rows)
+            logger.exception('Failed to write %d activity row(s)', len(rows))
+
+    def _forget_unread(self, rows):
+        # The targets' cached unread badge counts (see nav.py) are now out of date
+        counter = self.app.extensions.get('unread_counter')
+        if counter is not None:
+            counter.forget({row['target_user_id'] for row in rows if row['target_user_id']})
+
+
+def record_activity(user_id, action, target_user_id=None):
+    current_app.extensions['activity_recorder'].record(user_id, action, target_user_id)
+
+
+def _enqueue_pending(session):
+    rows = session.info.pop(PENDING_KEY, None)
+    if rows:
+        current_app.extensions['activity_recorder'].enqueue(rows)
+
+
+def _discard_pending(session):
+    session.info.pop(PENDING_KEY, None)
+
+
+def init_activity_recorder(app):
+    app.extensions['activity_recorder'] = ActivityRecorder(app)
+    if not event.contains(db.session, 'after_commit', _enqueue_pending):
+        event.listen(db.session, 'after_commit', _enqueue_pending)
+        event.listen(db.session, 'after_rollback', _discard_pending)
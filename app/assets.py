@@ -0,0 +1,166 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import shutil
+from flask import abort, current_app, request
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file
+
+try:
+    import brotli
+except ImportError:  # Only gzip copies are built without it
+    brotli = None
+
+# style.css is linked as style.<12 hex digits of its SHA-256>.css
+FINGERPRINT = re.compile(r'^(?P<stem>.+)\.(?P<digest>[0-9a-f]{12})(?P<suffix>\.[A-Za-z0-9]+)$')
+DIGEST_LENGTH = 12
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt'}
+# Precompressed copies sit next to the original, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+CHUNK_SIZE = 1024 * 1024
+
+
+class StaticAssets:
+    """Serves the static folder with fingerprinted, far-future cacheable URLs.
+
+    url_for('static', filename=...) puts a hash of the file's contents into its
+    name, and a request for that name is answered with an immutable Cache-Control
+    and the content hash as a strong ETag; Range requests are honoured. Plain
+    names still work, revalidated on every use. CSS and JS are sent from .br/.gz
+    copies made by `flask build-assets` when the client accepts them. With
+    STATIC_SENDFILE set the bytes are left to the front proxy (X-Sendfile or
+    nginx's X-Accel-Redirect under STATIC_ACCEL_PREFIX).
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.folder = app.static_folder
+        self.max_age = app.config['STATIC_MAX_AGE']
+        self.sendfile = app.config['STATIC_SENDFILE']
+        self.accel_prefix = app.config['STATIC_ACCEL_PREFIX']
+        self._digests = {}
+
+    def digest(self, filename):
+        """SHA-256 of a static file, or None if it does not exist."""
+        # Files only change with a deploy, except while developing with templates reloading
+        check = self.app.debug or self.app.jinja_env.auto_reload
+        entry = self._digests.get(filename)
+        if entry is not None and not check:
+            return entry[1]
+        path = safe_join(self.folder, filename)
+        try:
+            modified = os.stat(path).st_mtime_ns
+        except (OSError, TypeError):
+            self._digests[filename] = (None, None)  # Missing is remembered as well, and looked for again only with check
+            return None
+        if entry is not None and entry[0] == modified:
+            return entry[1]
+        sha = hashlib.sha256()
+        with open(path, 'rb') as asset:
+            for chunk in iter(lambda: asset.read(CHUNK_SIZE), b''):
+                sha.update(chunk)
+        self._digests[filename] = (modified, sha.hexdigest())
+        return sha.hexdigest()
+
+    def fingerprint(self, filename):
+        digest = self.digest(filename)
+        if digest is None:
+            return filename
+        stem, suffix = os.path.splitext(filename)
+        return f'{stem}.{digest[:DIGEST_LENGTH]}{suffix}'
+
+    def serve(self, filename):
+        path = safe_join(self.folder, filename)
+        requested = None
+        if path is None or not os.path.isfile(path):
+            match = FINGERPRINT.match(filename)
+            if match is None:
+                abort(404)
+            filename, requested = match['stem'] + match['suffix'], match['digest']
+            path = safe_join(self.folder, filename)
+            if path is None or not os.path.isfile(path):
+                abort(404)
+
+        digest = self.digest(filename)
+        # An old fingerprint gets today's file, but only until it is revalidated
+        immutable = requested is not None and digest.startswith(requested)
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        encoding = None
+        suffix = os.path.splitext(filename)[1]
+        if suffix in COMPRESSIBLE:
+            for name, extension in ENCODINGS:
+                if name in request.accept_encodings and _fresh(path + extension, path):
+                    path, encoding = path + extension, name
+                    break
+
+        etag = f'{digest}-{encoding}' if encoding else digest
+        if self.sendfile == 'x-accel-redirect':
+            response = current_app.response_class(mimetype=mimetype)
+            response.headers['X-Accel-Redirect'] = self.accel_prefix + os.path.relpath(path, self.folder).replace(os.sep, '/')
+            response.set_etag(etag)
+        else:
+            response = send_file(path, request.environ, mimetype=mimetype, etag=etag, conditional=True,
+                                 use_x_sendfile=self.sendfile == 'x-sendfile',
+                                 response_class=current_app.response_class, _root_path=current_app.root_path)
+        if encoding:
+            response.content_encoding = encoding
+        if suffix in COMPRESSIBLE:
+            response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        if immutable:
+            response.cache_control.max_age = self.max_age
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+        return response
+
+    def build(self):
+        """Write .gz (and .br, with brotli installed) copies of CSS and JS; yields (path, size, compressed sizes)."""
+        for root, _, files in os.walk(self.folder):
+            for file in files:
+                path = os.path.join(root, file)
+                if os.path.splitext(file)[1] not in COMPRESSIBLE:
+                    continue
+                with open(path, 'rb') as asset:
+                    data = asset.read()
+                sizes = {}
+                for name, extension in ENCODINGS:
+                    if name == 'br' and brotli is None:
+                        continue
+                    compressed = brotli.compress(data, quality=11) if name == 'br' else gzip.compress(data, 9, mtime=0)
+                    if len(compressed) < len(data):
+                        _write(path + extension, compressed)
+                        sizes[name] = len(compressed)
+                yield path, len(data), sizes
+
+
+def _fresh(copy, original):
+    # A precompressed copy older than its original was built from an earlier version
+    try:
+        return os.stat(copy).st_mtime_ns >= os.stat(original).st_mtime_ns
+    except OSError:
+        return False
+
+
+def _write(path, data):
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as output:
+        output.write(data)
+    shutil.copystat(path[:path.rindex('.')], temporary)
+    os.replace(temporary, path)
+
+
+def static_assets():
+    return current_app.extensions['static_assets']
+
+
+def init_assets(app):
+    assets = app.extensions['static_assets'] = StaticAssets(app)
+    app.view_functions['static'] = assets.serve
+
+    @app.url_defaults
+    def fingerprint_static(endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = assets.fingerprint(values['filename'])
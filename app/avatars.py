@@ -0,0 +1,79 @@
+import hashlib
+import os
+import re
+from flask import url_for
+from markupsafe import Markup
+from .assets import static_assets, DIGEST_LENGTH
+from .images import Image, writable_formats
+
+# The built-in avatars are avatar1.png ... avatarN.png in static/image/avatars
+AVATAR = re.compile(r'^avatar(\d+)\.png$')
+SPRITE_CSS = 'css/avatars.css'
+SPRITE_COLUMNS = 6
+SPRITE_CELL = 120  # pixels; twice the largest size avatars are shown at from the sprite
+
+
+def avatar_numbers(avatar_folder):
+    """The numbers N of the built-in avatarN.png files, in order."""
+    return sorted(int(match[1]) for match in map(AVATAR.match, os.listdir(avatar_folder)) if match)
+
+
+def build_sprite(avatar_folder, static_folder, cell=SPRITE_CELL, columns=SPRITE_COLUMNS):
+    """Tile the built-in avatars into one image and write the CSS that shows each of them.
+
+    Returns (sprite path, number of avatars, sprite size in bytes).
+    """
+    numbers = avatar_numbers(avatar_folder)
+    rows = -(-len(numbers) // columns)
+    sprite = Image.new('RGB', (cell * columns, cell * rows), (255, 255, 255))
+    for index, number in enumerate(numbers):
+        with Image.open(os.path.join(avatar_folder, f'avatar{number}.png')) as avatar:
+            tile = avatar.convert('RGB').resize((cell, cell), Image.Resampling.LANCZOS)
+        sprite.paste(tile, (index % columns * cell, index // columns * cell))
+
+    extension = 'webp' if 'webp' in writable_formats(('webp',)) else 'png'
+    path = os.path.join(avatar_folder, f'sprite.{extension}')
+    if extension == 'webp':
+        sprite.save(path, 'WEBP', quality=85, method=6)
+    else:
+        sprite.save(path, 'PNG', optimize=True)
+
+    # Link the sprite by its fingerprint so it is cached as long as the stylesheet is
+    with open(path, 'rb') as built:
+        digest = hashlib.sha256(built.read()).hexdigest()[:DIGEST_LENGTH]
+    url = f'../image/avatars/sprite.{digest}.{extension}'
+    lines = [f'.avatar-sprite {{ display: inline-block; flex-shrink: 0; background: url("{url}") 0 0 / '
+             f'{columns * 100}% {rows * 100}% no-repeat; }}']
+    for index, number in enumerate(numbers):
+        x = index % columns * 100 / max(columns - 1, 1)
+        y = index // columns * 100 / max(rows - 1, 1)
+        lines.append(f'.avatar-sprite-{number} {{ background-position: {x:g}% {y:g}%; }}')
+    with open(os.path.join(static_folder, SPRITE_CSS), 'w') as css:
+        css.write('/* Generated by flask build-avatars */\n' + '\n'.join(lines) + '\n')
+    return path, len(numbers), os.path.getsize(path)
+
+
+def sprite_available():
+    return static_assets().digest(SPRITE_CSS) is not None
+
+
+def avatar(user_image, css_class, alt='User Avatar'):
+    """Template helper: a user's avatar, cut from the sprite when it is one of the built-in ones."""
+    name = user_image or 'avatar1.png'
+    match = AVATAR.match(name)
+    if match and sprite_available():
+        return Markup('<span class="avatar-sprite avatar-sprite-{} {}" role="img" aria-label="{}"></span>').format(
+            match[1], css_class, alt)
+    return Markup('<img src="{}" alt="{}" class="{}">').format(
+        url_for('static', filename='image/avatars/' + name), alt, css_class)
+
+
+def avatar_stylesheet():
+    if not sprite_available():
+        return ''
+    return Markup('<link rel="stylesheet" href="{}">').format(url_for('static', filename=SPRITE_CSS))
+
+
+def init_avatars(app):
+    app.add_template_global(avatar)
+    app.add_template_global(avatar_stylesheet)
@@ -0,0 +1,252 @@
+import os
+import time
+import click
+from .counters import repair_reply_counts, repair_like_counts
+from .search import create_search_backend
+from .fragment_cache import fragment_cache
+from .images import Image, available_formats, derivative_store
+from .image_jobs import image_job_queue
+from .uploads import upload_store
+from .assets import static_assets, brotli
+from .avatars import build_sprite
+from .database import self_check, init_migrate
+from .replicas import sync_sqlite_replicas
+from .query_audit import run_audit
+from .seeder import Seeder, SEED_PASSWORD
+from .models import db, Post, ImageJob
+
+
+def init_app_commands(app):
+    # Define the schema setup and upgrade, run on install and deploy: flask init-db
+    @app.cli.command('init-db')
+    def init_db():
+        """Create the database or bring it up to date by running the migrations."""
+        init_migrate(app)
+        from flask_migrate import stamp, upgrade
+        from alembic.runtime.migration import MigrationContext
+        tables = db.inspect(db.engine).get_table_names()
+        with db.engine.connect() as connection:
+            revision = MigrationContext.configure(connection).get_current_revision()
+        if not tables:
+            # The migrations start from the first release's schema, not from an empty
+            # database, so a new one gets today's schema directly and is marked current
+            db.create_all()
+            stamp()
+        elif revision is None:
+            # Upgrading from the base would replay every migration over the existing tables
+            raise click.ClickException('The database has tables but no migration revision; '
+                                       'mark the revision it matches with flask db stamp first.')
+        else:
+            upgrade()
+        click.echo(f'Database is at the latest migration: {db.engine.url.render_as_string(hide_password=True)}')
+
+    # Define the configuration self-check, run on deploy: flask self-check
+    @app.cli.command('self-check')
+    def self_check_command():
+        """Print the database settings in effect and fail on ones unfit for production."""
+        settings, warnings = self_check(app)
+        width = max(len(name) for name, _ in settings)
+        for name, value in settings:
+            click.echo(f'{name:<{width}}  {value}')
+        for warning in warnings:
+            click.echo(f'Warning: {warning}', err=True)
+        if warnings:
+            raise SystemExit(1)
+
+    # Define the bulk synthetic data generator for load tests and benchmarks: flask seed
+    @app.cli.command('seed')
+    @click.option('--users', default=10000, show_default=True)
+    @click.option('--posts', default=100000, show_default=True)
+    @click.option('--replies', default=1000000, show_default=True, help='About this many in total.')
+    @click.option('--post-likes', default=1000000, show_default=True, help='About this many in total.')
+    @click.option('--reply-likes', default=1000000, show_default=True, help='About this many in total.')
+    @click.option('--activities', default=500000, show_default=True)
+    @click.option('--seed', default=0, show_default=True, help='Same seed and counts, same data.')
+    @click.option('--chunk-size', default=10000, show_default=True, help='Rows per INSERT batch.')
+    def seed_command(users, posts, replies, post_likes, reply_likes, activities, seed, chunk_size):
+        """Append a large synthetic forum to the database, reporting rows per second."""
+        seeder = Seeder(users, posts, replies, post_likes, reply_likes, activities, seed, chunk_size)
+        started = time.perf_counter()
+
+        def progress(table, done, total):
+            elapsed = time.perf_counter() - started
+            click.echo(f'{table:<10}{done:>12,} / {total:,}  {elapsed:8.1f}s', err=True)
+        stats = seeder.run(progress)
+        elapsed = time.perf_counter() - started
+        fragment_cache().clear()  # A recreated database reuses ids the cache may still hold
+
+        click.echo(f'{"table":<14}{"rows":>14}{"rows/s":>12}')
+        for table, (rows, seconds) in stats.items():
+            click.echo(f'{table:<14}{rows:>14,}{rows / seconds if seconds else 0:>12,.0f}')
+        total = sum(rows for rows, _ in stats.values())
+        click.echo(f'{"total":<14}{total:>14,}{total / elapsed:>12,.0f}  ({elapsed:.1f}s including generation)')
+        click.echo(f'Every seeded user can log in with the password "{SEED_PASSWORD}".')
+
+    # Define the index audit, run after schema or query changes: flask audit-queries
+    @app.cli.command('audit-queries')
+    @click.option('--users', default=200, show_default=True)
+    @click.option('--posts', default=2000, show_default=True)
+    @click.option('--replies', default=10, show_default=True, help='Average replies per post.')
+    @click.option('--seed', default=0, show_default=True)
+    @click.option('--verbose', is_flag=True, help='Print every query plan, not only the full scans.')
+    def audit_queries(users, posts, replies, seed, verbose):
+        """EXPLAIN every query the routes make against a large seeded database; fail on full table scans."""
+        click.echo(f'Seeding {users} users, {posts} posts and about {posts * replies} replies...')
+        results = run_audit(users, posts, replies, seed)
+        scans = 0
+        for label, queries in results.items():
+            flagged = sum(1 for _, _, lines in queries if lines)
+            scans += flagged
+            click.echo(f'{label:<22}{len(queries):>3} queries  {"FULL SCAN" if flagged else "ok"}')
+            for statement, plan, lines in queries:
+                if lines or verbose:
+                    click.echo('    ' + ' '.join(statement.split()))
+                    for detail in plan:
+                        click.echo(f'      {"!" if detail in lines else " "} {detail}')
+        if scans:
+            raise click.ClickException(f'{scans} queries read whole tables.')
+
+    # Define the local replication stand-in for SQLite replicas: flask sync-replicas
+    @app.cli.command('sync-replicas')
+    def sync_replicas():
+        """Copy the SQLite primary into the SQLite read replicas."""
+        replicas = app.extensions['replicas'].engines if 'replicas' in app.extensions else []
+        if db.engine.dialect.name != 'sqlite' or any(replica.dialect.name != 'sqlite' for replica in replicas):
+            raise click.ClickException('Only SQLite replicas are copied; other databases replicate themselves.')
+        sync_sqlite_replicas(db.engine, replicas)
+        click.echo(f'Copied the primary into {len(replicas)} replica(s).')
+
+    # Define the counter backfill/repair command: flask repair-counters
+    @app.cli.command('repair-counters')
+    def repair_counters():
+        """Recompute the denormalized reply and like counters on posts and replies."""
+        fixed = repair_reply_counts() + repair_like_counts()
+        click.echo(f'Repaired {fixed} counter(s).')
+
+    # Define the in-process search index rebuild command: flask search-index
+    @app.cli.command('search-index')
+    def search_index():
+        """Rebuild the inverted search index from the database and save its snapshot."""
+        backend = create_search_backend(app, 'inverted_index')
+        if not backend.snapshot_path:
+            raise click.ClickException('SEARCH_INDEX_SNAPSHOT is not set.')
+        index = backend.rebuild()
+        click.echo(f'Indexed {len(index)} post(s) into {backend.snapshot_path}.')
+
+    # Define the fragment cache reset command, for after template changes: flask clear-fragment-cache
+    @app.cli.command('clear-fragment-cache')
+    def clear_fragment_cache():
+        """Drop every cached post card and reply fragment."""
+        fragment_cache().clear()
+        click.echo('Cleared the fragment cache.')
+
+    # Define the image derivative backfill, so first views of old posts are not slow: flask image-derivatives
+    @app.cli.command('image-derivatives')
+    def image_derivatives():
+        """Make every resized copy of every post image that does not exist yet."""
+        formats = available_formats()
+        if not formats:
+            raise click.ClickException('Pillow is not installed.')
+        store = derivative_store()
+        widths = sorted({size for sizes in app.config['IMAGE_WIDTHS'].values() for size in sizes})
+        names = db.session.scalars(db.select(Post.image_name).where(Post.image_name.is_not(None)).distinct()).all()
+        missing = 0
+        for name in names:
+            if store.source_path(name) is None:
+                missing += 1
+                continue
+            for width in widths:
+                for fmt in formats:
+                    store.get(name, width, fmt)
+        click.echo(f'Made derivatives for {len(names) - missing} image(s); {missing} upload(s) missing.')
+
+    # Define the leftover image job runner: flask image-jobs
+    @app.cli.command('image-jobs')
+    def image_jobs():
+        """Process the uploaded images whose jobs were left pending or stuck running."""
+        queue = image_job_queue()
+        resumed = queue.resume()
+        queue.drain()
+        click.echo(f'Processed {resumed} image job(s).')
+
+    # Define the upload garbage collector: flask gc-uploads
+    @app.cli.command('gc-uploads')
+    @click.option('--grace', default=3600, show_default=True, help='Keep files modified in the last N seconds.')
+    @click.option('--dry-run', is_flag=True, help='Only list what would be deleted.')
+    def gc_uploads(grace, dry_run):
+        """Delete uploads, incoming files and derivatives that no post or job refers to."""
+        store = upload_store()
+        garbage = list(store.orphans(grace))
+
+        jobs = set(db.session.scalars(db.select(ImageJob.source)))
+        if os.path.isdir(store.incoming_folder):
+            garbage += [entry.path for entry in os.scandir(store.incoming_folder)
+                        if entry.is_file() and entry.name not in jobs and _older_than(entry.path, grace)]
+
+        derivatives = derivative_store()
+        widths = {size for sizes in app.config['IMAGE_WIDTHS'].values() for size in sizes}
+        live = set()
+        for name in db.session.scalars(db.select(Post.image_name).where(Post.image_name.is_not(None)).distinct()):
+            source = derivatives.source_path(name)
+            if source is not None:
+                digest = derivatives.source_digest(source)
+                live.update(derivatives.derivative_path(digest, width, fmt) for width in widths
+                            for fmt in available_formats())
+        for root, _, files in os.walk(derivatives.folder):
+            garbage += [os.path.join(root, file) for file in files
+                        if os.path.join(root, file) not in live and _older_than(os.path.join(root, file), grace)]
+
+        for path in garbage:
+            click.echo(path)
+            if not dry_run:
+                os.remove(path)
+        click.echo(f'{"Would delete" if dry_run else "Deleted"} {len(garbage)} file(s).')
+
+    # Define the move of uuid-named uploads into content-addressed storage: flask dedupe-uploads
+    @app.cli.command('dedupe-uploads')
+    def dedupe_uploads():
+        """Store old uuid-named uploads under their content hash, merging identical files."""
+        store = upload_store()
+        names = db.session.scalars(db.select(Post.image_name).where(
+            Post.image_name.is_not(None), Post.image_name.not_like('%/%')).distinct()).all()
+        moved, blobs = 0, set()
+        for name in names:
+            if not store.exists(name):
+                continue
+            blob = store.add_file(store.path(name))
+            db.session.execute(db.update(Post).where(Post.image_name == name)
+                               .values(image_name=blob, version=Post.version + 1))
+            db.session.commit()
+            os.remove(store.path(name))
+            moved += 1
+            blobs.add(blob)
+        click.echo(f'Moved {moved} upload(s) into {len(blobs)} stored file(s).')
+
+
+    # Define the avatar sprite build, run on deploy before build-assets: flask build-avatars
+    @app.cli.command('build-avatars')
+    def build_avatars():
+        """Tile the built-in avatars into one sprite image with a stylesheet to show them."""
+        if Image is None:
+            raise click.ClickException('Pillow is not installed.')
+        folder = os.path.join(app.static_folder, 'image', 'avatars')
+        originals = sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder)
+                        if name.startswith('avatar'))
+        path, count, size = build_sprite(folder, app.static_folder)
+        click.echo(f'{os.path.relpath(path, app.static_folder)}: {count} avatars, {originals} -> {size} bytes')
+        fragment_cache().clear()  # Cached cards still link the separate images
+
+    # Define the static asset precompression step, run on deploy: flask build-assets
+    @app.cli.command('build-assets')
+    def build_assets():
+        """Write gzip and brotli copies of the CSS and JS files next to them."""
+        assets = static_assets()
+        for path, size, compressed in assets.build():
+            sizes = ', '.join(f'{name} {length}' for name, length in compressed.items())
+            click.echo(f'{os.path.relpath(path, assets.folder)}: {size} -> {sizes or "not smaller"}')
+        if brotli is None:
+            click.echo('brotli is not installed; only gzip copies were written.')
+
+
+def _older_than(path, seconds):
+    return os.path.getmtime(path) < time.time() - seconds
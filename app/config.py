@@ -1,17 +1,130 @@
 import os
 baseurl = os.path.abspath(os.path.dirname(__file__))
 
+DEVELOPMENT_SECRET_KEY = 'mysecretkey'
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def _database_url():
+    url = os.environ.get('DATABASE_URL')
+    if not url:
+        return 'sqlite:///' + os.path.join(baseurl, 'app.db')
+    # Some hosts hand out postgres:// URLs, a scheme SQLAlchemy no longer accepts
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
 class Config:
-    SECRET_KEY = 'mysecretkey'
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(baseurl, 'app.db')
+    SECRET_KEY = os.environ.get('SECRET_KEY', DEVELOPMENT_SECRET_KEY)
+    SQLALCHEMY_DATABASE_URI = _database_url()
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Database engine (see database.py). SQLite gets these pragmas on every connection:
+    # WAL lets readers run alongside the one writer, and busy_timeout makes a writer wait
+    # for the lock instead of failing with 'database is locked'
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',  # Safe with WAL; a power cut can lose the last commits, not corrupt
+        'busy_timeout': _env_int('DB_BUSY_TIMEOUT', 5000),  # milliseconds
+        'mmap_size': _env_int('DB_MMAP_SIZE', 256 * 1024 * 1024),  # bytes
+        'cache_size': -_env_int('DB_CACHE_SIZE', 64 * 1024),  # KiB per connection (negative means KiB)
+        'temp_store': 'MEMORY',
+    }
+    # PostgreSQL connection pool, per worker process: size it so that
+    # workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) stays under the server's max_connections
+    DB_POOL_SIZE = _env_int('DB_POOL_SIZE', 5)
+    DB_MAX_OVERFLOW = _env_int('DB_MAX_OVERFLOW', 10)
+    DB_POOL_TIMEOUT = _env_int('DB_POOL_TIMEOUT', 10)  # seconds to wait for a free connection
+    DB_POOL_RECYCLE = _env_int('DB_POOL_RECYCLE', 1800)  # seconds; reconnect before idle timeouts on the way
+    DB_POOL_PRE_PING = True  # Test connections on checkout so a database restart costs no failed requests
+
+    # Read replicas (see replicas.py): GET requests read from these, comma-separated in DATABASE_REPLICA_URLS.
+    # With SQLite files, `flask sync-replicas` copies the primary into them
+    DB_REPLICAS = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+    DB_REPLICA_STICKY_SECONDS = _env_int('DB_REPLICA_STICKY_SECONDS', 10)  # after a write, a client reads from the primary
+    DB_REPLICA_RETRY_INTERVAL = 30  # seconds a replica that failed to connect is left out
     AVATAR_FOLDER = os.path.join(os.path.dirname(__file__), 'static', 'image', 'avatars')
     UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'static', 'image', 'uploads')
     MAX_CONTENT_LENGTH = 10 * 1024 * 1024  # 10 MB limit
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+    POSTS_PER_PAGE = 20
+    ACTIVITIES_PER_PAGE = 30
+    UNREAD_NOTIFICATION_LIMIT = 100
+    UNREAD_COUNT_TTL = 30  # seconds a cached unread badge count is trusted
+    USER_CACHE_TTL = 30  # seconds a cached logged-in user (see identity.py) is trusted
+    USER_CACHE_SIZE = 10000
+    REPLIES_PER_PAGE = 20
+    REPLY_CHILDREN_PER_PAGE = 5
+    REPLY_TREE_MAX_DEPTH = 6
+    REPLY_TREE_NODE_LIMIT = 500
+    SEARCH_RESULTS_PER_PAGE = 20
+    SEARCH_CANDIDATE_LIMIT = 2000  # newest full-text matches ranked; older ones are not found
+
+    # Search backend (see search.py): 'auto' uses FTS5 when the database has it, else the in-process index
+    SEARCH_BACKEND = 'auto'
+    SEARCH_INDEX_SNAPSHOT = os.path.join(baseurl, 'search_index.snapshot')
+    SEARCH_INDEX_REFRESH_INTERVAL = 5.0  # seconds
+
+    # Rendered post card and reply fragments (see fragment_cache.py):
+    # 'memory' (per-process LRU), 'sqlite' (one file shared by the workers on a host) or 'none'
+    FRAGMENT_CACHE_BACKEND = 'memory'
+    FRAGMENT_CACHE_MAX_BYTES = 32 * 1024 * 1024
+    FRAGMENT_CACHE_PATH = os.path.join(baseurl, 'fragment_cache.db')
+
+    # Resized copies of uploads (see images.py), made on first request and cached by content hash
+    IMAGE_WIDTHS = {'card': (240, 480), 'detail': (640, 1280)}  # 1x and 2x of the CSS widths
+    IMAGE_FORMATS = ('avif', 'webp', 'jpeg')  # Offered in this order where Pillow can write them
+    IMAGE_QUALITY = {'avif': 50, 'webp': 75, 'jpeg': 75}  # AVIF at 50 looks like WebP at 75 and is smaller
+    IMAGE_CACHE_FOLDER = os.path.join(os.path.dirname(__file__), 'static', 'image', 'derived')
+    IMAGE_MAX_AGE = 7 * 24 * 3600  # seconds browsers may cache a derivative
+
+    # Uploaded images are processed in worker processes (see image_jobs.py)
+    IMAGE_JOBS_ASYNC = True
+    IMAGE_WORKERS = 2
+    IMAGE_JOB_ATTEMPTS = 3
+    IMAGE_JOB_TIMEOUT = 300  # seconds before a claimed job is presumed lost with its process and retried
+    IMAGE_INCOMING_FOLDER = os.path.join(baseurl, 'incoming')
+
+    # Static files (see assets.py); fingerprinted URLs are cached for STATIC_MAX_AGE seconds
+    STATIC_MAX_AGE = 365 * 24 * 3600
+    STATIC_SENDFILE = None  # 'x-sendfile' or 'x-accel-redirect' to let the front proxy send the bytes
+    STATIC_ACCEL_PREFIX = '/_static/'  # nginx internal location aliased to app/static
+
+    # Password hashing (see passwords.py), in werkzeug's notation. Hashes made with another
+    # method or cost are replaced at the user's next login
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_WORKERS = _env_int('PASSWORD_WORKERS', 2)  # hashes computed at once, per process
+    PASSWORD_QUEUE_LIMIT = _env_int('PASSWORD_QUEUE_LIMIT', 16)  # waiting or running, before logins are turned away
+
+    # Per-request SQL instrumentation (see query_stats.py), off unless QUERY_STATS=1: query counts,
+    # database time and slowest statements per route, an N+1 detector and a slow-query log
+    QUERY_STATS = bool(_env_int('QUERY_STATS', 0))
+    QUERY_STATS_HEADER = bool(_env_int('QUERY_STATS_HEADER', 0))  # X-Query-Count and Server-Timing on every response
+    QUERY_SLOW_MS = _env_int('QUERY_SLOW_MS', 100)  # statements slower than this are logged
+    QUERY_N_PLUS_ONE_THRESHOLD = _env_int('QUERY_N_PLUS_ONE_THRESHOLD', 5)  # one statement run more often in a request is logged
+    QUERY_STATS_SLOWEST = 5  # statements kept per route
+
+    # Users who may see the operator endpoints (/query_stats, /fragment_cache/stats), comma-separated
+    # in OPERATOR_USERNAMES. They are a 404 for everyone else, and for everyone while the list is empty
+    OPERATOR_USERNAMES = {name.strip() for name in os.environ.get('OPERATOR_USERNAMES', '').split(',') if name.strip()}
+
+    # Activity logging (see activity.py)
+    ACTIVITY_ASYNC = True
+    ACTIVITY_BATCH_SIZE = 100
+    ACTIVITY_FLUSH_INTERVAL = 1.0  # seconds
+    ACTIVITY_QUEUE_SIZE = 10000
 
 class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(baseurl, 'test.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), '..', 'tests')
+    ACTIVITY_ASYNC = False
+    IMAGE_JOBS_ASYNC = False
+    SEARCH_INDEX_SNAPSHOT = None
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1'  # Nothing to protect, so tests spend no time hashing
@@ -0,0 +1,84 @@
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.orm import aliased
+from .models import db, Post, Reply, PostLike, ReplyLike
+from .fragment_cache import bump_post_versions
+
+
+# Counters are changed with "SET x = x + n" so concurrent writers never overwrite each other
+def record_new_reply(post_id, parent_reply_id=None):
+    db.session.execute(
+        update(Post).where(Post.id == post_id).values(reply_count=Post.reply_count + 1, version=Post.version + 1)
+    )
+    if parent_reply_id:
+        db.session.execute(
+            update(Reply).where(Reply.id == parent_reply_id).values(child_count=Reply.child_count + 1)
+        )
+
+
+def reply_subtree_ids(reply_id):
+    """Return the ids of a reply and all of its descendants, found with one recursive query."""
+    subtree = select(Reply.id).where(Reply.id == reply_id).cte('subtree', recursive=True)
+    subtree = subtree.union_all(select(Reply.id).where(Reply.parent_reply_id == subtree.c.id))
+    return db.session.scalars(select(subtree.c.id)).all()
+
+
+def delete_reply_subtree(reply):
+    """Delete a reply with its descendants and likes, and take them off the parents' counters."""
+    ids = reply_subtree_ids(reply.id)
+    db.session.execute(
+        update(Post).where(Post.id == reply.post_id).values(reply_count=Post.reply_count - len(ids),
+                                                            version=Post.version + 1)
+    )
+    if reply.parent_reply_id:
+        db.session.execute(
+            update(Reply).where(Reply.id == reply.parent_reply_id).values(child_count=Reply.child_count - 1)
+        )
+    db.session.execute(
+        delete(ReplyLike).where(ReplyLike.reply_id.in_(ids)), execution_options={'synchronize_session': False}
+    )
+    db.session.execute(
+        delete(Reply).where(Reply.id.in_(ids)), execution_options={'synchronize_session': False}
+    )
+    db.session.expunge(reply)
+    return len(ids)
+
+
+def repair_reply_counts():
+    """Recompute every reply counter from the reply table. Returns the number of rows fixed."""
+    post_total = select(func.count(Reply.id)).where(Reply.post_id == Post.id).scalar_subquery()
+    fixed = db.session.execute(
+        update(Post).where(Post.reply_count.is_distinct_from(post_total))
+        .values(reply_count=post_total, version=Post.version + 1),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+
+    child = aliased(Reply)
+    child_total = select(func.count(child.id)).where(child.parent_reply_id == Reply.id).scalar_subquery()
+    bump_post_versions(Post.id.in_(select(Reply.post_id).where(Reply.child_count.is_distinct_from(child_total))))
+    fixed += db.session.execute(
+        update(Reply).where(Reply.child_count.is_distinct_from(child_total)).values(child_count=child_total),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+
+    db.session.commit()
+    return fixed
+
+
+def repair_like_counts():
+    """Recompute like_count on posts and replies from the like tables. Returns the number of rows fixed."""
+    fixed = 0
+    for target_model, like_model, target_column in ((Post, PostLike, PostLike.post_id),
+                                                     (Reply, ReplyLike, ReplyLike.reply_id)):
+        total = select(func.count(like_model.id)).where(target_column == target_model.id).scalar_subquery()
+        changes = {'like_count': total}
+        if target_model is Post:
+            changes['version'] = Post.version + 1
+        else:
+            bump_post_versions(Post.id.in_(select(Reply.post_id).where(Reply.like_count.is_distinct_from(total))))
+        fixed += db.session.execute(
+            update(target_model).where(target_model.like_count.is_distinct_from(total)).values(**changes),
+            execution_options={'synchronize_session': False}
+        ).rowcount
+
+    db.session.commit()
+    return fixed
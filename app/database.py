@@ -0,0 +1,123 @@
+import logging
+import os
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+from .config import DEVELOPMENT_SECRET_KEY
+from .models import db
+from .replicas import init_replicas
+
+logger = logging.getLogger(__name__)
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database, under any set explicitly."""
+    options = {}
+    if make_url(config['SQLALCHEMY_DATABASE_URI']).get_backend_name() == 'postgresql':
+        options.update(
+            pool_size=config['DB_POOL_SIZE'],
+            max_overflow=config['DB_MAX_OVERFLOW'],
+            pool_timeout=config['DB_POOL_TIMEOUT'],
+            pool_recycle=config['DB_POOL_RECYCLE'],
+            pool_pre_ping=config['DB_POOL_PRE_PING'],
+        )
+    options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    return options
+
+
+def _set_pragmas(pragmas):
+    # busy_timeout goes first so that switching to WAL waits out other connections' locks
+    statements = [f'PRAGMA {name}={value}' for name, value in
+                  sorted(pragmas.items(), key=lambda item: item[0] != 'busy_timeout')]
+
+    def connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+    return connect
+
+
+def database_settings(engine, dbapi_connection, pragmas):
+    """The settings a connection actually runs with, as (name, value) pairs."""
+    pool = engine.pool
+    settings = [('database', engine.url.render_as_string(hide_password=True)), ('pool', type(pool).__name__)]
+    if hasattr(pool, 'size'):
+        settings += [('pool_size', pool.size()), ('max_overflow', pool._max_overflow),
+                     ('pool_timeout', pool.timeout()), ('pool_recycle', pool._recycle),
+                     ('pool_pre_ping', pool._pre_ping)]
+    cursor = dbapi_connection.cursor()
+    try:
+        if engine.dialect.name == 'sqlite':
+            for name in pragmas:
+                cursor.execute(f'PRAGMA {name}')
+                settings.append((name, cursor.fetchone()[0]))
+        else:
+            cursor.execute('SELECT version()')
+            settings.append(('server', cursor.fetchone()[0]))
+    finally:
+        cursor.close()
+    return settings
+
+
+def check_settings(app, engine, settings):
+    """Warnings about a configuration that is unfit to serve real traffic."""
+    warnings = []
+    if app.config['SECRET_KEY'] == DEVELOPMENT_SECRET_KEY and not (app.debug or app.testing):
+        warnings.append('SECRET_KEY is the development default; set the SECRET_KEY environment variable.')
+    values = dict(settings)
+    if engine.dialect.name == 'sqlite' and engine.url.database not in (None, '', ':memory:'):
+        wanted = app.config['SQLITE_PRAGMAS'].get('journal_mode', '').lower()
+        if wanted and str(values.get('journal_mode')).lower() != wanted:
+            warnings.append(f"SQLite journal_mode is {values.get('journal_mode')}, not {wanted} "
+                            '(the file system may not support it).')
+    return warnings
+
+
+def self_check(app):
+    """Connect and return (settings, warnings) for the app's database and its replicas."""
+    engine = db.engine
+    with engine.connect() as connection:
+        settings = database_settings(engine, connection.connection.dbapi_connection, app.config['SQLITE_PRAGMAS'])
+    warnings = check_settings(app, engine, settings)
+    replicas = app.extensions['replicas'].engines if 'replicas' in app.extensions else []
+    for number, replica in enumerate(replicas, 1):
+        try:
+            replica.connect().close()
+            settings.append((f'replica {number}', replica.url.render_as_string(hide_password=True)))
+        except DBAPIError as error:
+            settings.append((f'replica {number}', 'unavailable'))
+            warnings.append(f'Replica {number} is unavailable: {error}')
+    return settings, warnings
+
+
+def init_migrate(app):
+    if 'migrate' not in app.extensions:
+        from flask_migrate import Migrate
+        Migrate(app, db, directory=os.path.join(os.path.dirname(app.root_path), 'migrations'))
+
+
+def init_database(app):
+    replicas = [create_engine(url, **engine_options(dict(app.config, SQLALCHEMY_DATABASE_URI=url)))
+                for url in app.config['DB_REPLICAS']]
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    db.init_app(app)
+
+    with app.app_context():
+        engine = db.engine
+    pragmas = app.config['SQLITE_PRAGMAS']
+    for each in [engine, *replicas]:
+        if each.dialect.name == 'sqlite' and pragmas:
+            event.listen(each, 'connect', _set_pragmas(pragmas))
+
+    # Report what the first connection ended up with
+    def report(dbapi_connection, connection_record):
+        settings = database_settings(engine, dbapi_connection, pragmas if engine.dialect.name == 'sqlite' else ())
+        logger.info('Database settings: %s', ', '.join(f'{name}={value}' for name, value in settings))
+        for warning in check_settings(app, engine, settings):
+            logger.warning(warning)
+    event.listen(engine, 'connect', report, once=True)
+
+    init_replicas(app, replicas)
@@ -3,14 +3,14 @@ import os
 from faker import Faker
 from datetime import datetime
 from werkzeug.utils import secure_filename
-import shutil
 from werkzeug.security import generate_password_hash
-import uuid
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from app.models import db, User, Post, Task, Reply, PostLike, ReplyLike, Activity, WaitingList
 from app import create_app
+from app.counters import repair_reply_counts, repair_like_counts
+from app.uploads import UploadStore
 
 PET_FOLDER = os.path.join(os.path.dirname(__file__), 'static', 'image', 'sample')
 UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'static', 'image', 'uploads')
@@ -73,6 +73,7 @@ def generate_posts(users, source_image_folder, upload_folder):
 
     if not image_files:
         raise ValueError("No valid image files found in the source image folder.")
+    store = UploadStore(upload_folder, None)
 
     for i in range(1, 61):  # Creating posts
         title = faker.sentence(nb_words=6)
@@ -83,15 +84,9 @@ def generate_posts(users, source_image_folder, upload_folder):
         created_at = faker.date_time_this_year()
         like_count = faker.random_int(min=0, max=100)
         
-        # Select a random image from the source folder
+        # Select a random image from the source folder; each sample is stored only once
         selected_image = faker.random_element(elements=image_files)
-        original_filename = secure_filename(selected_image)
-        file_ext = original_filename.rsplit('.', 1)[1].lower()
-        new_filename = f"{uuid.uuid4()}.{file_ext}"
-        image_path = os.path.join(upload_folder, new_filename)
-        
-        # Copy the image to the upload folder with the new name
-        shutil.copy(os.path.join(source_image_folder, selected_image), image_path)
+        new_filename = store.add_file(os.path.join(source_image_folder, secure_filename(selected_image)))
 
         post = Post(
             title=title,
@@ -141,53 +136,6 @@ def generate_waiting_list_entries(users, tasks):
     db.session.commit()
     return waiting_list_entries
 
-def generate_replies(users, posts, n=600):
-    replies = []
-
-    # Generate base replies without parents
-    for _ in range(int(n * 0.7)):  # 70% base replies
-        post_id = faker.random_element(elements=posts).id
-        reply_by = faker.random_element(elements=users).id
-        content = faker.paragraph(nb_sentences=3)
-        post_at = faker.date_time_this_year()
-        like_count = faker.random_int(min=0, max=100)
-
-        reply = Reply(
-            post_id=post_id,
-            reply_by=reply_by,
-            content=content,
-            post_at=post_at,
-            like_count=like_count
-        )
-        replies.append(reply)
-        db.session.add(reply)
-
-    db.session.commit()
-
-    # Generate child replies
-    for _ in range(int(n * 0.3)):  # 30% child replies
-        parent_reply = faker.random_element(elements=replies)
-        post_id = parent_reply.post_id
-        reply_by = faker.random_element(elements=users).id
-        content = faker.paragraph(nb_sentences=3)
-        post_at = faker.date_time_this_year()
-        like_count = faker.random_int(min=0, max=100)
-
-        child_reply = Reply(
-            post_id=post_id,
-            reply_by=reply_by,
-            parent_reply_id=parent_reply.id,
-            content=content,
-            post_at=post_at,
-            like_count=like_count
-        )
-        replies.append(child_reply)
-        db.session.add(child_reply)
-
-    db.session.commit()
-
-    return replies
-
 def generate_replies(users, posts, n=500):
     replies = []
 
@@ -306,7 +254,9 @@ if __name__ == '__main__':
     tasks = generate_tasks(posts)
     generate_waiting_list_entries(users, tasks)
     replies = generate_replies(users, posts, n=500)
+    repair_reply_counts()
     generate_post_likes(users, posts)
     generate_reply_likes(users, replies)
+    repair_like_counts()
     generate_activities(users)
     print('Test data generated successfully!')
@@ -0,0 +1,191 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from markupsafe import Markup
+from sqlalchemy import or_, select, update
+from .models import db, Post, Reply
+
+
+class MemoryFragmentBackend:
+    """Per-process LRU holding at most `max_bytes` of rendered HTML."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SqliteFragmentBackend:
+    """Cache in an SQLite file, shared by every worker process on the host.
+
+    Entries are dropped oldest-first once they add up to more than `max_bytes`.
+    """
+    PRUNE_EVERY = 100
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._sets = 0
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS fragment '
+                               '(key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, stored_at REAL NOT NULL)')
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def get(self, key):
+        row = self._connection().execute('SELECT value FROM fragment WHERE key = ?', (repr(key),)).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def set(self, key, value, size):
+        connection = self._connection()
+        connection.execute('INSERT OR REPLACE INTO fragment (key, value, size, stored_at) VALUES (?, ?, ?, ?)',
+                           (repr(key), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), size, time.time()))
+        self._sets += 1
+        if self._sets % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self):
+        # Walk entries newest first and drop everything past the byte budget
+        self._connection().execute(
+            'DELETE FROM fragment WHERE key IN (SELECT key FROM (SELECT key, SUM(size) OVER '
+            '(ORDER BY stored_at DESC) AS running FROM fragment) WHERE running > ?)', (self.max_bytes,)
+        )
+
+    def clear(self):
+        self._connection().execute('DELETE FROM fragment')
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM fragment').fetchone()[0]
+
+
+class NullFragmentBackend:
+    def get(self, key):
+        return None
+
+    def set(self, key, value, size):
+        pass
+
+    def clear(self):
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class FragmentCache:
+    """Rendered HTML fragments keyed by (kind, post_id, post.version, ...).
+
+    A post's version is bumped in the same UPDATE that changes what its card or
+    replies show, so a stale entry is never looked up again and just ages out.
+    Fragments must not contain anything that depends on the viewer.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.metrics = {'hits': 0, 'misses': 0}
+
+    def fetch(self, key, render):
+        """Return the fragment stored under `key`, rendering and storing it with `render()` on a miss."""
+        value = self.backend.get(key)
+        if value is not None:
+            self.metrics['hits'] += 1
+            return value
+        self.metrics['misses'] += 1
+        value = render()
+        self.backend.set(key, value, _size(value))
+        return value
+
+    def stats(self):
+        requests = self.metrics['hits'] + self.metrics['misses']
+        return dict(self.metrics, entries=len(self.backend),
+                    hit_rate=round(self.metrics['hits'] / requests, 3) if requests else None)
+
+    def clear(self):
+        self.backend.clear()
+
+
+def _size(value):
+    # Close enough to the byte count for mostly-ASCII HTML, and much cheaper than encoding it
+    if isinstance(value, str):
+        return len(value)
+    return sum(len(part) for part in value if isinstance(part, str))
+
+
+def create_fragment_backend(config):
+    name = config['FRAGMENT_CACHE_BACKEND']
+    if name == 'memory':
+        return MemoryFragmentBackend(config['FRAGMENT_CACHE_MAX_BYTES'])
+    if name == 'sqlite':
+        return SqliteFragmentBackend(config['FRAGMENT_CACHE_PATH'], config['FRAGMENT_CACHE_MAX_BYTES'])
+    if name == 'none':
+        return NullFragmentBackend()
+    raise ValueError(f'Unknown fragment cache backend: {name}')
+
+
+def fragment_cache():
+    return current_app.extensions['fragment_cache']
+
+
+def cache_fragment(*key, caller):
+    """Template helper: {% call cache_fragment('post_card', post.id, post.version) %}...{% endcall %}"""
+    return Markup(fragment_cache().fetch(key, caller))
+
+
+def bump_post_versions(*criteria):
+    """Invalidate the cached fragments of the posts matching `criteria`."""
+    db.session.execute(
+        update(Post).where(*criteria).values(version=Post.version + 1),
+        execution_options={'synchronize_session': False}
+    )
+
+
+def invalidate_author(user_id):
+    # Cards and reply threads show their authors' names and avatars
+    replied = select(Reply.post_id).where(Reply.reply_by == user_id)
+    bump_post_versions(or_(Post.created_by == user_id, Post.id.in_(replied)))
+
+
+def init_fragment_cache(app):
+    app.extensions['fragment_cache'] = FragmentCache(create_fragment_backend(app.config))
+    app.add_template_global(cache_fragment)
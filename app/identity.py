@@ -0,0 +1,118 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from flask_login import current_user
+from sqlalchemy import event, select
+from .models import db, User
+
+CHANGES_KEY = 'identity_changed_users'
+
+
+class UserPrincipal:
+    """The logged-in user as templates and most routes see it: a few columns and no ORM state.
+
+    Principals are shared between requests through the UserCache, so they are never changed
+    in place. A route that updates the user, or needs another column, loads the row with
+    user_record().
+    """
+    __slots__ = ('id', 'username', 'user_image', 'pet_type', 'notifications_seen_at')
+
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+
+    def __init__(self, id, username, user_image, pet_type, notifications_seen_at):
+        self.id = id
+        self.username = username
+        self.user_image = user_image
+        self.pet_type = pet_type
+        self.notifications_seen_at = notifications_seen_at
+
+    def get_id(self):
+        return str(self.id)
+
+    def __eq__(self, other):
+        return isinstance(other, UserPrincipal) and self.id == other.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class UserCache:
+    """Per-process cache of user principals, so an authenticated request needs no user query.
+
+    A principal is trusted for USER_CACHE_TTL seconds. Commits in this process that change or
+    delete a user drop their entry straight away; other workers' changes show up once it expires.
+    """
+
+    def __init__(self, ttl, max_users=10000):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._principals = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._principals.get(user_id)
+            if entry is not None and entry[1] > time.monotonic():
+                self._principals.move_to_end(user_id)
+                return entry[0]
+        row = db.session.execute(select(User.id, User.username, User.user_image, User.pet_type,
+                                        User.notifications_seen_at).where(User.id == user_id)).first()
+        if row is None:
+            return None
+        principal = UserPrincipal(*row)
+        with self._lock:
+            self._principals.pop(user_id, None)
+            self._principals[user_id] = (principal, time.monotonic() + self.ttl)
+            if len(self._principals) > self.max_users:
+                self._principals.popitem(last=False)
+        return principal
+
+    def forget(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._principals.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._principals.clear()
+
+
+def user_cache():
+    return current_app.extensions['user_cache']
+
+
+def user_record():
+    """The logged-in user's ORM row, for routes that change it or read columns the principal lacks."""
+    return db.session.get(User, current_user.id)
+
+
+def _collect_changes(session, flush_context):
+    changed = [obj.id for obj in (*session.dirty, *session.deleted) if isinstance(obj, User)]
+    if changed:
+        session.info.setdefault(CHANGES_KEY, set()).update(changed)
+
+
+def _forget_changed(session):
+    changed = session.info.pop(CHANGES_KEY, None)
+    cache = current_app.extensions.get('user_cache')
+    if changed and cache is not None:
+        cache.forget(changed)
+
+
+def _discard_changes(session):
+    session.info.pop(CHANGES_KEY, None)
+
+
+def init_identity(app, login_manager):
+    app.extensions['user_cache'] = UserCache(app.config['USER_CACHE_TTL'], app.config['USER_CACHE_SIZE'])
+    if not event.contains(db.session, 'after_flush', _collect_changes):
+        event.listen(db.session, 'after_flush', _collect_changes)
+        event.listen(db.session, 'after_commit', _forget_changed)
+        event.listen(db.session, 'after_rollback', _discard_changes)
+
+    @login_manager.user_loader
+    def load_user(user_id):
+        return user_cache().get(int(user_id))
@@ -0,0 +1,254 @@
+import atexit
+import logging
+import multiprocessing
+import os
+import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+from flask import current_app
+from sqlalchemy import delete, event, or_, select, update
+from .models import db, Post, ImageJob
+from .images import Image, ImageOps, DerivativeStore
+from .uploads import upload_store
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = 'pending_image_jobs'
+
+
+def process_image(source, upload_folder, image_name, cache_folder, widths, formats, quality):
+    """Move an incoming upload into `upload_folder` without its metadata, then make its derivatives.
+
+    Runs in a worker process. EXIF (location, camera serials...) is dropped by re-encoding
+    with the orientation applied to the pixels; GIFs have no EXIF and are moved as they are.
+    """
+    destination = os.path.join(upload_folder, image_name)
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    if Image is None:
+        shutil.move(source, destination)
+        return
+    with Image.open(source) as image:
+        if image.format == 'GIF':
+            image = None
+        else:
+            fmt, icc_profile = image.format, image.info.get('icc_profile')
+            image = ImageOps.exif_transpose(image)
+    if image is None:
+        shutil.move(source, destination)
+    else:
+        options = {'quality': 90, 'optimize': True} if fmt == 'JPEG' else {}
+        if fmt == 'JPEG' and image.mode not in ('RGB', 'L', 'CMYK'):
+            image = image.convert('RGB')
+        temporary = f'{destination}.{os.getpid()}.tmp'
+        image.save(temporary, fmt, icc_profile=icc_profile, **options)
+        os.replace(temporary, destination)
+        os.remove(source)
+
+    store = DerivativeStore(upload_folder, cache_folder, quality)
+    for width in widths:
+        for fmt in formats:
+            store.get(image_name, width, fmt)
+
+
+class ImageJobQueue:
+    """Processes uploaded images in a pool of worker processes.
+
+    post_create streams the upload into IMAGE_INCOMING_FOLDER and adds an ImageJob
+    row in its own transaction; once that commits the job is handed to the pool.
+    Jobs are claimed with a conditional UPDATE, so a job left 'pending' or stuck
+    'running' for IMAGE_JOB_TIMEOUT seconds (its process died) is picked up again
+    by whichever web process next calls resume(). When a job finishes the post's
+    image_state becomes 'ready' and its version is bumped so cached cards redraw.
+    With IMAGE_JOBS_ASYNC off jobs run in the committing thread, as the tests do,
+    and leftovers are only resumed by `flask image-jobs`.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.asynchronous = app.config['IMAGE_JOBS_ASYNC']
+        self.workers = app.config['IMAGE_WORKERS']
+        self.max_attempts = app.config['IMAGE_JOB_ATTEMPTS']
+        self.timeout = timedelta(seconds=app.config['IMAGE_JOB_TIMEOUT'])
+        self.incoming_folder = app.config['IMAGE_INCOMING_FOLDER']
+        self._executor = None
+        self._executor_pid = None
+        self._futures = set()
+        self._resumed_pid = None
+        self._lock = threading.Lock()
+        self._done = threading.Condition()
+
+    def submit(self, job_ids):
+        for job_id in job_ids:
+            job = self._claim(job_id)
+            if job is None:
+                continue  # Already taken by another process
+            arguments = self._arguments(job)
+            if not self.asynchronous:
+                try:
+                    process_image(*arguments)
+                except Exception as error:
+                    self._failed(job, error)
+                else:
+                    self._succeeded(job)
+                continue
+            future = self._ensure_executor().submit(process_image, *arguments)
+            with self._done:
+                self._futures.add(future)
+            future.add_done_callback(partial(self._finished, job))
+
+    def start(self):
+        # Runs before each request; the first one in each process resumes leftover jobs off the request thread
+        if self._resumed_pid == os.getpid() or not self.asynchronous:
+            return
+        self._resumed_pid = os.getpid()
+        threading.Thread(target=self.resume, name='image-jobs-resume', daemon=True).start()
+
+    def resume(self):
+        """Submit the jobs left over from earlier runs and return how many there were."""
+        with self.app.app_context():
+            stale = datetime.utcnow() - self.timeout
+            job_ids = db.session.scalars(select(ImageJob.id).where(or_(
+                ImageJob.status == 'pending',
+                (ImageJob.status == 'running') & (ImageJob.started_at < stale)
+            ))).all()
+            db.session.remove()
+        if job_ids:
+            logger.info('Resuming %d image job(s)', len(job_ids))
+            self.submit(job_ids)
+        return len(job_ids)
+
+    def drain(self, timeout=None):
+        """Wait for the jobs submitted by this process to finish and be recorded."""
+        with self._done:
+            self._done.wait_for(lambda: not self._futures, timeout)
+
+    def shutdown(self):
+        # Queued jobs stay 'running' in the database and are retried after IMAGE_JOB_TIMEOUT
+        executor = self._executor
+        if executor is not None and self._executor_pid == os.getpid():
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _ensure_executor(self):
+        if self._executor is not None and self._executor_pid == os.getpid():
+            return self._executor
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                # Spawned rather than forked, as the web process has threads and open connections
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+                self._executor_pid = os.getpid()
+                atexit.register(self.shutdown)
+        return self._executor
+
+    def _arguments(self, job):
+        config = self.app.config
+        widths = sorted({size for sizes in config['IMAGE_WIDTHS'].values() for size in sizes})
+        return (os.path.join(self.incoming_folder, job.source), config['UPLOAD_FOLDER'], job.image_name,
+                config['IMAGE_CACHE_FOLDER'], widths, self.app.extensions['image_formats'], config['IMAGE_QUALITY'])
+
+    def _claim(self, job_id):
+        stale = datetime.utcnow() - self.timeout
+        with self.app.app_context(), db.engine.begin() as connection:
+            claimed = connection.execute(
+                update(ImageJob)
+                .where(ImageJob.id == job_id, or_(ImageJob.status == 'pending',
+                                                  (ImageJob.status == 'running') & (ImageJob.started_at < stale)))
+                .values(status='running', started_at=datetime.utcnow(), attempts=ImageJob.attempts + 1)
+            ).rowcount
+            if not claimed:
+                return None
+            return connection.execute(
+                select(ImageJob.id, ImageJob.post_id, ImageJob.source, ImageJob.attempts, Post.image_name)
+                .join(Post, Post.id == ImageJob.post_id)
+                .where(ImageJob.id == job_id)
+            ).one_or_none()
+
+    def _finished(self, job, future):
+        try:
+            if future.cancelled():
+                return
+            error = future.exception()
+            if error is None:
+                self._succeeded(job)
+            else:
+                self._failed(job, error)
+        finally:
+            with self._done:
+                self._futures.discard(future)
+                self._done.notify_all()
+
+    def _succeeded(self, job):
+        with self.app.app_context(), db.engine.begin() as connection:
+            deleted = not connection.execute(delete(ImageJob).where(ImageJob.id == job.id)).rowcount
+            connection.execute(update(Post).where(Post.id == job.post_id)
+                               .values(image_state='ready', version=Post.version + 1))
+        if deleted:
+            # The post was deleted while its image was being processed
+            with self.app.app_context():
+                upload_store().release([job.image_name])
+                db.session.remove()
+
+    def _failed(self, job, error):
+        logger.error('Image job %d for post %d failed (attempt %d): %s', job.id, job.post_id, job.attempts, error)
+        retry = job.attempts < self.max_attempts and os.path.exists(os.path.join(self.incoming_folder, job.source))
+        with self.app.app_context(), db.engine.begin() as connection:
+            connection.execute(update(ImageJob).where(ImageJob.id == job.id)
+                               .values(status='pending' if retry else 'failed', error=str(error)))
+            if not retry:
+                connection.execute(update(Post).where(Post.id == job.post_id)
+                                   .values(image_state='failed', version=Post.version + 1))
+        if retry:
+            self.submit([job.id])
+        else:
+            _remove(os.path.join(self.incoming_folder, job.source))
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def image_job_queue():
+    return current_app.extensions['image_jobs']
+
+
+def enqueue_image(post, file, extension):
+    """Attach an uploaded image to a new post; it is processed once the transaction commits."""
+    store = upload_store()
+    post.image_name, path = store.receive(file.stream, extension)
+    if store.exists(post.image_name):
+        os.remove(path)  # The same file was uploaded and processed before
+        return
+    post.image_state = 'pending'
+    job = ImageJob(source=os.path.basename(path))
+    post.image_jobs.append(job)
+    db.session.flush()
+    db.session.info.setdefault(PENDING_KEY, []).append((job.id, path))
+
+
+def discard_image_jobs(post):
+    """Drop the incoming files of a post's unprocessed images, before the post is deleted."""
+    for job in post.image_jobs:
+        _remove(os.path.join(image_job_queue().incoming_folder, job.source))
+
+
+def _submit_pending(session):
+    pending = session.info.pop(PENDING_KEY, None)
+    if pending:
+        image_job_queue().submit([job_id for job_id, _ in pending])
+
+
+def _discard_pending(session):
+    for _, path in session.info.pop(PENDING_KEY, ()):
+        _remove(path)
+
+
+def init_image_jobs(app):
+    queue = app.extensions['image_jobs'] = ImageJobQueue(app)
+    app.before_request(queue.start)
+    if not event.contains(db.session, 'after_commit', _submit_pending):
+        event.listen(db.session, 'after_commit', _submit_pending)
+        event.listen(db.session, 'after_rollback', _discard_pending)
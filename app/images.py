@@ -0,0 +1,141 @@
+import hashlib
+import os
+import threading
+from flask import current_app, url_for
+from werkzeug.security import safe_join
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # Without Pillow, pages show the original uploads
+    Image = ImageOps = features = None
+
+# Pillow's encoder names, the MIME type browsers are told, and the file extension
+FORMATS = {
+    'avif': ('AVIF', 'image/avif', 'avif'),
+    'webp': ('WEBP', 'image/webp', 'webp'),
+    'jpeg': ('JPEG', 'image/jpeg', 'jpg'),
+}
+CHUNK_SIZE = 1024 * 1024
+
+
+def writable_formats(names):
+    """The formats in `names` that this Pillow build can write, in the same order."""
+    if Image is None:
+        return ()
+    return tuple(name for name in names if name == 'jpeg' or features.check(name))
+
+
+def available_formats():
+    return current_app.extensions['image_formats']
+
+
+class DerivativeStore:
+    """Resized copies of uploaded images, generated on first request.
+
+    A derivative is named after a hash of the source file's contents and the
+    (width, format, quality) it was made with, so byte-identical uploads share
+    their derivatives and changing the settings never serves a stale file.
+    Files go under `folder` in two-character shards.
+    """
+
+    def __init__(self, upload_folder, folder, quality):
+        # quality maps each format to its encoder quality
+        self.upload_folder = upload_folder
+        self.folder = folder
+        self.quality = quality
+        self._digests = {}
+        # Striped locks, so concurrent requests for one derivative make it once
+        self._locks = [threading.Lock() for _ in range(64)]
+
+    def source_path(self, image_name):
+        path = safe_join(self.upload_folder, image_name)
+        return path if path and os.path.isfile(path) else None
+
+    def source_digest(self, path):
+        # Uploads are never rewritten in place, but keying on size and mtime keeps this honest
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        digest = self._digests.get(key)
+        if digest is None:
+            sha = hashlib.sha256()
+            with open(path, 'rb') as source:
+                for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                    sha.update(chunk)
+            digest = self._digests[key] = sha.hexdigest()
+        return digest
+
+    def derivative_path(self, digest, width, fmt):
+        name = hashlib.sha256(f'{digest}:{width}:{fmt}:{self.quality[fmt]}'.encode()).hexdigest()
+        return os.path.join(self.folder, name[:2], f'{name}.{FORMATS[fmt][2]}')
+
+    def get(self, image_name, width, fmt):
+        """Path of the `fmt` derivative of an upload at `width` pixels wide, made if missing.
+
+        Returns None when the upload does not exist.
+        """
+        source = self.source_path(image_name)
+        if source is None:
+            return None
+        path = self.derivative_path(self.source_digest(source), width, fmt)
+        if not os.path.exists(path):
+            with self._locks[hash(path) % len(self._locks)]:
+                if not os.path.exists(path):
+                    self.render(source, path, width, fmt)
+        return path
+
+    def render(self, source, path, width, fmt):
+        with Image.open(source) as image:
+            # JPEGs can decode straight at a fraction of their size, much faster than a full decode.
+            # Both sides stay at least `width` so the result is wide enough whichever way it is rotated.
+            image.draft('RGB', (width, width))
+            image = ImageOps.exif_transpose(image)
+            if image.width > width:
+                image = image.resize((width, round(image.height * width / image.width)), Image.Resampling.LANCZOS,
+                                     reducing_gap=3.0)
+            image = _flatten(image)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            image.save(temporary, FORMATS[fmt][0], quality=self.quality[fmt], optimize=fmt == 'jpeg')
+        os.replace(temporary, path)
+
+
+def _flatten(image):
+    # Derivatives are opaque; transparency is composited onto white as JPEG cannot carry it
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def derivative_store():
+    return current_app.extensions['image_derivatives']
+
+
+def image_sources(image_name, kind):
+    """Template helper: srcsets for an upload shown as `kind` (a key of IMAGE_WIDTHS).
+
+    Returns {'sources': [(mime type, srcset), ...], 'src': fallback url, 'srcset': fallback srcset},
+    or None when derivatives are unavailable and the original should be shown.
+    """
+    formats = available_formats()
+    if not formats:
+        return None
+    widths = current_app.config['IMAGE_WIDTHS'][kind]
+
+    def srcset(fmt):
+        return ', '.join(f'{url_for("image_derivative", image_name=image_name, width=width, fmt=fmt)} {width}w'
+                         for width in widths)
+    return {
+        'sources': [(FORMATS[fmt][1], srcset(fmt)) for fmt in formats[:-1]],
+        'src': url_for('image_derivative', image_name=image_name, width=widths[0], fmt=formats[-1]),
+        'srcset': srcset(formats[-1]),
+    }
+
+
+def init_images(app):
+    app.extensions['image_formats'] = writable_formats(app.config['IMAGE_FORMATS'])
+    app.extensions['image_derivatives'] = DerivativeStore(
+        app.config['UPLOAD_FOLDER'], app.config['IMAGE_CACHE_FOLDER'], app.config['IMAGE_QUALITY'])
+    app.add_template_global(image_sources)
@@ -0,0 +1,316 @@
+import atexit
+import bisect
+import heapq
+import logging
+import math
+import os
+import pickle
+import re
+import sys
+import threading
+import time
+from array import array
+from collections import Counter
+from flask import current_app
+from sqlalchemy import event, or_, select
+from .models import db, User, Post
+from .queries import post_list_query
+from .search import SearchBackend, parse_query, term_snippet
+
+logger = logging.getLogger(__name__)
+
+CHANGES_KEY = 'search_index_changes'
+SNAPSHOT_VERSION = 1
+MAX_WEIGHT = 0xFFFF
+
+
+def tokenize(text):
+    return re.findall(r'\w+', text.lower()) if text else []
+
+
+class InvertedIndex:
+    """In-memory term -> posts index.
+
+    Each term has a posting list of post ids (ascending, array('I')) and a parallel
+    array('H') of field-weighted term frequencies. A sorted term list gives prefix
+    lookups, and each post's terms are kept so it can be removed or re-indexed.
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self.weights = {}
+        self.doc_terms = {}
+        self.max_id = 0
+        self._terms = []
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.doc_terms)
+
+    def add(self, post_id, title, content, username):
+        counts = Counter()
+        # A word in the title counts most, then the author's name, then the body (as in the FTS5 ranking)
+        for text, weight in ((title, 10), (username, 5), (content, 1)):
+            for term in tokenize(text):
+                counts[term] += weight
+
+        with self._lock:
+            self._remove(post_id)
+            for term, weight in counts.items():
+                ids = self.postings.get(term)
+                if ids is None:
+                    term = sys.intern(term)
+                    ids = self.postings[term] = array('I')
+                    self.weights[term] = array('H')
+                    if self._terms is not None:
+                        bisect.insort(self._terms, term)
+                # Posts mostly arrive in id order, so this is usually an append
+                position = len(ids) if not ids or ids[-1] < post_id else bisect.bisect_left(ids, post_id)
+                ids.insert(position, post_id)
+                self.weights[term].insert(position, min(weight, MAX_WEIGHT))
+            self.doc_terms[post_id] = tuple(sys.intern(term) for term in counts)
+            self.max_id = max(self.max_id, post_id)
+
+    def remove(self, post_id):
+        with self._lock:
+            self._remove(post_id)
+
+    def _remove(self, post_id):
+        for term in self.doc_terms.pop(post_id, ()):
+            ids = self.postings[term]
+            position = bisect.bisect_left(ids, post_id)
+            del ids[position]
+            del self.weights[term][position]
+            if not ids:
+                del self.postings[term], self.weights[term]
+                if self._terms is not None:
+                    del self._terms[bisect.bisect_left(self._terms, term)]
+
+    def bulk_load(self, rows):
+        """Index (id, title, content, username) rows; the sorted term list is rebuilt once at the end."""
+        with self._lock:
+            self._terms = None
+            for row in rows:
+                self.add(*row)
+            self._terms = sorted(self.postings)
+
+    def expand(self, prefix):
+        """All indexed terms starting with `prefix`."""
+        start = bisect.bisect_left(self._terms, prefix)
+        end = bisect.bisect_left(self._terms, prefix + '\U0010ffff')
+        return self._terms[start:end]
+
+    def search(self, groups, k):
+        """Top `k` (post_id, score) pairs for OR'ed groups of AND'ed prefix terms, best first."""
+        with self._lock:
+            scores = {}
+            for group in groups:
+                for post_id, score in self._match_all(group).items():
+                    scores[post_id] = scores.get(post_id, 0) + score
+            return heapq.nlargest(k, scores.items(), key=lambda item: (item[1], item[0]))
+
+    def _match_all(self, group):
+        expanded = [self.expand(prefix) for prefix in group]
+        # Intersect starting from the rarest term so the candidate set stays small
+        expanded.sort(key=lambda terms: sum(len(self.postings[term]) for term in terms))
+        candidates = None
+        for terms in expanded:
+            candidates = self._term_scores(terms, candidates)
+            if not candidates:
+                return {}
+        return candidates
+
+    def _term_scores(self, terms, candidates):
+        total = len(self.doc_terms)
+        scores = {}
+        for term in terms:
+            ids, weights = self.postings[term], self.weights[term]
+            idf = math.log(1 + total / len(ids))
+            if candidates is not None and len(candidates) * 16 < len(ids):
+                # Few candidates against a long posting list: binary search instead of a scan
+                for post_id in candidates:
+                    position = bisect.bisect_left(ids, post_id)
+                    if position < len(ids) and ids[position] == post_id:
+                        scores[post_id] = scores.get(post_id, 0) + weights[position] * idf
+            else:
+                for post_id, weight in zip(ids, weights):
+                    if candidates is None or post_id in candidates:
+                        scores[post_id] = scores.get(post_id, 0) + weight * idf
+        if candidates is not None:
+            for post_id in scores:
+                scores[post_id] += candidates[post_id]
+        return scores
+
+    def save(self, path):
+        with self._lock:
+            state = {'version': SNAPSHOT_VERSION, 'max_id': self.max_id, 'postings': self.postings,
+                     'weights': self.weights, 'doc_terms': self.doc_terms}
+            temporary = f'{path}.{os.getpid()}.tmp'
+            with open(temporary, 'wb') as snapshot:
+                pickle.dump(state, snapshot, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        """Read a snapshot written by save(); returns None if it is missing or from another version."""
+        # Snapshots are only ever written by this app, next to its own database
+        try:
+            with open(path, 'rb') as snapshot:
+                state = pickle.load(snapshot)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        if not isinstance(state, dict) or state.get('version') != SNAPSHOT_VERSION:
+            return None
+        index = cls()
+        index.max_id = state['max_id']
+        index.postings, index.weights, index.doc_terms = state['postings'], state['weights'], state['doc_terms']
+        index._terms = sorted(index.postings)
+        return index
+
+
+def _post_rows(*criteria):
+    return (
+        select(Post.id, Post.title, Post.content, User.username)
+        .join(User, User.id == Post.created_by)
+        .where(*criteria)
+        .order_by(Post.id)
+    )
+
+
+class InvertedIndexBackend(SearchBackend):
+    """Searches an InvertedIndex held in this process.
+
+    The index is built (or loaded from SEARCH_INDEX_SNAPSHOT) on the first search and
+    then kept current from this process's commits. Posts created by other worker
+    processes are picked up every SEARCH_INDEX_REFRESH_INTERVAL seconds; posts they
+    delete are dropped when results are loaded. `flask search-index` rebuilds the
+    snapshot, which also picks up edits made elsewhere.
+    """
+    name = 'inverted_index'
+
+    def __init__(self, app):
+        self.app = app
+        self.snapshot_path = app.config['SEARCH_INDEX_SNAPSHOT']
+        self.refresh_interval = app.config['SEARCH_INDEX_REFRESH_INTERVAL']
+        self.index = None
+        self._refreshed_at = 0.0
+        self._dirty = False
+        self._lock = threading.Lock()
+        if not event.contains(db.session, 'after_flush', _collect_changes):
+            event.listen(db.session, 'after_flush', _collect_changes)
+            event.listen(db.session, 'after_commit', _apply_changes)
+            event.listen(db.session, 'after_rollback', _discard_changes)
+
+    def get_index(self):
+        if self.index is None:
+            with self._lock:
+                if self.index is None:
+                    index = InvertedIndex.load(self.snapshot_path) if self.snapshot_path else None
+                    if index is None:
+                        index = self.build()
+                        self._save(index)
+                    self.index = index
+                    self._refreshed_at = 0.0
+                    if self.snapshot_path:
+                        atexit.register(self.save)
+        return self.index
+
+    def build(self):
+        started = time.perf_counter()
+        index = InvertedIndex()
+        with db.engine.connect() as connection:
+            rows = connection.execution_options(yield_per=5000).execute(_post_rows())
+            index.bulk_load(rows)
+        logger.info('Built search index of %d posts in %.1fs', len(index), time.perf_counter() - started)
+        return index
+
+    def rebuild(self):
+        """Re-read every post and write a fresh snapshot."""
+        index = self.build()
+        self._save(index)
+        self.index = index
+        return index
+
+    def refresh(self):
+        """Index posts committed by other processes since the last refresh."""
+        index = self.get_index()
+        with db.engine.connect() as connection:
+            rows = connection.execute(_post_rows(Post.id > index.max_id)).all()
+        for row in rows:
+            index.add(*row)
+        self._dirty = self._dirty or bool(rows)
+        self._refreshed_at = time.monotonic()
+
+    def apply(self, post_ids, deleted_ids, user_ids):
+        if self.index is None:
+            return  # Nothing to update yet; the first search reads everything
+        for post_id in deleted_ids:
+            self.index.remove(post_id)
+        criteria = []
+        if post_ids:
+            criteria.append(Post.id.in_(post_ids))
+        if user_ids:
+            criteria.append(Post.created_by.in_(user_ids))
+        if criteria:
+            with db.engine.connect() as connection:
+                for row in connection.execute(_post_rows(or_(*criteria))):
+                    self.index.add(*row)
+        self._dirty = True
+
+    def save(self):
+        if self.index is not None and self._dirty:
+            self._save(self.index)
+
+    def _save(self, index):
+        if not self.snapshot_path:
+            return
+        try:
+            index.save(self.snapshot_path)
+            self._dirty = False
+        except OSError:
+            logger.exception('Failed to save the search index snapshot to %s', self.snapshot_path)
+
+    def search(self, query, limit, offset):
+        groups = parse_query(query)
+        if not groups:
+            return []
+        self.get_index()
+        if time.monotonic() - self._refreshed_at >= self.refresh_interval:
+            self.refresh()
+        hits = self.index.search(groups, offset + limit)[offset:]
+        if not hits:
+            return []
+
+        posts = {post.id: post for post in post_list_query().filter(Post.id.in_([post_id for post_id, _ in hits]))}
+        terms = [term for group in groups for term in group]
+        return [(posts[post_id], term_snippet(posts[post_id].content, terms))
+                for post_id, _ in hits if post_id in posts]
+
+
+def _collect_changes(session, flush_context):
+    changes = session.info.setdefault(CHANGES_KEY, (set(), set(), set()))
+    post_ids, deleted_ids, user_ids = changes
+    for obj in session.new:
+        if isinstance(obj, Post):
+            post_ids.add(obj.id)
+    for obj in session.dirty:
+        if isinstance(obj, Post) and any(db.inspect(obj).attrs[name].history.has_changes()
+                                         for name in ('title', 'content', 'created_by')):
+            post_ids.add(obj.id)
+        elif isinstance(obj, User) and db.inspect(obj).attrs.username.history.has_changes():
+            user_ids.add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, Post):
+            deleted_ids.add(obj.id)
+            post_ids.discard(obj.id)
+
+
+def _apply_changes(session):
+    changes = session.info.pop(CHANGES_KEY, None)
+    backend = current_app.extensions.get('search_backend')
+    if changes and isinstance(backend, InvertedIndexBackend):
+        backend.apply(*changes)
+
+
+def _discard_changes(session):
+    session.info.pop(CHANGES_KEY, None)
@@ -0,0 +1,40 @@
+from sqlalchemy import delete, func, insert, select, update
+from .models import db, Post, Reply, PostLike, ReplyLike
+from .fragment_cache import bump_post_versions
+
+
+def _toggle_like(like_model, target_column, target_model, user_id, target_id, **changes):
+    """Flip a user's like on a post or reply inside the current transaction.
+
+    The like row and the target's like_count change together and the count is updated
+    server-side, so concurrent toggles can't lose updates. The unique (user, target)
+    constraint rejects a duplicate like; callers retry the toggle on IntegrityError.
+    Returns (liked, like_count).
+    """
+    removed = db.session.execute(
+        delete(like_model).where(like_model.user_id == user_id, target_column == target_id),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    if not removed:
+        db.session.execute(insert(like_model).values({like_model.user_id: user_id, target_column: target_id}))
+
+    delta = -1 if removed else 1
+    like_count = db.session.execute(
+        update(target_model)
+        .where(target_model.id == target_id)
+        .values(like_count=func.coalesce(target_model.like_count, 0) + delta, **changes)
+        .returning(target_model.like_count),
+        execution_options={'synchronize_session': False}
+    ).scalar_one()
+    return not removed, like_count
+
+
+def toggle_post_like(user_id, post_id):
+    return _toggle_like(PostLike, PostLike.post_id, Post, user_id, post_id, version=Post.version + 1)
+
+
+def toggle_reply_like(user_id, reply_id):
+    result = _toggle_like(ReplyLike, ReplyLike.reply_id, Reply, user_id, reply_id)
+    # The count is shown in the post's cached reply thread
+    bump_post_versions(Post.id == select(Reply.post_id).where(Reply.id == reply_id).scalar_subquery())
+    return result
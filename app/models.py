@@ -1,11 +1,12 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 from sqlalchemy.orm import validates
 import re
+from .replicas import RoutingSession
+from .passwords import hash_password, verify_password
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 # User Model
 class User(db.Model, UserMixin):
@@ -19,6 +20,7 @@ class User(db.Model, UserMixin):
     join_at = db.Column(db.DateTime, default=datetime.utcnow)
     pet_type = db.Column(db.String(80), nullable=True)
     user_image = db.Column(db.String(255), nullable=True)
+    notifications_seen_at = db.Column(db.DateTime, nullable=True)
 
     @property
     def password(self):
@@ -26,10 +28,10 @@ class User(db.Model, UserMixin):
 
     @password.setter
     def password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
     
     @validates('email')
     def validate_email(self, key, email):
@@ -47,12 +49,27 @@ class Post(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     content = db.Column(db.Text, nullable=False)
     like_count = db.Column(db.Integer, default=0)
+    reply_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     image_name = db.Column(db.String(100), nullable=True)
+    # 'pending' while the uploaded image is processed (see image_jobs.py), then 'ready' or 'failed'
+    image_state = db.Column(db.String(10), nullable=False, default='ready', server_default='ready')
+    # Bumped whenever the post's rendered card or replies change; part of the fragment cache key
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     user = db.relationship('User', backref=db.backref('posts', lazy=True))
     replies = db.relationship('Reply', backref='post', cascade='all, delete-orphan', lazy=True)
     likes = db.relationship('PostLike', backref='post', cascade='all, delete-orphan', lazy=True)
-    waiting_list_entries = db.relationship('WaitingList', backref='task_post', lazy=True, primaryjoin="and_(Post.id == WaitingList.task_id, Post.is_task == True)")
+    image_jobs = db.relationship('ImageJob', backref='post', cascade='all, delete-orphan', lazy=True)
+    waiting_list_entries = db.relationship('WaitingList', backref='task_post', cascade='all, delete-orphan', lazy=True, primaryjoin="and_(Post.id == WaitingList.task_id, Post.is_task == True)")
+
+    # Serve the keyset-paginated home feed, with and without a category filter,
+    # the reference counts of shared upload files (see uploads.py) and an author's posts
+    __table_args__ = (
+        db.Index('ix_post_created_at_id', 'created_at', 'id'),
+        db.Index('ix_post_category_created_at_id', 'category', 'created_at', 'id'),
+        db.Index('ix_post_image_name', 'image_name'),
+        db.Index('ix_post_created_by', 'created_by'),
+    )
 
     @validates('content')
     def validate_content(self, key, content):
@@ -68,9 +85,10 @@ class Post(db.Model):
             raise ValueError("Title cannot exceed 200 characters")
         return title
 
+    # Kept in step with the reply table by app/counters.py
     @property
     def comment_count(self):
-        return len(self.replies)
+        return self.reply_count
 
 # Reply Model
 class Reply(db.Model):
@@ -81,22 +99,30 @@ class Reply(db.Model):
     content = db.Column(db.Text, nullable=False)
     post_at = db.Column(db.DateTime, default=datetime.utcnow)
     like_count = db.Column(db.Integer, default=0)
+    child_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     user = db.relationship('User', backref=db.backref('replies', lazy=True))
     parent_reply = db.relationship('Reply', remote_side=[id], backref=db.backref('child_replies', cascade='all, delete-orphan', lazy=True))
     likes = db.relationship('ReplyLike', backref='reply', cascade='all, delete-orphan', lazy=True)
 
+    # Serve the keyset-paginated threads: a post's top-level replies, a reply's children, an author's replies
+    __table_args__ = (
+        db.Index('ix_reply_post_id_parent_reply_id_post_at', 'post_id', 'parent_reply_id', 'post_at', 'id'),
+        db.Index('ix_reply_parent_reply_id_post_at', 'parent_reply_id', 'post_at', 'id'),
+        db.Index('ix_reply_reply_by', 'reply_by'),
+    )
+
     @property
     def comment_count(self):
-        return len(self.child_replies)
+        return self.child_count
 
 # Task Model
 class Task(db.Model):
     id = db.Column(db.Integer, db.ForeignKey('post.id'), primary_key=True)
     status = db.Column(db.Boolean, nullable=False, default=True)  # True: open, False: closed
-    assigned_to = db.Column(db.Integer, db.ForeignKey('user.id'))
+    assigned_to = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
 
-    post = db.relationship('Post', backref=db.backref('task', uselist=False))
+    post = db.relationship('Post', backref=db.backref('task', uselist=False, cascade='all, delete-orphan'))
 
 # WaitingList Model
 class WaitingList(db.Model):
@@ -108,6 +134,11 @@ class WaitingList(db.Model):
     user = db.relationship('User', backref=db.backref('waiting_list_entries', lazy=True))
     post = db.relationship('Post', primaryjoin="WaitingList.task_id == Post.id")
 
+    __table_args__ = (
+        db.UniqueConstraint('task_id', 'user_id', name='uq_waiting_list_task_user'),
+        db.Index('ix_waiting_list_user_id', 'user_id'),
+    )
+
 # PostLike Model
 class PostLike(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -115,6 +146,12 @@ class PostLike(db.Model):
     post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # The unique constraint leads with user_id; counting and deleting a post's likes need post_id
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'post_id', name='uq_post_like_user_post'),
+        db.Index('ix_post_like_post_id', 'post_id'),
+    )
+
 # ReplyLike Model
 class ReplyLike(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -122,6 +159,11 @@ class ReplyLike(db.Model):
     reply_id = db.Column(db.Integer, db.ForeignKey('reply.id'), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'reply_id', name='uq_reply_like_user_reply'),
+        db.Index('ix_reply_like_reply_id', 'reply_id'),
+    )
+
 # Activity Model
 class Activity(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -130,4 +172,22 @@ class Activity(db.Model):
     target_user_id = db.Column(db.Integer, nullable=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
-    user = db.relationship('User', backref=db.backref('activities', lazy=True))
\ No newline at end of file
+    user = db.relationship('User', backref=db.backref('activities', lazy=True))
+    target_user = db.relationship('User', primaryjoin='foreign(Activity.target_user_id) == User.id', viewonly=True)
+
+    # Serve the keyset-paginated notification and activity feeds
+    __table_args__ = (
+        db.Index('ix_activity_target_user_id_timestamp', 'target_user_id', 'timestamp', 'id'),
+        db.Index('ix_activity_user_id_timestamp', 'user_id', 'timestamp', 'id'),
+    )
+
+# ImageJob Model: an uploaded image waiting to be processed, kept so restarts don't lose it
+class ImageJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False, index=True)
+    source = db.Column(db.String(255), nullable=False)  # File name in IMAGE_INCOMING_FOLDER
+    status = db.Column(db.String(10), nullable=False, default='pending')  # 'pending', 'running' or 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    error = db.Column(db.Text, nullable=True)
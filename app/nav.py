@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, render_template, request
+from flask_login import current_user
+from markupsafe import Markup
+from .queries import unread_notification_count
+
+# Where the logged-in nav gets the viewer's unread badge
+BADGE_SLOT = '<!--unread-badge-->'
+
+
+class UnreadCounter:
+    """Per-process cache of users' unread notification counts.
+
+    A count is read from the database at most once per UNREAD_COUNT_TTL seconds. Activities
+    written by this process drop the target's entry straight away; other workers' writes
+    show up once the entry expires.
+    """
+
+    def __init__(self, ttl, max_users=10000):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._counts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, seen_at):
+        with self._lock:
+            entry = self._counts.get(user_id)
+        if entry is not None and entry[1] > time.monotonic():
+            return entry[0]
+        count = unread_notification_count(user_id, seen_at)
+        self.set(user_id, count)
+        return count
+
+    def set(self, user_id, count):
+        with self._lock:
+            self._counts.pop(user_id, None)
+            self._counts[user_id] = (count, time.monotonic() + self.ttl)
+            if len(self._counts) > self.max_users:
+                self._counts.popitem(last=False)
+
+    def forget(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._counts.pop(user_id, None)
+
+
+def unread_counter():
+    return current_app.extensions['unread_counter']
+
+
+def unread_badge(count):
+    if not count:
+        return ''
+    limit = current_app.config['UNREAD_NOTIFICATION_LIMIT']
+    return f'<span class="nav-badge">{count}{"+" if count >= limit else ""}</span>'
+
+
+def _render_once(template):
+    # Only two navs exist, so each is rendered once per app (every time while templates auto-reload)
+    if current_app.jinja_env.auto_reload:
+        return render_template(template)
+    renders = current_app.extensions['nav_renders']
+    key = (template, request.script_root)
+    html = renders.get(key)
+    if html is None:
+        html = renders[key] = render_template(template)
+    return html
+
+
+def nav_bar():
+    """Template helper: the navbar for the current viewer, with their unread notification badge."""
+    if not current_user.is_authenticated:
+        return Markup(_render_once('components/nav_logged_out.html'))
+    badge = unread_badge(unread_counter().get(current_user.id, current_user.notifications_seen_at))
+    return Markup(_render_once('components/nav_logged_in.html').replace(BADGE_SLOT, badge, 1))
+
+
+def init_nav(app):
+    app.extensions['nav_renders'] = {}
+    app.extensions['unread_counter'] = UnreadCounter(app.config['UNREAD_COUNT_TTL'])
+    app.add_template_global(nav_bar)
@@ -0,0 +1,36 @@
+from datetime import datetime
+from sqlalchemy import tuple_
+
+
+# Cursors look like "<iso timestamp>_<id>" so they can travel in a query string
+def encode_cursor(timestamp, row_id):
+    return f'{timestamp.isoformat()}_{row_id}'
+
+
+def decode_cursor(cursor):
+    """Return the (timestamp, id) pair of a cursor, or None if it is malformed."""
+    try:
+        timestamp, row_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def keyset_page(query, time_column, id_column, cursor=None, per_page=20):
+    """Return one page of `query` ordered newest first, plus the cursor of the next page.
+
+    The page is located with `(time, id) < cursor` instead of OFFSET, so with an index on
+    (time_column, id_column) the cost of any page is the same as the cost of the first one.
+    """
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        query = query.filter(tuple_(time_column, id_column) < tuple_(*position))
+
+    # Fetch one extra row to find out whether another page exists
+    items = query.order_by(time_column.desc(), id_column.desc()).limit(per_page + 1).all()
+    if len(items) <= per_page:
+        return items, None
+
+    items = items[:per_page]
+    last = items[-1]
+    return items, encode_cursor(getattr(last, time_column.key), getattr(last, id_column.key))
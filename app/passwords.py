@@ -0,0 +1,78 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app, has_app_context
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class PasswordHasherBusy(Exception):
+    """Raised instead of queueing more password work than PASSWORD_QUEUE_LIMIT."""
+
+
+class PasswordHasher:
+    """Hashes and checks passwords on a few dedicated threads, with a cap on the work waiting.
+
+    Password hashing is deliberately slow. Run on the request threads, a burst of logins
+    would take every one of them; here at most PASSWORD_WORKERS hashes run at once
+    (hashlib's scrypt and pbkdf2 release the GIL, so other requests keep going), and
+    beyond PASSWORD_QUEUE_LIMIT waiting or running the caller gets PasswordHasherBusy
+    straight away rather than joining an ever longer queue.
+    """
+
+    def __init__(self, method, workers, queue_limit):
+        self.method = method
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._executor = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._prefix = None
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """Whether a stored hash was made with another method or cost than the configured one."""
+        if self._prefix is None:
+            # Spelled out the way werkzeug stores it, e.g. 'scrypt' becomes 'scrypt:32768:8:1'
+            self._prefix = generate_password_hash('', self.method).split('$', 1)[0]
+        return password_hash.split('$', 1)[0] != self._prefix
+
+    def _run(self, function, *args):
+        with self._lock:
+            if self._in_flight >= self.queue_limit:
+                raise PasswordHasherBusy()
+            self._in_flight += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='passwords')
+        try:
+            return self._executor.submit(function, *args).result()
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+
+def _hasher():
+    return current_app.extensions.get('password_hasher') if has_app_context() else None
+
+
+def hash_password(password):
+    hasher = _hasher()
+    return hasher.hash(password) if hasher else generate_password_hash(password)
+
+
+def verify_password(password_hash, password):
+    hasher = _hasher()
+    return hasher.verify(password_hash, password) if hasher else check_password_hash(password_hash, password)
+
+
+def password_hasher():
+    return current_app.extensions['password_hasher']
+
+
+def init_passwords(app):
+    config = app.config
+    app.extensions['password_hasher'] = PasswordHasher(config['PASSWORD_HASH_METHOD'], config['PASSWORD_WORKERS'],
+                                                       config['PASSWORD_QUEUE_LIMIT'])
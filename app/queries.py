@@ -0,0 +1,41 @@
+from flask import current_app
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload
+from .models import db, Post, Activity
+from .pagination import keyset_page
+
+
+def post_list_query():
+    """Base query for post lists: one SELECT returns the posts with their authors."""
+    return Post.query.options(joinedload(Post.user))
+
+
+def feed_page(category=None, cursor=None):
+    query = post_list_query()
+    if category:
+        query = query.filter(Post.category == category)
+    return keyset_page(query, Post.created_at, Post.id, cursor, current_app.config['POSTS_PER_PAGE'])
+
+
+
+def notification_page(user_id, cursor=None):
+    # Notifications show who acted, so load the acting user with each row
+    query = Activity.query.options(joinedload(Activity.user)).filter(Activity.target_user_id == user_id)
+    return keyset_page(query, Activity.timestamp, Activity.id, cursor, current_app.config['ACTIVITIES_PER_PAGE'])
+
+
+def activity_page(user_id, cursor=None):
+    query = Activity.query.options(joinedload(Activity.target_user)).filter(Activity.user_id == user_id)
+    return keyset_page(query, Activity.timestamp, Activity.id, cursor, current_app.config['ACTIVITIES_PER_PAGE'])
+
+
+def unread_notification_count(user_id, seen_at=None):
+    """Count notifications newer than `seen_at`, stopping at UNREAD_NOTIFICATION_LIMIT.
+
+    The cap keeps this an index range scan of bounded length however many notifications a user has.
+    """
+    unread = select(Activity.id).where(Activity.target_user_id == user_id)
+    if seen_at:
+        unread = unread.where(Activity.timestamp > seen_at)
+    unread = unread.limit(current_app.config['UNREAD_NOTIFICATION_LIMIT']).subquery()
+    return db.session.scalar(select(func.count()).select_from(unread))
@@ -0,0 +1,157 @@
+import os
+import re
+import shutil
+import tempfile
+from sqlalchemy import event, select
+from .config import TestingConfig
+from .models import db, User, Post, Task, Reply, WaitingList
+from .queries import feed_page, notification_page, activity_page
+from .reply_tree import reply_page
+from .seeder import Seeder
+
+# "SCAN post" reads the whole table; "SCAN post USING INDEX ..." walks an index in order, which is fine
+_SCAN = re.compile(r'^SCAN (\w+)$')
+_ALIAS = re.compile(r'(?:FROM|JOIN)\s+"?(\w+)"?(?:\s+AS\s+"?(\w+)"?)?', re.IGNORECASE)
+
+
+def _routes():
+    """(label, method, path, form) for requests covering every route that touches the database.
+
+    Picks its targets from the seeded data; the logged-in user is the author of the busiest post.
+    """
+    post = db.session.scalars(select(Post).order_by(Post.reply_count.desc(), Post.id).limit(1)).one()
+    viewer = post.created_by
+    reply = db.session.scalars(select(Reply).where(Reply.post_id == post.id)
+                               .order_by(Reply.child_count.desc(), Reply.id).limit(1)).one()
+    own_reply = db.session.scalar(select(Reply.id).where(Reply.reply_by == viewer).order_by(Reply.id).limit(1))
+    applied = select(WaitingList.id).where(WaitingList.task_id == Task.id, WaitingList.user_id == viewer).exists()
+    task = db.session.scalar(select(Task.id).join(Post, Post.id == Task.id)
+                             .where(Post.created_by != viewer, ~applied).order_by(Task.id.desc()).limit(1))
+    other_post = db.session.scalar(select(Post.id).where(Post.created_by == viewer, Post.id != post.id)
+                                   .order_by(Post.id).limit(1))
+    username = db.session.scalar(select(User.username).where(User.id == viewer))
+    word = db.session.scalar(select(Post.title).where(Post.id == post.id)).split()[0]
+
+    _, feed_cursor = feed_page()
+    _, category_cursor = feed_page(post.category)
+    _, notification_cursor = notification_page(viewer)
+    _, activity_cursor = activity_page(viewer)
+    _, reply_cursor = reply_page(post.id)
+    _, child_cursor = reply_page(post.id, parent_id=reply.id)
+
+    routes = [
+        ('home', 'GET', '/', None),
+        ('home by category', 'GET', f'/?category={post.category}', None),
+        ('feed', 'GET', f'/feed?cursor={feed_cursor}', None),
+        ('feed by category', 'GET', f'/feed?category={post.category}&cursor={category_cursor}', None),
+        ('post detail', 'GET', f'/post/{post.id}', None),
+        ('more replies', 'GET', f'/post/{post.id}/replies?cursor={reply_cursor or ""}', None),
+        ('more child replies', 'GET', f'/post/{post.id}/replies?parent={reply.id}&cursor={child_cursor or ""}', None),
+        ('search', 'GET', f'/search?query={word}', None),
+        ('notifications', 'GET', '/notification', None),
+        ('more notifications', 'GET', f'/notification/feed?cursor={notification_cursor or ""}', None),
+        ('unread notifications', 'GET', '/notification/unread', None),
+        ('activity', 'GET', '/activity', None),
+        ('more activity', 'GET', f'/activity/feed?cursor={activity_cursor or ""}', None),
+        ('user info', 'GET', f'/get_user_info/{username}', None),
+        ('like post', 'POST', f'/like_post/{post.id}', None),
+        ('like reply', 'POST', f'/like_reply/{reply.id}', None),
+        ('reply', 'POST', f'/reply/{post.id}', {'content': 'audit reply', 'parent_reply_id': reply.id}),
+        ('apply to task', 'POST', f'/apply_task/{task}', None),
+    ]
+    if own_reply:
+        routes.append(('delete reply', 'POST', f'/delete_reply/{own_reply}', None))
+    if other_post:
+        routes.append(('delete post', 'POST', f'/delete_post/{other_post}', None))
+    return viewer, routes
+
+
+def full_scans(plan, statement):
+    """The plan lines that read a whole table or build a temporary index on one."""
+    tables = {name.lower() for name in db.metadata.tables}
+    aliases = {}
+    for table, alias in _ALIAS.findall(statement):
+        aliases[(alias or table).lower()] = table.lower()
+    flagged = []
+    for detail in plan:
+        match = _SCAN.match(detail)
+        if match and aliases.get(match.group(1).lower(), match.group(1).lower()) in tables:
+            flagged.append(detail)
+        elif 'AUTOMATIC' in detail:
+            flagged.append(detail)
+    return flagged
+
+
+def explain(connection, statement, parameters):
+    cursor = connection.cursor()
+    try:
+        cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+        return [row[3] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def audit_routes(app, report=None):
+    """Replay the routes against the app's seeded database and EXPLAIN every query they make.
+
+    Returns {label: [(statement, plan, flagged lines)]}; `report` is called with each label as it goes.
+    """
+    viewer, routes = _routes()
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'WITH')):
+            statements.append((statement, parameters[0] if executemany else parameters))
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(viewer)
+
+    results = {}
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        for label, method, path, form in routes:
+            statements.clear()
+            response = client.open(path, method=method, data=form)
+            if response.status_code >= 400:
+                raise RuntimeError(f'{method} {path} answered {response.status_code}')
+            results[label] = list(statements)
+            if report:
+                report(label)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+
+    connection = db.engine.raw_connection()
+    try:
+        for label, captured in results.items():
+            results[label] = [(statement, plan, full_scans(plan, statement)) for statement, plan in
+                              ((statement, explain(connection, statement, parameters))
+                               for statement, parameters in captured)]
+    finally:
+        connection.close()
+    return results
+
+
+def run_audit(users=200, posts=2000, replies=10, seed_value=0, report=None):
+    """Seed a temporary SQLite database with today's schema and audit every route against it."""
+    from . import create_app
+    directory = tempfile.mkdtemp()
+
+    class AuditConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(directory, 'audit.db')
+        DB_REPLICAS = []
+        FRAGMENT_CACHE_BACKEND = 'none'  # Every request runs its queries
+
+    try:
+        app = create_app(AuditConfig)
+        with app.app_context():
+            db.create_all()
+            Seeder(users, posts, posts * replies, post_likes=posts * 3, reply_likes=posts * replies,
+                   activities=posts * 5, seed=seed_value).run()
+            try:
+                return audit_routes(app, report)
+            finally:
+                db.session.remove()
+                db.engine.dispose()
+    finally:
+        shutil.rmtree(directory)
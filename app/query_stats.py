@@ -0,0 +1,190 @@
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from flask import current_app, g, has_request_context, request, request_finished, request_started
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+RECORD_KEY = 'query_stats_record'
+APP_FOLDER = os.path.dirname(os.path.abspath(__file__))
+STATEMENT_LIMIT = 1000  # characters of a statement kept in logs and stats
+
+_IN_LIST = re.compile(r'\((?:\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*,)+\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*\)')
+_NUMBER = re.compile(r'\b\d+\b')
+_SPACE = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    """The statement with its whitespace, literal numbers and IN list lengths evened out,
+    so that repeats of one query with other values compare equal."""
+    shape = _SPACE.sub(' ', statement).strip()
+    return _NUMBER.sub('N', _IN_LIST.sub('(?...)', shape))
+
+
+def _origin():
+    # The innermost template or application line on the stack: what made the query.
+    # Jinja marks its compiled templates, which map back to template line numbers
+    frame = sys._getframe(1)
+    while frame is not None:
+        template = frame.f_globals.get('__jinja_template__')
+        if template is not None:
+            name = template.filename or '<template>'  # Templates made from strings have no file
+            if os.path.isabs(name):
+                name = os.path.relpath(name, APP_FOLDER)
+            return f'{name}:{template.get_corresponding_lineno(frame.f_lineno)}'
+        filename = frame.f_code.co_filename
+        if filename.startswith(APP_FOLDER) and filename != __file__:
+            return f'{os.path.relpath(filename, APP_FOLDER)}:{frame.f_lineno}'
+        frame = frame.f_back
+    return None
+
+
+def _short(statement):
+    return _SPACE.sub(' ', statement).strip()[:STATEMENT_LIMIT]
+
+
+class RequestQueries:
+    """The queries of one request: how many, how long, the slowest and how often each shape ran."""
+
+    def __init__(self, keep):
+        self.keep = keep
+        self.count = 0
+        self.seconds = 0.0
+        self.started = None
+        self.slowest = []  # [(seconds, statement, origin)], slowest first
+        self.shapes = {}  # shape: times run
+        self.repeated = {}  # shape: (statement, origin) of the ones over the N+1 threshold
+
+    def add(self, statement, seconds, threshold):
+        self.count += 1
+        self.seconds += seconds
+        if len(self.slowest) < self.keep or seconds > self.slowest[-1][0]:
+            self.slowest.append((seconds, statement, _origin()))
+            self.slowest.sort(key=lambda entry: -entry[0])
+            del self.slowest[self.keep:]
+        shape = statement_shape(statement)
+        times = self.shapes[shape] = self.shapes.get(shape, 0) + 1
+        if times == threshold + 1:
+            self.repeated[shape] = (statement, _origin())
+
+
+class QueryStats:
+    """Per-request SQL instrumentation, on only with QUERY_STATS.
+
+    Every query a request runs on its own thread is counted and timed, and per route (per
+    worker process) the requests, queries, database time and slowest statements add up.
+    Statements slower than QUERY_SLOW_MS are logged as they finish, and a request that
+    runs the same statement more than QUERY_N_PLUS_ONE_THRESHOLD times, the mark of a
+    lazy load in a loop, is logged when it ends. Both log lines are JSON with the route
+    and the application or template line the query came from; parameters are left out,
+    as they can hold personal data. With QUERY_STATS_HEADER every response also gets
+    X-Query-Count and Server-Timing headers.
+
+    When QUERY_STATS is off none of the hooks are installed, so it costs nothing.
+    """
+
+    def __init__(self, config):
+        self.slow_seconds = config['QUERY_SLOW_MS'] / 1000
+        self.threshold = config['QUERY_N_PLUS_ONE_THRESHOLD']
+        self.keep = config['QUERY_STATS_SLOWEST']
+        self.header = config['QUERY_STATS_HEADER']
+        self.routes = {}
+        self._lock = threading.Lock()
+
+    def finish(self, record, response):
+        route = request.endpoint or request.path
+        for shape, (statement, origin) in record.repeated.items():
+            self._log('n_plus_one', route, statement, origin, count=record.shapes[shape])
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps({'event': 'request_queries', 'route': route, 'method': request.method,
+                                     'status': response.status_code, 'queries': record.count,
+                                     'db_ms': round(record.seconds * 1000, 2)}))
+        if self.header:
+            response.headers['X-Query-Count'] = str(record.count)
+            response.headers.add('Server-Timing', f'db;dur={record.seconds * 1000:.2f};desc="{record.count} queries"')
+
+        with self._lock:
+            stats = self.routes.setdefault(route, {'requests': 0, 'queries': 0, 'db_seconds': 0.0,
+                                                   'n_plus_one': 0, 'slowest': []})
+            stats['requests'] += 1
+            stats['queries'] += record.count
+            stats['db_seconds'] += record.seconds
+            stats['n_plus_one'] += bool(record.repeated)
+            stats['slowest'] = sorted(stats['slowest'] + record.slowest, key=lambda entry: -entry[0])[:self.keep]
+
+    def slow(self, statement, seconds):
+        self._log('slow_query', request.endpoint or request.path, statement, _origin(), ms=round(seconds * 1000, 2))
+
+    def _log(self, kind, route, statement, origin, **fields):
+        logger.warning(json.dumps({'event': kind, 'route': route, 'method': request.method, 'path': request.path,
+                                   **fields, 'origin': origin, 'statement': _short(statement)}))
+
+    def stats(self):
+        with self._lock:
+            return {route: {
+                'requests': stats['requests'],
+                'queries_per_request': round(stats['queries'] / stats['requests'], 2),
+                'db_ms_per_request': round(stats['db_seconds'] * 1000 / stats['requests'], 2),
+                'n_plus_one_requests': stats['n_plus_one'],
+                'slowest': [{'ms': round(seconds * 1000, 2), 'origin': origin, 'statement': _short(statement)}
+                            for seconds, statement, origin in stats['slowest']],
+            } for route, stats in self.routes.items()}
+
+    def reset(self):
+        with self._lock:
+            self.routes.clear()
+
+
+def query_stats():
+    """The app's QueryStats, or None when QUERY_STATS is off."""
+    return current_app.extensions.get('query_stats')
+
+
+def _record():
+    return g.get(RECORD_KEY) if has_request_context() else None
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    record = _record()
+    if record is not None:
+        record.started = time.perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    record = _record()
+    if record is None or record.started is None:
+        return
+    seconds = time.perf_counter() - record.started
+    record.started = None
+    stats = current_app.extensions['query_stats']
+    record.add(statement, seconds, stats.threshold)
+    if seconds >= stats.slow_seconds:
+        stats.slow(statement, seconds)
+
+
+def _start_request(sender, **extra):
+    setattr(g, RECORD_KEY, RequestQueries(sender.extensions['query_stats'].keep))
+
+
+def _finish_request(sender, response, **extra):
+    record = g.pop(RECORD_KEY, None)
+    if record is not None:
+        sender.extensions['query_stats'].finish(record, response)
+
+
+def init_query_stats(app):
+    if not app.config['QUERY_STATS']:
+        return
+    app.extensions['query_stats'] = QueryStats(app.config)
+    # On the Engine class, so the read replicas' queries count too
+    if not event.contains(Engine, 'before_cursor_execute', _before_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_execute)
+    request_started.connect(_start_request, app)
+    request_finished.connect(_finish_request, app)
@@ -0,0 +1,119 @@
+import itertools
+import logging
+import threading
+import time
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy.exc import DBAPIError
+
+logger = logging.getLogger(__name__)
+
+READ_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+
+
+class RoutingSession(Session):
+    """Sends a read-only request's queries to a replica and everything else to the primary.
+
+    A request is read-only while it is a GET, HEAD or OPTIONS from a client that has not written
+    in the last DB_REPLICA_STICKY_SECONDS. The first flush or UPDATE/DELETE/INSERT moves
+    the rest of the request to the primary, so it reads its own writes, and the client
+    stays on the primary for the sticky window after it.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or not has_request_context() or engine is not self._db.engines.get(None):
+            return engine
+        if self._flushing or getattr(clause, 'is_dml', False):
+            g.database_wrote = True
+            return engine
+        if g.get('database_wrote') or 'replicas' not in current_app.extensions:
+            return engine
+        replica = g.get('database_replica')
+        if replica is None:
+            replica = g.database_replica = current_app.extensions['replicas'].for_request() or engine
+        return replica
+
+    def _connection_for_bind(self, engine, execution_options=None, **kw):
+        try:
+            return super()._connection_for_bind(engine, execution_options, **kw)
+        except DBAPIError as error:
+            replicas = current_app.extensions.get('replicas') if has_request_context() else None
+            if replicas is None or not replicas.mark_down(engine, error):
+                raise
+        # The replica refused the connection: the rest of the request reads from the primary
+        primary = g.database_replica = self._db.engines[None]
+        return super()._connection_for_bind(primary, execution_options, **kw)
+
+
+class ReplicaSet:
+    """The replica engines, taken in turn and skipped for a while after failing to connect.
+
+    Nothing is probed ahead of time: a replica is only marked down when a session's own
+    connection to it fails, and then skipped for DB_REPLICA_RETRY_INTERVAL.
+    """
+
+    def __init__(self, engines, retry_interval):
+        self.engines = engines
+        self.retry_interval = retry_interval
+        self._turn = itertools.cycle(range(len(engines)))
+        self._down_until = [0.0] * len(engines)
+        self._lock = threading.Lock()
+
+    def for_request(self):
+        """The replica to read from in this request, or None if it must use the primary."""
+        if request.method not in READ_METHODS or session.get('primary_until', 0) > time.time():
+            return None
+        return self.pick()
+
+    def pick(self):
+        """The next replica not marked down, or None to use the primary."""
+        with self._lock:
+            start = next(self._turn)
+        now = time.monotonic()
+        for offset in range(len(self.engines)):
+            index = (start + offset) % len(self.engines)
+            if self._down_until[index] <= now:
+                return self.engines[index]
+        return None
+
+    def mark_down(self, engine, error):
+        """Skip a replica that failed to connect for the retry interval; False if it is not a replica."""
+        if engine not in self.engines:
+            return False
+        logger.warning('Replica %s is unavailable, reading from the primary: %s',
+                       engine.url.render_as_string(hide_password=True), error)
+        self._down_until[self.engines.index(engine)] = time.monotonic() + self.retry_interval
+        return True
+
+def sync_sqlite_replicas(primary, replicas):
+    """Copy an SQLite primary into SQLite replica files, standing in for replication locally."""
+    source = primary.raw_connection()
+    try:
+        for replica in replicas:
+            target = replica.raw_connection()
+            try:
+                source.driver_connection.backup(target.driver_connection)
+            finally:
+                target.close()
+    finally:
+        source.close()
+
+
+def init_replicas(app, engines):
+    if not engines:
+        return
+    app.extensions['replicas'] = ReplicaSet(engines, app.config['DB_REPLICA_RETRY_INTERVAL'])
+    sticky = app.config['DB_REPLICA_STICKY_SECONDS']
+
+    @app.before_request
+    def route_request():
+        g.pop('database_replica', None)
+        g.pop('database_wrote', None)
+
+    # Keep a client that has just written on the primary until the replicas have caught up
+    @app.after_request
+    def stick_to_primary(response):
+        if g.get('database_wrote'):
+            session['primary_until'] = time.time() + sticky
+        return response
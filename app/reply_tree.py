@@ -0,0 +1,132 @@
+import re
+from flask import current_app, render_template, url_for
+from markupsafe import Markup
+from sqlalchemy import literal, select, tuple_
+from sqlalchemy.orm import aliased
+from .models import db, User, Reply, ReplyLike
+from .pagination import encode_cursor, decode_cursor
+from .fragment_cache import fragment_cache
+
+# Viewer-specific spots in the cached reply markup (user content is escaped, so can't contain these)
+LIKE_ICON = re.compile(r'<!--like-icon:(\d+)-->')
+OWNER_ONLY = re.compile(r'<!--owner:(\d+)-->(.*?)<!--/owner-->', re.DOTALL)
+
+
+class ReplyNode:
+    """A reply as shown in a thread: its columns, author and loaded children."""
+    __slots__ = ('id', 'post_id', 'parent_reply_id', 'reply_by', 'content', 'post_at', 'like_count',
+                 'child_count', 'username', 'user_image', 'children')
+
+    def __init__(self, row):
+        for name in self.__slots__[:-1]:
+            setattr(self, name, getattr(row, name))
+        self.children = []
+
+    @property
+    def comment_count(self):
+        return self.child_count
+
+    @property
+    def more_children(self):
+        """How many direct replies exist beyond the loaded ones."""
+        return self.child_count - len(self.children)
+
+    @property
+    def children_cursor(self):
+        # Where "load more" continues; without loaded children it starts from the first one
+        if self.children:
+            return encode_cursor(self.children[-1].post_at, self.children[-1].id)
+        return None
+
+
+def _node_select():
+    # The viewer's likes are not selected: pages are rendered once for everyone and cached,
+    # and personalize_replies() marks the likes afterwards
+    return select(Reply.id, Reply.post_id, Reply.parent_reply_id, Reply.reply_by, Reply.content, Reply.post_at,
+                  Reply.like_count, Reply.child_count, User.username, User.user_image
+                  ).join(User, User.id == Reply.reply_by)
+
+
+def reply_page(post_id, parent_id=None, cursor=None):
+    """Return one page of a post's replies as ReplyNode trees, oldest first, plus the next page's cursor.
+
+    The page holds top-level replies (or the direct replies to `parent_id`) after `cursor`.
+    Their descendants and authors come from one more query: a recursive
+    CTE walked breadth first, REPLY_TREE_MAX_DEPTH levels deep and at most
+    REPLY_TREE_NODE_LIMIT rows. Each node keeps its first REPLY_CHILDREN_PER_PAGE children;
+    the rest are fetched later by calling this again with that node as `parent_id`.
+    """
+    config = current_app.config
+    per_page = config['REPLIES_PER_PAGE'] if parent_id is None else config['REPLY_CHILDREN_PER_PAGE']
+
+    query = _node_select().where(Reply.post_id == post_id, Reply.parent_reply_id == parent_id)
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        query = query.where(tuple_(Reply.post_at, Reply.id) > tuple_(*position))
+    rows = db.session.execute(query.order_by(Reply.post_at, Reply.id).limit(per_page + 1)).all()
+    roots = [ReplyNode(row) for row in rows[:per_page]]
+    next_cursor = encode_cursor(roots[-1].post_at, roots[-1].id) if len(rows) > per_page else None
+
+    if any(root.child_count for root in roots):
+        _attach_descendants(roots)
+    return roots, next_cursor
+
+
+def _attach_descendants(roots):
+    config = current_app.config
+    tree = (
+        select(Reply.id, literal(1).label('depth'))
+        .where(Reply.parent_reply_id.in_([root.id for root in roots]))
+        .cte('reply_tree', recursive=True)
+    )
+    child = aliased(Reply)
+    tree = tree.union_all(
+        select(child.id, tree.c.depth + 1)
+        .where(child.parent_reply_id == tree.c.id, tree.c.depth < config['REPLY_TREE_MAX_DEPTH'])
+    )
+    rows = db.session.execute(
+        _node_select()
+        .join(tree, tree.c.id == Reply.id)
+        .order_by(tree.c.depth, Reply.post_at, Reply.id)
+        .limit(config['REPLY_TREE_NODE_LIMIT'])
+    ).all()
+
+    # Rows arrive parents before children, so the tree is built in one pass without recursion
+    per_parent = config['REPLY_CHILDREN_PER_PAGE']
+    nodes = {root.id: root for root in roots}
+    for row in rows:
+        parent = nodes.get(row.parent_reply_id)
+        if parent is None or len(parent.children) >= per_parent:
+            continue  # Left for "load more", along with its own replies
+        node = ReplyNode(row)
+        parent.children.append(node)
+        nodes[node.id] = node
+
+
+def rendered_reply_page(post_id, version, parent_id=None, cursor=None):
+    """Return (html, next_cursor) for a reply_page(), rendered for no one in particular and cached.
+
+    Pass the html through personalize_replies() before sending it.
+    """
+    position = decode_cursor(cursor) if cursor else None
+    cursor = encode_cursor(*position) if position else None  # One cache entry per real position
+
+    def render():
+        replies, next_cursor = reply_page(post_id, parent_id, cursor)
+        return render_template('components/reply_list.html', replies=replies), next_cursor
+    return fragment_cache().fetch(('replies', post_id, version, parent_id, cursor), render)
+
+
+def personalize_replies(html, post_id, user_id):
+    """Fill in the viewer's like icons and delete buttons in rendered reply markup."""
+    liked = set()
+    if user_id and LIKE_ICON.search(html):
+        liked = set(db.session.scalars(
+            select(ReplyLike.reply_id)
+            .join(Reply, Reply.id == ReplyLike.reply_id)
+            .where(Reply.post_id == post_id, ReplyLike.user_id == user_id)
+        ))
+    icons = {True: url_for('static', filename='image/liked.png'), False: url_for('static', filename='image/like.png')}
+    html = LIKE_ICON.sub(lambda match: icons[int(match.group(1)) in liked], html)
+    html = OWNER_ONLY.sub(lambda match: match.group(2) if int(match.group(1)) == user_id else '', html)
+    return Markup(html)
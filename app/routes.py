@@ -1,13 +1,29 @@
-from flask import render_template, request, redirect, url_for, flash, current_app, jsonify
+from flask import render_template, request, redirect, url_for, flash, current_app, jsonify, abort, send_file
 from datetime import datetime
-from .models import db, User, Post, Task, Reply, WaitingList, PostLike, ReplyLike, Activity
+from functools import wraps
+from .models import db, User, Post, Task, Reply, WaitingList
 from flask_login import login_user, logout_user, login_required, current_user
-import os
 from werkzeug.utils import secure_filename
-from .config import Config
+from .queries import feed_page, notification_page, activity_page
+from .nav import unread_counter
+from .identity import user_record
+from .passwords import password_hasher, PasswordHasherBusy
+from .counters import record_new_reply, delete_reply_subtree
+from .likes import toggle_post_like, toggle_reply_like
+from .activity import record_activity
+from .search import search_posts
+from .reply_tree import rendered_reply_page, personalize_replies
+from .fragment_cache import fragment_cache, invalidate_author
+from .query_stats import query_stats
+from .images import FORMATS, available_formats, derivative_store
+from .image_jobs import enqueue_image, discard_image_jobs
+from .uploads import upload_store
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 from werkzeug.security import generate_password_hash
-from collections import defaultdict
-import uuid
+
+BUSY_MESSAGE = 'Too many people are signing in right now. Please try again in a moment.'
+
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
@@ -25,26 +41,37 @@ def validate_postcode(postcode):
         raise ValueError("Invalid postcode")
 
 
+def operator_required(view):
+    """Serve a view only to the users in OPERATOR_USERNAMES; it does not exist for anyone else."""
+    @wraps(view)
+    def operator_view(*args, **kwargs):
+        if not current_user.is_authenticated or current_user.username not in current_app.config['OPERATOR_USERNAMES']:
+            abort(404)
+        return view(*args, **kwargs)
+    return operator_view
+
+
 def init_app_routes(app):
     @app.route('/')
     def home():
-        nav = render_template('components/nav_logged_in.html') if current_user.is_authenticated else render_template(
-            'components/nav_logged_out.html')
-        category = request.args.get('category')
-        if category:
-            posts = Post.query.filter_by(category=category).order_by(Post.created_at.desc()).all()
-        else:
-            posts = Post.query.order_by(Post.created_at.desc()).all()
+        current_category = request.args.get('category')
+        posts, next_cursor = feed_page(current_category, request.args.get('cursor'))
         category = ['Daily', 'Petsitting', 'Adoption']
-        #posts = Post.query.order_by(Post.created_at.desc()).all()  
-        return render_template('index.html', page_name='Home', nav=nav, posts=posts, category=category)
+        return render_template('index.html', page_name='Home', posts=posts, category=category,
+                               current_category=current_category, next_cursor=next_cursor)
+
+    # Define the "load more" route for the home feed
+    @app.route('/feed')
+    def feed():
+        posts, next_cursor = feed_page(request.args.get('category'), request.args.get('cursor'))
+        html = render_template('components/post_cards.html', posts=posts)
+        return jsonify({'html': html, 'next_cursor': next_cursor})
 
 
     # Define the signup route
     @app.route('/signup', methods=['GET', 'POST'])
     def signup():
 
-        nav = render_template('components/nav_logged_in.html') if current_user.is_authenticated else render_template('components/nav_logged_out.html')
         error_message = None
 
         if request.method == 'POST':
@@ -72,31 +99,29 @@ def init_app_routes(app):
                         error_message = 'Username or Email already exists'
 
             if error_message:
-                return render_template('signup.html', page_name='Signup', nav=nav, error_message=error_message)
+                return render_template('signup.html', page_name='Signup', error_message=error_message)
 
             # Create new User object with hashed password
-            new_user = User(
-                username=username,
-                email=email,
-                password=password,  # This is automatically hashed by the setter method
-                phone=phone,
-                gender=gender,
-                postcode=postcode,
-                join_at=datetime.utcnow(),
-                user_image=f'{user_image}' if user_image else None
-            )
+            try:
+                new_user = User(
+                    username=username,
+                    email=email,
+                    password=password,  # This is automatically hashed by the setter method
+                    phone=phone,
+                    gender=gender,
+                    postcode=postcode,
+                    join_at=datetime.utcnow(),
+                    user_image=f'{user_image}' if user_image else None
+                )
+            except PasswordHasherBusy:
+                return (render_template('signup.html', page_name='Signup', error_message=BUSY_MESSAGE),
+                        503, {'Retry-After': '5'})
 
             db.session.add(new_user)
-            db.session.commit()
+            db.session.flush()  # Flush to assign an ID to new_user
 
             # log the activity
-            new_activity = Activity(
-                user_id=new_user.id,
-                action='signed up!',
-                target_user_id=None
-            )
-
-            db.session.add(new_activity)
+            record_activity(new_user.id, 'signed up!')
             db.session.commit()
 
             # Log the user in
@@ -104,26 +129,36 @@ def init_app_routes(app):
             flash('Registration successful!', 'success')
             return redirect(url_for('profile'))
         else:
-            return render_template('signup.html', page_name='Signup', nav=nav)
+            return render_template('signup.html', page_name='Signup')
 
 
     # Define the login route， and check if the user is authenticated
     @app.route('/login', methods=['GET', 'POST'])
     def login():
         error_message = None
-        nav = render_template('components/nav_logged_in.html') if current_user.is_authenticated else render_template(
-            'components/nav_logged_out.html')
         if request.method == 'POST':
             username = request.form['username']
             password = request.form['password']
             user = User.query.filter_by(username=username).first()
-            if user and user.check_password(password):
-                login_user(user)
-                flash('Login successful!', 'success')
-                return redirect(url_for('home'))
-            else:
-                error_message = 'Invalid username or password'
-        return render_template('login.html', page_name='Login', nav=nav, error_message=error_message)
+            try:
+                if user and user.check_password(password):
+                    # Bring the stored hash up to the configured method and cost while the password is at hand;
+                    # when the hasher is too busy the upgrade waits for another login, the login itself does not
+                    if password_hasher().needs_rehash(user.password_hash):
+                        try:
+                            user.password = password
+                            db.session.commit()
+                        except PasswordHasherBusy:
+                            pass
+                    login_user(user)
+                    flash('Login successful!', 'success')
+                    return redirect(url_for('home'))
+                else:
+                    error_message = 'Invalid username or password'
+            except PasswordHasherBusy:
+                return (render_template('login.html', page_name='Login', error_message=BUSY_MESSAGE),
+                        503, {'Retry-After': '5'})
+        return render_template('login.html', page_name='Login', error_message=error_message)
 
 
     # Define the logout route
@@ -137,40 +172,34 @@ def init_app_routes(app):
     @app.route('/profile', methods=['GET', 'POST'])
     @login_required
     def profile():
-        nav = render_template('components/nav_logged_in.html') if current_user.is_authenticated else render_template('components/nav_logged_out.html')
+        user = user_record()
         if request.method == 'POST':
-            current_user.username = request.form.get('username', current_user.username)
-            current_user.email = request.form.get('email', current_user.email)
-            current_user.phone = request.form.get('phone', current_user.phone)
-            current_user.gender = request.form.get('gender', current_user.gender)
-            current_user.postcode = request.form.get('postcode', current_user.postcode)
-            current_user.pet_type = request.form.get('petType', current_user.pet_type)
+            shown = (user.username, user.user_image)
+            user.username = request.form.get('username', user.username)
+            user.email = request.form.get('email', user.email)
+            user.phone = request.form.get('phone', user.phone)
+            user.gender = request.form.get('gender', user.gender)
+            user.postcode = request.form.get('postcode', user.postcode)
+            user.pet_type = request.form.get('petType', user.pet_type)
             new_image = request.form.get('user_image')
             if new_image:
-                current_user.user_image = new_image
-            db.session.commit()
-            flash('Profile updated successfully!', 'success')
+                user.user_image = new_image
+            if (user.username, user.user_image) != shown:
+                invalidate_author(user.id)  # Their name and avatar appear on cached cards and replies
 
             # log the activity
-            new_activity = Activity(
-                user_id=current_user.id,
-                action='updated profile!',
-                target_user_id=None
-            )
-
-            db.session.add(new_activity)
-            db.session.commit()
+            record_activity(user.id, 'updated profile!')
+            db.session.commit()  # Also drops the cached principal (see identity.py)
+            flash('Profile updated successfully!', 'success')
 
             return redirect(url_for('profile'))
-        return render_template('profile.html', page_name='Profile', nav=nav)
+        return render_template('profile.html', page_name='Profile', user=user)
 
 
     # Define the post_create route
     @app.route('/post_create', methods=['GET', 'POST'])
     @login_required
     def post_create():
-        nav = render_template('components/nav_logged_in.html') if current_user.is_authenticated else render_template(
-            'components/nav_logged_out.html')
 
         if request.method == 'POST':
             try:
@@ -195,14 +224,10 @@ def init_app_routes(app):
                 # Check if an image was uploaded
                 if image_file and allowed_file(image_file.filename):
 
-                    # Rename the image to avoid duplicates
+                    # Stored under a hash of its contents, so identical uploads share a file
                     original_filename = secure_filename(image_file.filename)
                     file_ext = original_filename.rsplit('.', 1)[1].lower()
-                    new_filename = f"{uuid.uuid4()}.{file_ext}"
-                    image_path = os.path.join(Config.UPLOAD_FOLDER, new_filename)
-                    image_file.save(image_path)
-
-                    new_post.image_name = new_filename  # Save the new image name to the post
+                    enqueue_image(new_post, image_file, file_ext)  # Processed after the commit
 
                 if is_task:
                     new_task = Task(
@@ -212,24 +237,14 @@ def init_app_routes(app):
                     )
                     db.session.add(new_task)
 
-                db.session.commit()
-                flash('Post created successfully!', 'success')
-
                 # Log the activity
-                new_activity = Activity(
-                    user_id=current_user.id,
-                    action='created a post.'
-                )
-                db.session.add(new_activity)
-                db.session.commit()
+                record_activity(current_user.id, 'created a post.')
+                if is_task:
+                    record_activity(current_user.id, 'created task.')
 
+                db.session.commit()
+                flash('Post created successfully!', 'success')
                 if is_task:
-                    new_activity = Activity(
-                        user_id=current_user.id,
-                        action='created task.'
-                    )
-                    db.session.add(new_activity)
-                    db.session.commit()
                     flash('Task created successfully!', 'success')
 
                 return redirect(url_for('home'))
@@ -238,7 +253,7 @@ def init_app_routes(app):
                 flash(f'Error creating post: {e}', 'danger')
                 return redirect(url_for('post_create'))
 
-        return render_template('post_create.html', nav=nav)
+        return render_template('post_create.html')
 
     # Define the post detail route
     @app.route('/reply/<int:post_id>', methods=['POST'])
@@ -257,18 +272,14 @@ def init_app_routes(app):
                     post_at=datetime.utcnow()
                 )
                 db.session.add(new_reply)
-                db.session.commit()
-                flash('Replied successfully!', 'success')
+                record_new_reply(post_id, new_reply.parent_reply_id)
 
                 # Log the activity
-                new_activity = Activity(
-                    user_id=current_user.id,
-                    action='replied to a post of ',
-                    target_user_id=Post.query.get(post_id).created_by
-                )
-                db.session.add(new_activity)
+                post_author = db.session.scalar(select(Post.created_by).where(Post.id == post_id))
+                record_activity(current_user.id, 'replied to a post of ', post_author)
                 db.session.commit()
-                
+                flash('Replied successfully!', 'success')
+
             except Exception as e:
                 db.session.rollback()
                 flash('Failed to post reply: ' + str(e), 'error')
@@ -287,24 +298,19 @@ def init_app_routes(app):
             return jsonify({'error': 'You are not authorized to delete this post.'}), 403
 
         try:
-            # Delete associated image from the filesystem
-            if post.image_name:
-                image_path = os.path.join(Config.UPLOAD_FOLDER, post.image_name)
-                if os.path.exists(image_path):
-                    os.remove(image_path)
+            discard_image_jobs(post)
+            image_name = post.image_name
 
             # Deleting the post should cascade and delete all associated replies
             db.session.delete(post)
-            db.session.commit()
 
             # Log the activity
-            new_activity = Activity(
-                user_id=current_user.id,
-                action='deleted a post.'
-            )
-            db.session.add(new_activity)
+            record_activity(current_user.id, 'deleted a post.')
             db.session.commit()
 
+            # Delete the image from the filesystem unless other posts share it
+            upload_store().release([image_name])
+
             return jsonify({'success': 'Post and all associated replies deleted successfully!'}), 200
         except Exception as e:
             db.session.rollback()
@@ -315,94 +321,68 @@ def init_app_routes(app):
     @login_required
     def delete_reply(reply_id):
         reply = Reply.query.get_or_404(reply_id)
+        post_id = reply.post_id
         if current_user.id != reply.reply_by:
             flash('You are not authorized to delete this reply.', 'error')
-            return redirect(url_for('post_detail', post_id=reply.post_id))
+            return redirect(url_for('post_detail', post_id=post_id))
         try:
-            db.session.delete(reply)  # Deleting the reply should cascade and delete all child replies
-            db.session.commit()
-            flash('Reply and all child replies deleted successfully!', 'success')
+            delete_reply_subtree(reply)  # Deletes all child replies and updates the counters
 
             # Log the activity
-            new_activity = Activity(
-                user_id=current_user.id,
-                action='deleted a reply to ',
-                target_user_id=reply.user.id
-            )
-            db.session.add(new_activity)
+            record_activity(current_user.id, 'deleted a reply to ', reply.reply_by)
             db.session.commit()
+            flash('Reply and all child replies deleted successfully!', 'success')
 
         except Exception as e:
             db.session.rollback()
             flash('Error deleting reply: ' + str(e), 'error')
-        return redirect(url_for('post_detail', post_id=reply.post_id))
+        return redirect(url_for('post_detail', post_id=post_id))
     
     # Define the like post route
     @app.route('/like_post/<int:post_id>', methods=['POST'])
     @login_required
     def like_post(post_id):
         post = Post.query.get_or_404(post_id)
-        like = PostLike.query.filter_by(user_id=current_user.id, post_id=post_id).first()
 
-        try:
-            if like:
-                db.session.delete(like)
-                post.like_count -= 1
-                action = 'unliked'
-            else:
-                new_like = PostLike(user_id=current_user.id, post_id=post_id)
-                db.session.add(new_like)
-                post.like_count += 1
-                action = 'liked'
-            
-            db.session.commit()
+        # A concurrent duplicate like fails the unique constraint; the retry then sees it and unlikes
+        for attempt in range(2):
+            try:
+                liked, like_count = toggle_post_like(current_user.id, post_id)
 
-            # Log the activity
-            new_activity = Activity(
-                user_id=current_user.id,
-                action=f'{action} a post from ',
-                target_user_id=post.user.id
-            )
-            db.session.add(new_activity)
-            db.session.commit()
+                # Log the activity with the same commit as the like
+                record_activity(current_user.id, f'{"liked" if liked else "unliked"} a post from ', post.created_by)
+                db.session.commit()
 
-            return jsonify({'like_count': post.like_count, 'liked': not bool(like)})
-        except Exception as e:
-            db.session.rollback()
-            return jsonify({'error': str(e)}), 500
+                return jsonify({'like_count': like_count, 'liked': liked})
+            except IntegrityError as e:
+                db.session.rollback()
+                error = e
+            except Exception as e:
+                db.session.rollback()
+                return jsonify({'error': str(e)}), 500
+        return jsonify({'error': str(error)}), 500
 
     @app.route('/like_reply/<int:reply_id>', methods=['POST'])
     @login_required
     def like_reply(reply_id):
         reply = Reply.query.get_or_404(reply_id)
-        like = ReplyLike.query.filter_by(user_id=current_user.id, reply_id=reply_id).first()
 
-        try:
-            if like:
-                db.session.delete(like)
-                reply.like_count -= 1
-                action = 'unliked'
-            else:
-                new_like = ReplyLike(user_id=current_user.id, reply_id=reply_id)
-                db.session.add(new_like)
-                reply.like_count += 1
-                action = 'liked'
-            
-            db.session.commit()
+        for attempt in range(2):
+            try:
+                liked, like_count = toggle_reply_like(current_user.id, reply_id)
 
-            # Log the activity
-            new_activity = Activity(
-                user_id=current_user.id,
-                action=f'{action} a reply from ',
-                target_user_id=reply.user.id
-            )
-            db.session.add(new_activity)
-            db.session.commit()
+                # Log the activity with the same commit as the like
+                record_activity(current_user.id, f'{"liked" if liked else "unliked"} a reply from ', reply.reply_by)
+                db.session.commit()
 
-            return jsonify({'like_count': reply.like_count, 'liked': not bool(like)})
-        except Exception as e:
-            db.session.rollback()
-            return jsonify({'error': str(e)}), 500
+                return jsonify({'like_count': like_count, 'liked': liked})
+            except IntegrityError as e:
+                db.session.rollback()
+                error = e
+            except Exception as e:
+                db.session.rollback()
+                return jsonify({'error': str(e)}), 500
+        return jsonify({'error': str(error)}), 500
 
 
 
@@ -421,20 +401,18 @@ def init_app_routes(app):
                 applied_at=datetime.utcnow()
             )
             db.session.add(new_application)
-            db.session.commit()
-            flash('Applied to task successfully!', 'success')
 
             # Log the activity
-            new_activity = Activity(
-                user_id=current_user.id,
-                action=f'applied a task from ',
-                target_user_id=Post.query.get(task_id).created_by
-                
-            )
-            db.session.add(new_activity)
+            task_author = db.session.scalar(select(Post.created_by).where(Post.id == task_id))
+            record_activity(current_user.id, 'applied a task from ', task_author)
             db.session.commit()
+            flash('Applied to task successfully!', 'success')
 
             return jsonify({'success': 'Applied to task successfully!'}), 200
+        except IntegrityError:
+            # A concurrent request from the same user got its application in first
+            db.session.rollback()
+            return jsonify({'error': 'You have already applied to this task.'}), 400
         except Exception as e:
             db.session.rollback()
             return jsonify({'error': str(e)}), 500
@@ -452,16 +430,11 @@ def init_app_routes(app):
 
         try:
             task.status = False
-            db.session.commit()
-            flash('Task closed successfully!', 'success')
 
             # Log the activity
-            new_activity = Activity(
-                user_id=current_user.id,
-                action=f'closed your task.'
-            )
-            db.session.add(new_activity)
+            record_activity(current_user.id, 'closed your task.')
             db.session.commit()
+            flash('Task closed successfully!', 'success')
 
         except Exception as e:
             db.session.rollback()
@@ -474,29 +447,15 @@ def init_app_routes(app):
     @app.route('/search')
     def search():
         query = request.args.get('query')
+        page = max(request.args.get('page', 1, type=int), 1)
         if query:
             query = query[:100]  # Limit the query to a maximum of 100 characters
-            posts = Post.query.join(User).filter(
-            Post.title.ilike(f'%{query}%') |
-            Post.content.ilike(f'%{query}%') |
-            User.username.ilike(f'%{query}%')
-        ).all()
-            #Only demonstrate part of the matching content
-            for post in posts:
-                content = post.content
-                start_index = content.find(query)
-                if start_index != -1:
-                    start_index = max(0, start_index - 50)
-                    end_index = min(len(content), start_index + len(query) + 50)
-                    post.content = '...' + content[start_index:end_index] + '...'
+            # Ranked results with only the matching part of the content highlighted
+            results, has_more = search_posts(query, page)
         else:
-            posts = []
+            results, has_more = [], False
 
-        if current_user.is_authenticated:
-            nav = render_template('components/nav_logged_in.html')
-        else:
-            nav = render_template('components/nav_logged_out.html')
-        return render_template('search_results.html', query=query, posts=posts, nav=nav)
+        return render_template('search_results.html', query=query, results=results, page=page, has_more=has_more)
 
 
     @app.errorhandler(404)
@@ -521,26 +480,49 @@ def init_app_routes(app):
         post = Post.query.get_or_404(post_id)
         user_has_applied = WaitingList.query.filter_by(task_id=post_id, user_id=current_user.id).first() is not None
 
-        # Query all replies
-        replies = Reply.query.filter_by(post_id=post_id).all()
-
-        # Organize replies by parent_reply_id
-        reply_dict = defaultdict(list)
-        for reply in replies:
-            reply_dict[reply.parent_reply_id].append(reply)
+        # One page of top-level replies with their threads, from the fragment cache, then the viewer's likes
+        html, next_cursor = rendered_reply_page(post.id, post.version)
+        replies_html = personalize_replies(html, post.id, current_user.id)
 
-        def nest_replies(parent_id=None):
-            nested = []
-            for reply in reply_dict[parent_id]:
-                reply.nested_replies = nest_replies(reply.id)
-                nested.append(reply)
-            return nested
-        
-        nested_replies = nest_replies()  # Top-level replies
+        return render_template('post_detail.html', post=post, user_has_applied=user_has_applied,
+                               replies_html=replies_html, next_cursor=next_cursor)
 
-        nav = render_template('components/nav_logged_in.html') if current_user.is_authenticated else render_template(
-        'components/nav_logged_out.html')
-        return render_template('post_detail.html', post=post, nav=nav, user_has_applied=user_has_applied, replies = nested_replies)
+    # Define the "load more" route for replies: more top-level replies, or more replies to one reply
+    @app.route('/post/<int:post_id>/replies')
+    @login_required
+    def reply_feed(post_id):
+        version = db.session.scalar(select(Post.version).where(Post.id == post_id))
+        if version is None:
+            abort(404)
+        html, next_cursor = rendered_reply_page(post_id, version, request.args.get('parent', type=int),
+                                                request.args.get('cursor'))
+        return jsonify({'html': personalize_replies(html, post_id, current_user.id), 'next_cursor': next_cursor})
+
+    # Define the resized upload image route; derivatives are made on first request
+    @app.route('/image/<path:image_name>/<int:width>.<fmt>')
+    def image_derivative(image_name, width, fmt):
+        widths = {size for sizes in current_app.config['IMAGE_WIDTHS'].values() for size in sizes}
+        if fmt not in available_formats() or width not in widths:
+            abort(404)
+        path = derivative_store().get(image_name, width, fmt)
+        if path is None:
+            abort(404)
+        return send_file(path, mimetype=FORMATS[fmt][1], max_age=current_app.config['IMAGE_MAX_AGE'])
+
+    # Define the fragment cache statistics route (per worker process), for operators
+    @app.route('/fragment_cache/stats')
+    @operator_required
+    def fragment_cache_stats():
+        return jsonify(fragment_cache().stats())
+
+    # Define the SQL statistics route, per route (per worker process), with QUERY_STATS on, for operators
+    @app.route('/query_stats')
+    @operator_required
+    def query_stats_report():
+        stats = query_stats()
+        if stats is None:
+            abort(404)
+        return jsonify(stats.stats())
 
     # @app.route('/post/<int:post_id>')
     # def post_detail(post_id):
@@ -572,24 +554,51 @@ def init_app_routes(app):
     @app.route('/notification')
     @login_required
     def notification():
-        nav = render_template('components/nav_logged_in.html') if current_user.is_authenticated else render_template('components/nav_logged_out.html')
-        # Query notifications for the current user
-        notifications = Activity.query.filter(
-            Activity.target_user_id == current_user.id
-        ).order_by(Activity.timestamp.desc()).all()
-        return render_template('notification.html', page_name='Notification', nav=nav, notifications=notifications)
+        unread_count = unread_counter().get(current_user.id, current_user.notifications_seen_at)
+
+        # Opening the first page marks everything as read. This commits before the page is
+        # loaded, as a commit expires the loaded rows and each would then be read again
+        if not request.args.get('cursor'):
+            user_record().notifications_seen_at = datetime.utcnow()
+            db.session.commit()
+            unread_counter().set(current_user.id, 0)
+
+        # Query one page of notifications for the current user
+        notifications, next_cursor = notification_page(current_user.id, request.args.get('cursor'))
+        return render_template('notification.html', page_name='Notification', notifications=notifications,
+                               next_cursor=next_cursor, unread_count=unread_count)
+
+    # Define the infinite scroll route for notifications
+    @app.route('/notification/feed')
+    @login_required
+    def notification_feed():
+        notifications, next_cursor = notification_page(current_user.id, request.args.get('cursor'))
+        html = render_template('components/notification_items.html', notifications=notifications)
+        return jsonify({'html': html, 'next_cursor': next_cursor})
+
+    @app.route('/notification/unread')
+    @login_required
+    def notification_unread():
+        unread_count = unread_counter().get(current_user.id, current_user.notifications_seen_at)
+        return jsonify({'unread': unread_count, 'limit': current_app.config['UNREAD_NOTIFICATION_LIMIT']})
 
 
     @app.route('/activity')
     @login_required
     def activity():
-        nav = render_template('components/nav_logged_in.html') if current_user.is_authenticated else render_template('components/nav_logged_out.html')
-        # Query activities where the current user is either the actor or the target
-        activities = Activity.query.filter(
-            Activity.user_id == current_user.id
-        ).order_by(Activity.timestamp.desc()).all()
-        return render_template('activity.html', page_name='Activity', nav=nav, activities=activities)
-    
+        # Query one page of activities where the current user is the actor
+        activities, next_cursor = activity_page(current_user.id, request.args.get('cursor'))
+        return render_template('activity.html', page_name='Activity', activities=activities,
+                               next_cursor=next_cursor)
+
+    # Define the infinite scroll route for activities
+    @app.route('/activity/feed')
+    @login_required
+    def activity_feed():
+        activities, next_cursor = activity_page(current_user.id, request.args.get('cursor'))
+        html = render_template('components/activity_items.html', activities=activities)
+        return jsonify({'html': html, 'next_cursor': next_cursor})
+
     @app.route('/get_user_info/<username>')
     def get_user_info(username):
         user = User.query.filter_by(username=username).first()
@@ -0,0 +1,204 @@
+import re
+from flask import current_app
+from markupsafe import Markup, escape
+from sqlalchemy import Column, Integer, MetaData, Table, Text, event, func, literal_column, select
+from sqlalchemy.orm import contains_eager, joinedload
+from .models import db, User, Post
+
+# Markers put around matched terms by snippet(); they can't appear in escaped HTML
+MATCH_START, MATCH_END = '\x02', '\x03'
+
+# post_fts lives outside db.metadata: it is created by the DDL below, not by create_all's table DDL
+post_fts = Table('post_fts', MetaData(), Column('rowid', Integer), Column('title', Text),
+                 Column('content', Text), Column('username', Text))
+
+FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS post_fts USING fts5(title, content, username, prefix='2 3')",
+    # Keep the index in step with post and user rows
+    """CREATE TRIGGER IF NOT EXISTS post_fts_insert AFTER INSERT ON post BEGIN
+        INSERT INTO post_fts (rowid, title, content, username)
+        SELECT new.id, new.title, new.content, user.username FROM user WHERE user.id = new.created_by;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS post_fts_update AFTER UPDATE OF title, content, created_by ON post BEGIN
+        DELETE FROM post_fts WHERE rowid = old.id;
+        INSERT INTO post_fts (rowid, title, content, username)
+        SELECT new.id, new.title, new.content, user.username FROM user WHERE user.id = new.created_by;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS post_fts_delete AFTER DELETE ON post BEGIN
+        DELETE FROM post_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS post_fts_username AFTER UPDATE OF username ON user BEGIN
+        UPDATE post_fts SET username = new.username WHERE rowid IN (SELECT id FROM post WHERE created_by = new.id);
+    END""",
+]
+
+
+def fts5_supported(connection):
+    if connection.dialect.name != 'sqlite':
+        return False
+    return connection.exec_driver_sql("SELECT 1 FROM pragma_module_list WHERE name = 'fts5'").first() is not None
+
+
+@event.listens_for(db.metadata, 'after_create')
+def create_search_index(target, connection, **kw):
+    if fts5_supported(connection):
+        for statement in FTS_DDL:
+            connection.exec_driver_sql(statement)
+
+
+@event.listens_for(db.metadata, 'before_drop')
+def drop_search_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql('DROP TABLE IF EXISTS post_fts')
+
+
+def fts_enabled():
+    """Whether this database has the post_fts index (SQLite with FTS5, migrated)."""
+    enabled = current_app.extensions.get('fts_enabled')
+    if enabled is None:
+        with db.engine.connect() as connection:
+            enabled = fts5_supported(connection) and connection.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'post_fts'"
+            ).first() is not None
+        current_app.extensions['fts_enabled'] = enabled
+    return enabled
+
+
+def parse_query(query):
+    """Split a search string into OR'ed groups of words that must all match (as prefixes).
+
+    "corgi beach OR poodle" -> [['corgi', 'beach'], ['poodle']]
+    """
+    groups = [[]]
+    for word in re.findall(r'\w+', query):
+        if word == 'OR':
+            groups.append([])
+        else:
+            groups[-1].append(word.lower())
+    return [group for group in groups if group]
+
+
+def match_expression(query):
+    # Quote every word so user input can't use FTS5 query syntax; each word also matches as a prefix
+    return ' OR '.join('(' + ' '.join(f'"{term}"*' for term in group) + ')' for group in parse_query(query))
+
+
+def highlight(snippet):
+    return Markup(str(escape(snippet)).replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>'))
+
+
+class SearchBackend:
+    """Finds posts for a search string; search() returns (post, snippet) pairs, best match first."""
+    name = None
+
+    def search(self, query, limit, offset):
+        raise NotImplementedError
+
+
+class Fts5Backend(SearchBackend):
+    name = 'fts5'
+
+    def search(self, query, limit, offset):
+        return _fts_search(query, limit, offset)
+
+
+class LikeBackend(SearchBackend):
+    name = 'like'
+
+    def search(self, query, limit, offset):
+        return _like_search(query, limit, offset)
+
+
+def create_search_backend(app, name=None):
+    name = name or app.config['SEARCH_BACKEND']
+    if name == 'auto':
+        name = 'fts5' if fts_enabled() else 'inverted_index'
+    if name == 'fts5':
+        return Fts5Backend()
+    if name == 'inverted_index':
+        from .inverted_index import InvertedIndexBackend
+        return InvertedIndexBackend(app)
+    if name == 'like':
+        return LikeBackend()
+    raise ValueError(f'Unknown search backend: {name}')
+
+
+def get_search_backend():
+    """The app's search backend, picked from SEARCH_BACKEND on first use."""
+    backend = current_app.extensions.get('search_backend')
+    if backend is None:
+        backend = create_search_backend(current_app._get_current_object())
+        current_app.extensions['search_backend'] = backend
+    return backend
+
+
+def search_posts(query, page=1):
+    """Return one page of (post, snippet) results for `query`, best match first, and whether more exist."""
+    per_page = current_app.config['SEARCH_RESULTS_PER_PAGE']
+    results = get_search_backend().search(query, per_page + 1, (page - 1) * per_page)
+    return results[:per_page], len(results) > per_page
+
+
+def _fts_search(query, limit, offset):
+    expression = match_expression(query)
+    if not expression:
+        return []
+    fts = literal_column('post_fts')
+    snippet = func.snippet(fts, -1, MATCH_START, MATCH_END, '...', 16)
+    # bm25 weights: a hit in the title counts most, then the author's name, then the body
+    rank = func.bm25(fts, 10.0, 1.0, 5.0)
+
+    # Scoring every match of a very common word grows with the table, so only the newest
+    # SEARCH_CANDIDATE_LIMIT matches are ranked; FTS5 finds that rowid range from the index.
+    # Older matches are never returned, however well they score, so a search for a common
+    # word shows the best of its recent posts and at most that many results in all
+    oldest_candidate = (
+        select(post_fts.c.rowid)
+        .where(fts.op('MATCH')(expression))
+        .order_by(post_fts.c.rowid.desc())
+        .limit(1)
+        .offset(current_app.config['SEARCH_CANDIDATE_LIMIT'] - 1)
+        .correlate(None)
+        .scalar_subquery()
+    )
+    rows = db.session.execute(
+        select(Post, snippet)
+        .join(post_fts, post_fts.c.rowid == Post.id)
+        .options(joinedload(Post.user))
+        .where(fts.op('MATCH')(expression), post_fts.c.rowid >= func.coalesce(oldest_candidate, 0))
+        .order_by(rank)
+        .limit(limit)
+        .offset(offset)
+    ).all()
+    return [(post, highlight(snippet)) for post, snippet in rows]
+
+
+def _like_search(query, limit, offset):
+    # Unranked substring scan, newest first
+    pattern = f'%{query}%'
+    posts = Post.query.join(Post.user).options(contains_eager(Post.user)).filter(
+        Post.title.ilike(pattern) |
+        Post.content.ilike(pattern) |
+        User.username.ilike(pattern)
+    ).order_by(Post.created_at.desc(), Post.id.desc()).limit(limit).offset(offset).all()
+    return [(post, like_snippet(post.content, query)) for post in posts]
+
+
+def like_snippet(content, query, width=50):
+    start = content.lower().find(query.lower())
+    if start == -1:
+        return escape(content[:2 * width])
+    before = content[max(0, start - width):start]
+    match = content[start:start + len(query)]
+    after = content[start + len(query):start + len(query) + width]
+    return highlight(f'...{before}{MATCH_START}{match}{MATCH_END}{after}...')
+
+
+def term_snippet(content, terms, width=50):
+    """Highlight the first word in `content` that starts with one of `terms`."""
+    match = re.search(r'\b(?:' + '|'.join(map(re.escape, terms)) + r')\w*', content, re.IGNORECASE) if terms else None
+    if match is None:
+        return escape(content[:2 * width])
+    start, end = match.span()
+    return highlight(f'...{content[max(0, start - width):start]}{MATCH_START}{content[start:end]}{MATCH_END}'
+                     f'{content[end:end + width]}...')
@@ -0,0 +1,191 @@
+import random
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func, select, text
+from .avatars import avatar_numbers
+from .models import db, User, Post, Task, Reply, WaitingList, PostLike, ReplyLike, Activity
+from .passwords import hash_password
+
+SEED_PASSWORD = 'seed-password'  # Every seeded user's password, so load tests can log in as anyone
+CATEGORIES = ('Daily', 'Petsitting', 'Adoption')
+PET_TYPES = ('Dog', 'Cat', 'Bird', 'Fish', 'Reptile', 'Other')
+WORDS = ('dog cat puppy kitten walk park vet food toy leash collar bath groom train sit stay fetch ball '
+         'treat bowl bed crate adopt shelter rescue foster feed brush nail claw fur paw tail bark meow '
+         'parrot rabbit hamster fish tank cage hay carrot bone chew play nap cuddle sitter holiday').split()
+ACTIONS = ('replied to a post of ', 'liked a post from ', 'liked a reply from ', 'unliked a post from ',
+           'applied a task from ', 'deleted a reply to ')
+
+# Written parents first, so the foreign keys hold at every commit
+TABLE_ORDER = (User, Post, Task, WaitingList, PostLike, Reply, ReplyLike, Activity)
+TAIL = 1.5  # Pareto shape of replies per post and likes per post or reply
+TOP_LEVEL = 0.4  # Share of replies that start a thread rather than answer another reply
+BACK_AND_FORTH = 0.2  # Share that answer the reply just before them, which makes the deep chains
+MAX_REPLIES_PER_POST = 50000
+
+
+class Seeder:
+    """Appends a deterministic synthetic forum of any size to the database, in bulk.
+
+    Rows are built in memory and written chunk_size at a time with one executemany per
+    table, parents first. Their ids are assigned here, so replies, likes and tasks can point
+    at them without reading anything back, and the same counts and seed give the same rows.
+
+    Replies per post and likes per post or reply are heavy tailed: most posts get a few,
+    some get thousands. Within a post a reply starts a thread, answers the reply just
+    before it, or answers an earlier reply picked in proportion to the answers it already
+    has. That gives reply trees the power-law fanout of popular replies and the long thin
+    chains of conversations. The denormalized counters are filled in as the rows are
+    made, so no repair pass is needed.
+    """
+
+    def __init__(self, users, posts, replies=0, post_likes=0, reply_likes=0, activities=0, seed=0,
+                 chunk_size=10000, start=datetime(2025, 1, 1), days=365):
+        self.users = users
+        self.posts = posts
+        self.replies_per_post = replies / posts if posts else 0
+        self.likes_per_post = post_likes / posts if posts else 0
+        self.likes_per_reply = reply_likes / replies if replies else 0
+        self.activities = activities
+        self.chunk_size = chunk_size
+        self.rng = random.Random(seed)
+        self.start = start
+        self.span = timedelta(days=days)
+        self.stats = {}  # table: [rows, seconds spent writing them]
+        self._pending = {}
+        self._pending_rows = 0
+
+    def run(self, progress=None):
+        """Write everything and return {table: (rows, seconds)}.
+
+        `progress(table, done, total)` is called as each chunk of users, posts and activities is written.
+        """
+        self.ids = {model: db.session.scalar(select(func.max(model.id))) or 0
+                    for model in TABLE_ORDER if model is not Task}
+        db.session.commit()
+
+        self._seed_users(progress)
+        self._seed_posts(progress)
+        self._seed_activities(progress)
+
+        with db.engine.begin() as connection:
+            if connection.dialect.name == 'postgresql':
+                # The ids were given explicitly, so move the sequences past them
+                for model in self.ids:
+                    table = model.__table__.name
+                    connection.execute(text(f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), "
+                                            f'(SELECT max(id) FROM "{table}"))'))
+            connection.execute(text('ANALYZE'))
+        return {table: tuple(values) for table, values in self.stats.items()}
+
+    def _next_id(self, model):
+        self.ids[model] += 1
+        return self.ids[model]
+
+    def _add(self, model, row):
+        self._pending.setdefault(model, []).append(row)
+        self._pending_rows += 1
+
+    def _flush(self, force=False):
+        if self._pending_rows < self.chunk_size and not force:
+            return False
+        for model in TABLE_ORDER:
+            rows = self._pending.pop(model, ())
+            for start in range(0, len(rows), self.chunk_size):
+                started = time.perf_counter()
+                with db.engine.begin() as connection:
+                    connection.execute(model.__table__.insert(), rows[start:start + self.chunk_size])
+                stats = self.stats.setdefault(model.__table__.name, [0, 0.0])
+                stats[0] += len(rows[start:start + self.chunk_size])
+                stats[1] += time.perf_counter() - started
+        self._pending_rows = 0
+        return True
+
+    def _words(self, count):
+        return ' '.join(self.rng.choices(WORDS, k=count))
+
+    def _heavy_tailed(self, mean, cap):
+        # Pareto II (Lomax) with the given mean: mostly 0 to a few, now and then a great many
+        if mean <= 0:
+            return 0
+        value = mean * (TAIL - 1) * (self.rng.paretovariate(TAIL) - 1)
+        return min(int(value + self.rng.random()), cap)
+
+    def _some_users(self, count):
+        return self.rng.sample(self.user_ids, min(count, len(self.user_ids)))
+
+    def _seed_users(self, progress):
+        password_hash = hash_password(SEED_PASSWORD)  # Hashing is deliberately slow; once does for everyone
+        avatars = avatar_numbers(current_app.config['AVATAR_FOLDER'])  # The ones the sprite has
+        first = self.ids[User] + 1
+        for number in range(1, self.users + 1):
+            user_id = self._next_id(User)
+            self._add(User, {'id': user_id, 'username': f'seed{user_id}', 'email': f'seed{user_id}@example.com',
+                             'password_hash': password_hash, 'pet_type': self.rng.choice(PET_TYPES),
+                             'user_image': f'avatar{self.rng.choice(avatars)}.png',
+                             'join_at': self.start - timedelta(days=self.rng.randint(0, 365))})
+            if self._flush(force=number == self.users) and progress:
+                progress('user', number, self.users)
+        self.user_ids = range(first, self.ids[User] + 1)
+
+    def _seed_posts(self, progress):
+        step = self.span / max(self.posts, 1)
+        for number in range(1, self.posts + 1):
+            post_id = self._next_id(Post)
+            created_at = self.start + step * number
+            is_task = self.rng.random() < 0.2
+            likers = self._some_users(self._heavy_tailed(self.likes_per_post, len(self.user_ids)))
+            replies = self._reply_tree(post_id, created_at)
+            self._add(Post, {'id': post_id, 'title': self._words(6), 'content': self._words(40),
+                             'category': self.rng.choice(CATEGORIES), 'is_task': is_task,
+                             'created_by': self.rng.choice(self.user_ids), 'created_at': created_at,
+                             'like_count': len(likers), 'reply_count': len(replies)})
+            if is_task:
+                self._add(Task, {'id': post_id, 'status': self.rng.random() < 0.7})
+                for user_id in self._some_users(self.rng.randint(0, 5)):
+                    self._add(WaitingList, {'id': self._next_id(WaitingList), 'task_id': post_id,
+                                            'user_id': user_id, 'applied_at': created_at})
+            for user_id in likers:
+                self._add(PostLike, {'id': self._next_id(PostLike), 'user_id': user_id, 'post_id': post_id,
+                                     'timestamp': created_at})
+            for reply in replies:
+                self._add(Reply, reply)
+            if self._flush(force=number == self.posts) and progress:
+                progress('post', number, self.posts)
+
+    def _reply_tree(self, post_id, created_at):
+        replies = []
+        answerable = []  # Each reply once, plus once more per answer it has: preferential attachment
+        posted_at = created_at
+        for index in range(self._heavy_tailed(self.replies_per_post, MAX_REPLIES_PER_POST)):
+            posted_at += timedelta(seconds=self.rng.randint(1, 3600))
+            draw = self.rng.random()
+            if not replies or draw < TOP_LEVEL:
+                parent = None
+            elif draw < TOP_LEVEL + BACK_AND_FORTH:
+                parent = index - 1
+            else:
+                parent = self.rng.choice(answerable)
+            reply_id = self._next_id(Reply)
+            likers = self._some_users(self._heavy_tailed(self.likes_per_reply, len(self.user_ids)))
+            for user_id in likers:
+                self._add(ReplyLike, {'id': self._next_id(ReplyLike), 'user_id': user_id, 'reply_id': reply_id,
+                                      'timestamp': posted_at})
+            replies.append({'id': reply_id, 'post_id': post_id, 'reply_by': self.rng.choice(self.user_ids),
+                            'parent_reply_id': None if parent is None else replies[parent]['id'],
+                            'content': self._words(15), 'post_at': posted_at, 'like_count': len(likers),
+                            'child_count': 0})
+            answerable.append(index)
+            if parent is not None:
+                replies[parent]['child_count'] += 1
+                answerable.append(parent)
+        return replies
+
+    def _seed_activities(self, progress):
+        step = self.span / max(self.activities, 1)
+        for number in range(1, self.activities + 1):
+            self._add(Activity, {'id': self._next_id(Activity), 'user_id': self.rng.choice(self.user_ids),
+                                 'action': self.rng.choice(ACTIONS), 'target_user_id': self.rng.choice(self.user_ids),
+                                 'timestamp': self.start + step * number})
+            if self._flush(force=number == self.activities) and progress:
+                progress('activity', number, self.activities)
@@ -0,0 +1,42 @@
+/* Infinite scroll: fetch the next page when a ".infinite-scroll" link comes into view */
+document.addEventListener("DOMContentLoaded", function () {
+  document.querySelectorAll(".infinite-scroll").forEach(function (link) {
+    var target = document.getElementById(link.dataset.target);
+    var loading = false;
+
+    function loadNextPage() {
+      if (loading || !link.dataset.cursor) {
+        return;
+      }
+      loading = true;
+      fetch(link.dataset.url + "?" + new URLSearchParams({ cursor: link.dataset.cursor }))
+        .then((response) => response.json())
+        .then((data) => {
+          target.insertAdjacentHTML("beforeend", data.html);
+          if (data.next_cursor) {
+            link.dataset.cursor = data.next_cursor;
+          } else {
+            observer.disconnect();
+            link.remove();
+          }
+          loading = false;
+        })
+        .catch((error) => {
+          console.error("Error:", error);
+          loading = false;
+        });
+    }
+
+    var observer = new IntersectionObserver(function (entries) {
+      if (entries[0].isIntersecting) {
+        loadNextPage();
+      }
+    });
+    observer.observe(link);
+
+    link.addEventListener("click", function (event) {
+      event.preventDefault();
+      loadNextPage();
+    });
+  });
+});
@@ -0,0 +1,32 @@
+/* Reply threads: fetch more replies when a ".load-more-replies" link is clicked */
+document.addEventListener("click", function (event) {
+  var link = event.target.closest(".load-more-replies");
+  if (!link) {
+    return;
+  }
+  event.preventDefault();
+  if (link.dataset.loading) {
+    return;
+  }
+  link.dataset.loading = "true";
+
+  var url = link.dataset.url;
+  if (link.dataset.cursor) {
+    url += (url.includes("?") ? "&" : "?") + new URLSearchParams({ cursor: link.dataset.cursor });
+  }
+  fetch(url)
+    .then((response) => response.json())
+    .then((data) => {
+      document.getElementById(link.dataset.target).insertAdjacentHTML("beforeend", data.html);
+      if (data.next_cursor) {
+        link.dataset.cursor = data.next_cursor;
+        delete link.dataset.loading;
+      } else {
+        link.remove();
+      }
+    })
+    .catch((error) => {
+      console.error("Error:", error);
+      delete link.dataset.loading;
+    });
+});
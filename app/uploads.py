@@ -0,0 +1,101 @@
+import hashlib
+import os
+import shutil
+import time
+import uuid
+from flask import current_app
+from sqlalchemy import select
+from .models import db, Post
+
+CHUNK_SIZE = 1024 * 1024
+# Spellings of one format share a blob
+EXTENSIONS = {'jpeg': 'jpg'}
+
+
+class UploadStore:
+    """Uploaded images, each distinct file stored once.
+
+    A blob is named after the SHA-256 of its bytes as uploaded, sharded as
+    ab/cd/<hash>.<ext>, and that name is what Post.image_name holds. A blob is
+    referenced by every post whose image_name is its name and is unlinked when
+    the last of them is deleted. Older uploads keep their flat uuid names.
+    """
+
+    def __init__(self, folder, incoming_folder):
+        self.folder = folder
+        self.incoming_folder = incoming_folder
+
+    @staticmethod
+    def blob_name(digest, extension):
+        extension = extension.lower()
+        return f'{digest[:2]}/{digest[2:4]}/{digest}.{EXTENSIONS.get(extension, extension)}'
+
+    def path(self, name):
+        return os.path.join(self.folder, name)
+
+    def exists(self, name):
+        return os.path.isfile(self.path(name))
+
+    def receive(self, stream, extension):
+        """Copy an upload into the incoming folder, hashing it on the way.
+
+        Returns (blob name, incoming path).
+        """
+        os.makedirs(self.incoming_folder, exist_ok=True)
+        path = os.path.join(self.incoming_folder, f'{uuid.uuid4()}.part')
+        sha = hashlib.sha256()
+        with open(path, 'wb') as incoming:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                sha.update(chunk)
+                incoming.write(chunk)
+        return self.blob_name(sha.hexdigest(), extension), path
+
+    def add_file(self, source):
+        """Store a copy of a local file (the demo data's sample images) and return its blob name."""
+        sha = hashlib.sha256()
+        with open(source, 'rb') as original:
+            for chunk in iter(lambda: original.read(CHUNK_SIZE), b''):
+                sha.update(chunk)
+        name = self.blob_name(sha.hexdigest(), source.rsplit('.', 1)[1])
+        if not self.exists(name):
+            os.makedirs(os.path.dirname(self.path(name)), exist_ok=True)
+            temporary = f'{self.path(name)}.{os.getpid()}.tmp'
+            shutil.copyfile(source, temporary)
+            os.replace(temporary, self.path(name))
+        return name
+
+    def release(self, names):
+        """Unlink the blobs among `names` that no post refers to any more; returns how many went."""
+        names = {name for name in names if name}
+        if not names:
+            return 0
+        referenced = set(db.session.scalars(select(Post.image_name).where(Post.image_name.in_(names)).distinct()))
+        removed = 0
+        for name in names - referenced:
+            try:
+                os.remove(self.path(name))
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def orphans(self, grace):
+        """Upload files no post refers to, untouched for `grace` seconds (younger ones may be mid-upload)."""
+        allowed = current_app.config['ALLOWED_EXTENSIONS'] | set(EXTENSIONS.values())
+        referenced = set(db.session.scalars(select(Post.image_name).where(Post.image_name.is_not(None)).distinct()))
+        cutoff = time.time() - grace
+        for root, _, files in os.walk(self.folder):
+            for file in files:
+                path = os.path.join(root, file)
+                name = os.path.relpath(path, self.folder).replace(os.sep, '/')
+                if (name not in referenced and file.rsplit('.', 1)[-1].lower() in allowed
+                        and os.path.getmtime(path) < cutoff):
+                    yield path
+
+
+def upload_store():
+    return current_app.extensions['uploads']
+
+
+def init_uploads(app):
+    app.extensions['uploads'] = UploadStore(app.config['UPLOAD_FOLDER'], app.config['IMAGE_INCOMING_FOLDER'])
@@ -0,0 +1,362 @@
+"""Replay a realistic request mix against a large seeded forum and report latency per route.
+
+    python benchmarks/http_benchmark.py --output results.json
+    python benchmarks/http_benchmark.py --db /tmp/bench.db --compare results.json
+
+Seeds a throwaway SQLite database with flask seed's Seeder (kept with --db for reruns),
+then sends the same deterministic mix of feed, category, hot thread, search, like, reply
+and notification requests, as a handful of logged-in users, twice: through the Flask test
+client in this process, and over HTTP to a threaded werkzeug server in a child process.
+Reports p50/p95/p99 latency and queries per request for each route and the throughput
+of each run, and writes them as JSON so two commits can be diffed. Exits non-zero on
+failed requests or when a route's p95 through the test client, which measures the app
+alone with one request at a time, is over its budget.
+"""
+import argparse
+import http.client
+import http.cookies
+import json
+import logging
+import math
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+
+from sqlalchemy import select
+from app import create_app
+from app.config import Config
+from app.models import db, User, Post
+from app.queries import feed_page
+from app.seeder import Seeder, SEED_PASSWORD, CATEGORIES, WORDS
+
+QUERY_HEADER = 'X-Query-Count'  # Added by query_stats.py with QUERY_STATS_HEADER
+HOT_THREADS = 50  # Posts with the most replies, visited with Zipf weights
+
+# route: (share of the mix, p95 budget in milliseconds through the test client)
+MIX = {
+    'home': (25, 20),
+    'category': (10, 20),
+    'feed': (5, 20),
+    'post_detail': (20, 150),
+    'search': (10, 50),
+    'like_post': (10, 20),
+    'reply': (5, 20),
+    'notification': (5, 20),
+    'notification_unread': (10, 10),
+}
+
+
+def make_app(database):
+    class BenchmarkConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + database
+        DB_REPLICAS = []
+        QUERY_STATS = True  # For the query count header
+        QUERY_STATS_HEADER = True
+
+    logging.getLogger('app.query_stats').setLevel(logging.ERROR)  # The counts are reported below instead
+    return create_app(BenchmarkConfig)
+
+
+def seed(app, args):
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        stats = Seeder(args.users, args.posts, args.replies, args.post_likes, args.reply_likes,
+                       args.activities, args.seed).run()
+        rows = sum(rows for rows, _ in stats.values())
+        print(f'Seeded {rows:,} rows in {time.perf_counter() - started:.1f}s', file=sys.stderr)
+
+
+def plan(app, clients, count, seed_value):
+    """The logged-in users and `count` requests to replay, each (route, user index, method, path, form)."""
+    rng = random.Random(seed_value)
+    with app.app_context():
+        usernames = db.session.scalars(select(User.username).where(User.username.like('seed%'))
+                                       .order_by(User.id)).all()
+        hot = db.session.scalars(select(Post.id).order_by(Post.reply_count.desc(), Post.id)
+                                 .limit(HOT_THREADS)).all()
+        _, cursor = feed_page()
+        db.session.remove()
+    if not usernames or not hot:
+        sys.exit('The database has no seeded users or posts.')
+    users = rng.sample(usernames, min(clients, len(usernames)))
+    hot_weights = [1 / rank for rank in range(1, len(hot) + 1)]
+
+    def build(route):
+        post_id = rng.choices(hot, weights=hot_weights)[0]
+        if route == 'home':
+            return 'GET', '/', None
+        if route == 'category':
+            return 'GET', '/?' + urlencode({'category': rng.choice(CATEGORIES)}), None
+        if route == 'feed':
+            return 'GET', '/feed?' + urlencode({'cursor': cursor or ''}), None
+        if route == 'post_detail':
+            return 'GET', f'/post/{post_id}', None
+        if route == 'search':
+            return 'GET', '/search?' + urlencode({'query': ' '.join(rng.sample(WORDS, rng.randint(1, 2)))}), None
+        if route == 'like_post':
+            return 'POST', f'/like_post/{post_id}', {}
+        if route == 'reply':
+            return 'POST', f'/reply/{post_id}', {'content': ' '.join(rng.choices(WORDS, k=12))}
+        if route == 'notification':
+            return 'GET', '/notification', None
+        return 'GET', '/notification/unread', None
+
+    routes = rng.choices(list(MIX), weights=[share for share, _ in MIX.values()], k=count)
+    return users, [(route, rng.randrange(len(users)), *build(route)) for route in routes]
+
+
+class TestClientRunner:
+    def __init__(self, app, users):
+        self.clients = []
+        for username in users:
+            client = app.test_client()
+            response = client.post('/login', data={'username': username, 'password': SEED_PASSWORD})
+            if response.status_code != 302:
+                sys.exit(f'Logging in as {username} answered {response.status_code}')
+            self.clients.append(client)
+
+    def send(self, user, method, path, form):
+        response = self.clients[user].open(path, method=method, data=form)
+        response.get_data()
+        return response.status_code, response.headers.get(QUERY_HEADER)
+
+
+class HTTPRunner:
+    """Sends requests over real sockets, keeping each user's session cookie like a browser would."""
+
+    def __init__(self, host, port, users):
+        self.host, self.port = host, port
+        self.cookies = [http.cookies.SimpleCookie() for _ in users]
+        for user, username in enumerate(users):
+            status, _ = self.send(user, 'POST', '/login', {'username': username, 'password': SEED_PASSWORD})
+            if status != 302:
+                sys.exit(f'Logging in as {username} answered {status}')
+
+    def send(self, user, method, path, form):
+        headers = {'Cookie': '; '.join(f'{name}={morsel.value}' for name, morsel in self.cookies[user].items())}
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        try:
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            response.read()
+        finally:
+            connection.close()
+        for header in response.headers.get_all('Set-Cookie') or ():
+            self.cookies[user].load(header)
+        return response.status, response.headers.get(QUERY_HEADER)
+
+
+def replay(runner, requests, concurrency=1):
+    """Send every request, `concurrency` at a time; returns (seconds, [(route, ms, status, queries)])."""
+    results = []
+    lock = threading.Lock()
+
+    def worker(share):
+        timings = []
+        for route, user, method, path, form in share:
+            started = time.perf_counter()
+            status, queries = runner.send(user, method, path, form)
+            timings.append((route, (time.perf_counter() - started) * 1000, status,
+                            None if queries is None else int(queries)))
+        with lock:
+            results.extend(timings)
+
+    # Each thread keeps to its own users, so one user's requests still arrive in order
+    shares = [[entry for entry in requests if entry[1] % concurrency == number] for number in range(concurrency)]
+    threads = [threading.Thread(target=worker, args=(share,)) for share in shares]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, results
+
+
+def percentile(values, fraction):
+    return values[max(math.ceil(fraction * len(values)) - 1, 0)]
+
+
+def summarize(seconds, results):
+    routes = {}
+    for route in MIX:
+        timings = sorted(ms for name, ms, _, _ in results if name == route)
+        if not timings:
+            continue
+        queries = [count for name, _, _, count in results if name == route and count is not None]
+        routes[route] = {
+            'requests': len(timings),
+            'errors': sum(1 for name, _, status, _ in results if name == route and status >= 400),
+            'p50_ms': round(percentile(timings, 0.50), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'p99_ms': round(percentile(timings, 0.99), 2),
+            'queries_mean': round(sum(queries) / len(queries), 2) if queries else None,
+            'queries_max': max(queries) if queries else None,
+        }
+    return {'seconds': round(seconds, 3), 'requests_per_second': round(len(results) / seconds, 1),
+            'routes': routes}
+
+
+def serve(port):
+    """Run the app on a threaded werkzeug server and print the port, for the parent to connect to."""
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    database = os.environ['DATABASE_URL'][len('sqlite:///'):]
+    server = make_server('127.0.0.1', port, make_app(database), threaded=True)
+    print(server.server_port, flush=True)
+    server.serve_forever()
+
+
+def run_server_mode(database, users, warmup, requests, concurrency):
+    environment = dict(os.environ, DATABASE_URL='sqlite:///' + database)
+    child = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve'], cwd=ROOT, env=environment,
+                             stdout=subprocess.PIPE, text=True)
+    try:
+        line = child.stdout.readline()
+        if not line.strip():
+            sys.exit('The server did not start.')
+        runner = HTTPRunner('127.0.0.1', int(line), users)
+        replay(runner, warmup)
+        return replay(runner, requests, concurrency)
+    finally:
+        child.terminate()
+        child.wait()
+
+
+def print_report(mode, summary, budget_scale=None):
+    """Print one run's table; returns the routes over budget, when `budget_scale` is given."""
+    print(f'{mode}: {summary["requests_per_second"]:,.1f} requests/s')
+    print(f'  {"route":<22}{"n":>6}{"p50":>9}{"p95":>9}{"p99":>9}{"queries":>9}{"  budget" if budget_scale else ""}')
+    over = []
+    for route, stats in summary['routes'].items():
+        queries = '-' if stats['queries_mean'] is None else f'{stats["queries_mean"]:.1f}'
+        verdict = ''
+        if budget_scale:
+            budget = MIX[route][1] * budget_scale
+            verdict = f'  {budget:.0f} ms{", OVER" if stats["p95_ms"] > budget else ""}'
+            if stats['p95_ms'] > budget:
+                over.append(route)
+        print(f'  {route:<22}{stats["requests"]:>6}{stats["p50_ms"]:>9.1f}{stats["p95_ms"]:>9.1f}'
+              f'{stats["p99_ms"]:>9.1f}{queries:>9}{verdict}')
+    return over
+
+
+def print_comparison(baseline, results):
+    print(f'against {baseline.get("commit") or "the baseline"}:')
+    if baseline.get('settings') != results['settings']:
+        print('  (the runs used different settings, so the numbers are not comparable)')
+    for mode, summary in results['modes'].items():
+        before = baseline.get('modes', {}).get(mode)
+        if not before:
+            continue
+        change = summary['requests_per_second'] / before['requests_per_second'] - 1
+        print(f'{mode}: throughput {change:+.0%}')
+        for route, stats in summary['routes'].items():
+            old = before['routes'].get(route)
+            if not old:
+                continue
+            queries = ''
+            if stats['queries_mean'] is not None and old['queries_mean'] is not None:
+                queries = f'  queries {old["queries_mean"]:.1f} -> {stats["queries_mean"]:.1f}'
+            print(f'  {route:<22}p95 {old["p95_ms"]:>8.1f} -> {stats["p95_ms"]:>8.1f} ms'
+                  f' ({stats["p95_ms"] / old["p95_ms"] - 1:+.0%}){queries}')
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', help='SQLite file to seed once and reuse (default: a temporary one)')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--posts', type=int, default=20000)
+    parser.add_argument('--replies', type=int, default=200000)
+    parser.add_argument('--post-likes', type=int, default=200000)
+    parser.add_argument('--reply-likes', type=int, default=200000)
+    parser.add_argument('--activities', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0, help='for both the data and the request mix')
+    parser.add_argument('--requests', type=int, default=2000, help='requests per run')
+    parser.add_argument('--warmup', type=int, default=100, help='requests sent first and not measured')
+    parser.add_argument('--clients', type=int, default=8, help='logged-in users sending the requests')
+    parser.add_argument('--concurrency', type=int, default=4, help='requests in flight against the server')
+    parser.add_argument('--mode', choices=('both', 'test_client', 'server'), default='both')
+    parser.add_argument('--budget-scale', type=float, default=1.0, help='multiply every p95 budget, for slow machines')
+    parser.add_argument('--output', help='write the results here as JSON')
+    parser.add_argument('--compare', help='JSON from an earlier run to compare against')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        return serve(0)
+
+    directory = None
+    if args.db:
+        database = os.path.abspath(args.db)
+    else:
+        directory = tempfile.mkdtemp()
+        database = os.path.join(directory, 'http_benchmark.db')
+    try:
+        app = make_app(database)
+        if not os.path.exists(database):
+            seed(app, args)
+        users, requests = plan(app, args.clients, args.requests, args.seed)
+        _, warmup = plan(app, args.clients, args.warmup, args.seed + 1)
+
+        modes = {}
+        if args.mode in ('both', 'test_client'):
+            runner = TestClientRunner(app, users)
+            replay(runner, warmup)
+            modes['test_client'] = summarize(*replay(runner, requests))
+        if args.mode in ('both', 'server'):
+            modes['server'] = summarize(*run_server_mode(database, users, warmup, requests, args.concurrency))
+    finally:
+        if directory:
+            shutil.rmtree(directory)
+
+    results = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'settings': {name: getattr(args, name) for name in ('users', 'posts', 'replies', 'post_likes', 'reply_likes',
+                                                             'activities', 'seed', 'requests', 'warmup', 'clients',
+                                                             'concurrency')},
+        'modes': modes,
+    }
+    over = []
+    for mode, summary in modes.items():
+        over += print_report(mode, summary, args.budget_scale if mode == 'test_client' else None)
+    if args.compare:
+        with open(args.compare) as file:
+            print_comparison(json.load(file), results)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+            file.write('\n')
+
+    errors = sum(stats['errors'] for summary in modes.values() for stats in summary['routes'].values())
+    if errors:
+        sys.exit(f'{errors} request(s) failed.')
+    if over:
+        sys.exit(f'Over budget: {", ".join(over)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Compare the bytes a feed card downloads for each upload with and without derivatives.
+
+    python benchmarks/image_benchmark.py
+
+Makes (or reuses) the card derivatives of every file in UPLOAD_FOLDER and reports total
+sizes and the time taken to make one derivative from a cold cache. Then times a
+post_create upload of the largest file with processing in the request and in the pool.
+"""
+import argparse
+import io
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app
+from app.config import Config, TestingConfig
+from app.images import DerivativeStore, available_formats
+from app.models import db, User
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--kind', default='card', help='a key of IMAGE_WIDTHS')
+    parser.add_argument('--sample', type=int, default=5, help='uploads to time cold derivative creation on')
+    args = parser.parse_args()
+
+    app = create_app(Config)
+    with app.app_context():
+        formats = available_formats()
+        if not formats:
+            sys.exit('Pillow is not installed.')
+        config = app.config
+        names = sorted(name for name in os.listdir(config['UPLOAD_FOLDER'])
+                       if os.path.isfile(os.path.join(config['UPLOAD_FOLDER'], name)))
+        store = DerivativeStore(config['UPLOAD_FOLDER'], config['IMAGE_CACHE_FOLDER'], config['IMAGE_QUALITY'])
+        width = config['IMAGE_WIDTHS'][args.kind][-1]  # What a 2x screen downloads
+
+        original = sum(os.path.getsize(store.source_path(name)) for name in names)
+        print(f'{len(names)} uploads, {width}px wide {args.kind} images')
+        print(f'{"original":<10}{original / 1e6:>10.2f} MB')
+        for fmt in formats:
+            total = sum(os.path.getsize(store.get(name, width, fmt)) for name in names)
+            print(f'{fmt:<10}{total / 1e6:>10.2f} MB{original / total:>8.1f}x smaller')
+
+        cold = DerivativeStore(config['UPLOAD_FOLDER'], tempfile.mkdtemp(), config['IMAGE_QUALITY'])
+        try:
+            for fmt in formats:
+                timings = []
+                for name in names[:args.sample]:
+                    started = time.perf_counter()
+                    cold.get(name, width, fmt)
+                    timings.append((time.perf_counter() - started) * 1000)
+                print(f'cold {fmt:<5}{statistics.median(timings):>10.1f} ms median per derivative')
+        finally:
+            shutil.rmtree(cold.folder)
+
+        largest = max(names, key=lambda name: os.path.getsize(store.source_path(name)))
+        with open(store.source_path(largest), 'rb') as upload:
+            data = upload.read()
+    print(f'post_create with a {len(data) / 1e6:.1f} MB upload:')
+    for asynchronous in (False, True):
+        print(f'{"queued" if asynchronous else "in request":<12}{time_upload(data, largest, asynchronous):>10.1f} ms')
+
+
+def time_upload(data, name, asynchronous):
+    directory = tempfile.mkdtemp()
+
+    class UploadConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(directory, 'upload.db')
+        UPLOAD_FOLDER = os.path.join(directory, 'uploads')
+        IMAGE_CACHE_FOLDER = os.path.join(directory, 'derived')
+        IMAGE_INCOMING_FOLDER = os.path.join(directory, 'incoming')
+        IMAGE_JOBS_ASYNC = asynchronous
+
+    app = create_app(UploadConfig)
+    try:
+        with app.app_context():
+            db.create_all()
+            user = User(username='bench', email='bench@example.com')
+            user.password = 'password123'
+            db.session.add(user)
+            db.session.commit()
+            client = app.test_client()
+            client.post('/login', data={'username': 'bench', 'password': 'password123'})
+            started = time.perf_counter()
+            client.post('/post_create', data={'title': 'Upload', 'content': 'Timing', 'image': (io.BytesIO(data), name)},
+                        content_type='multipart/form-data')
+            elapsed = (time.perf_counter() - started) * 1000
+            app.extensions['image_jobs'].drain()
+            app.extensions['image_jobs'].shutdown()
+        return elapsed
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Compare rendering the navbar on every request with the memoized nav_bar() helper.
+
+    python benchmarks/nav_benchmark.py --repeat 2000
+
+Uses an in-memory database with one user who has a few unread notifications, and
+reports the mean cost of producing the logged-in navbar and of a full home page request.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import render_template
+from flask_login import login_user
+from app import create_app
+from app.config import TestingConfig
+from app.models import db, User, Activity
+from app.nav import nav_bar
+from app.queries import unread_notification_count
+
+
+def legacy_nav(user):
+    # What every route did before: render the nav template and count unread notifications
+    unread_notification_count(user.id, user.notifications_seen_at)
+    return render_template('components/nav_logged_in.html')
+
+
+def mean_us(function, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    app = create_app(TestingConfig)
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench', email='bench@example.com')
+        user.password = 'password123'
+        actor = User(username='actor', email='actor@example.com')
+        db.session.add_all([user, actor])
+        db.session.flush()
+        db.session.add_all([Activity(user_id=actor.id, action='liked a post from', target_user_id=user.id)
+                            for _ in range(5)])
+        db.session.commit()
+
+        with app.test_request_context('/'):
+            login_user(user)
+            per_request = mean_us(lambda: legacy_nav(user), args.repeat)
+            memoized = mean_us(nav_bar, args.repeat)
+        print(f'{"navbar per request":<28}{per_request:>10.1f}us')
+        print(f'{"nav_bar() memoized":<28}{memoized:>10.1f}us')
+
+        client = app.test_client()
+        client.post('/login', data={'username': 'bench', 'password': 'password123'})
+        print(f'{"home page request":<28}{mean_us(lambda: client.get("/"), args.repeat // 10):>10.1f}us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""Compare search latency of the old ILIKE scan with the FTS5 and in-process indexes.
+
+    python benchmarks/search_benchmark.py --posts 1000000
+
+Seeds a throwaway SQLite database (kept with --db for reruns) and reports the median
+latency of each search path for a handful of queries.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import insert
+from app import create_app
+from app.config import Config
+from app.models import db, User, Post
+from app.inverted_index import InvertedIndexBackend
+from app.search import _fts_search, _like_search
+
+WORDS = ('dog cat puppy kitten walk park vet food toy leash collar bath groom train sit stay fetch ball '
+         'treat bowl bed crate adopt shelter rescue foster feed brush nail claw fur paw tail bark meow '
+         'parrot rabbit hamster fish tank cage hay carrot bone chew play nap cuddle sitter holiday').split()
+QUERIES = ['corgi', 'dog', 'puppy walk', 'hams', 'foster shelter rescue', 'kaon', 'user42']
+
+
+# Pad the vocabulary with made-up words and draw with Zipf weights, like natural text
+VOCABULARY = WORDS + [f'{a}{b}{c}' for a in 'bdfgklmnprst' for b in 'aeiou' for c in ('ber', 'dle', 'ix', 'on', 'up')]
+CUM_WEIGHTS = []
+for rank in range(1, len(VOCABULARY) + 1):
+    CUM_WEIGHTS.append((CUM_WEIGHTS[-1] if CUM_WEIGHTS else 0) + 1 / rank)
+
+
+def sentence(rng, words):
+    return ' '.join(rng.choices(VOCABULARY, cum_weights=CUM_WEIGHTS, k=words))
+
+
+def seed(posts, users=1000, chunk=10000):
+    rng = random.Random(5505)
+    db.session.execute(insert(User), [
+        {'username': f'user{i}', 'email': f'user{i}@example.com', 'user_image': 'avatar1.png'}
+        for i in range(users)
+    ])
+    started = time.perf_counter()
+    for start in range(0, posts, chunk):
+        db.session.execute(insert(Post), [
+            {'title': sentence(rng, 6), 'content': sentence(rng, 60), 'category': 'Daily',
+             'created_by': rng.randint(1, users)}
+            for _ in range(start, min(start + chunk, posts))
+        ])
+        db.session.commit()
+    # A handful of rare matches, as real searches usually look for something specific
+    db.session.execute(insert(Post), [
+        {'title': 'My corgi', 'content': 'A corgi story', 'created_by': 1} for _ in range(10)
+    ])
+    db.session.commit()
+    print(f'Seeded {posts} posts in {time.perf_counter() - started:.1f}s')
+
+
+def legacy_search(query):
+    # The pre-FTS search(): unbounded ILIKE scan over three columns
+    return Post.query.join(User).filter(
+        Post.title.ilike(f'%{query}%') |
+        Post.content.ilike(f'%{query}%') |
+        User.username.ilike(f'%{query}%')
+    ).all()
+
+
+def median_ms(function, query, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(query)
+        timings.append((time.perf_counter() - started) * 1000)
+        db.session.remove()
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--posts', type=int, default=1000000)
+    parser.add_argument('--db', help='SQLite file to use; seeded only if it does not exist')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), 'search_benchmark.db')
+    needs_seed = not os.path.exists(path)
+
+    class BenchmarkConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + path
+        ACTIVITY_ASYNC = False
+        SEARCH_INDEX_SNAPSHOT = None
+
+    app = create_app(BenchmarkConfig)
+    with app.app_context():
+        if needs_seed:
+            db.create_all()
+            seed(args.posts)
+        per_page = app.config['SEARCH_RESULTS_PER_PAGE'] + 1
+
+        inverted = InvertedIndexBackend(app)
+        started = time.perf_counter()
+        inverted.get_index()
+        print(f'Built the inverted index in {time.perf_counter() - started:.1f}s')
+        inverted.refresh_interval = float('inf')
+
+        print(f'{"query":<24}{"legacy ILIKE":>14}{"LIKE page":>12}{"FTS5 page":>12}{"inverted":>12}')
+        for query in QUERIES:
+            legacy = median_ms(legacy_search, query, args.repeat)
+            like = median_ms(lambda q: _like_search(q, per_page, 0), query, args.repeat)
+            fts = median_ms(lambda q: _fts_search(q, per_page, 0), query, args.repeat)
+            index = median_ms(lambda q: inverted.search(q, per_page, 0), query, args.repeat)
+            print(f'{query:<24}{legacy:>12.1f}ms{like:>10.1f}ms{fts:>10.1f}ms{index:>10.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
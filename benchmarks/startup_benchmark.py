@@ -0,0 +1,103 @@
+"""Measure how long a new process takes to import the app, create it and answer its first request.
+
+    python benchmarks/startup_benchmark.py --runs 5
+
+Every run is a fresh interpreter started with -X importtime, against a database made by
+flask init-db in a temporary directory. Reports the medians and the slowest
+imports, and exits non-zero when a median is over its budget, so it can gate changes.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+CHILD = """
+import json, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+status = app.test_client().get('/').status_code
+answered = time.perf_counter()
+print(json.dumps({'status': status, 'import': (imported - started) * 1000,
+                  'create_app': (created - imported) * 1000, 'first_request': (answered - created) * 1000}))
+"""
+
+
+def parse_importtime(output):
+    """{module: cumulative microseconds} for the top two levels of the import tree, less the app itself."""
+    modules = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2  # Each level is indented by two more spaces
+        if depth <= 1 and name.strip() != 'app':
+            modules[name.strip()] = modules.get(name.strip(), 0) + int(cumulative)
+    return modules
+
+
+def run_once(environment):
+    started = time.perf_counter()
+    child = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD], cwd=ROOT, env=environment,
+                           capture_output=True, text=True, check=True)
+    timings = json.loads(child.stdout.strip().splitlines()[-1])
+    if timings.pop('status') != 200:
+        sys.exit('The first request failed:\n' + child.stderr)
+    timings['process'] = (time.perf_counter() - started) * 1000
+    return timings, parse_importtime(child.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-import', type=float, default=600, help='milliseconds to import the app package')
+    parser.add_argument('--budget-create-app', type=float, default=150, help='milliseconds for create_app()')
+    parser.add_argument('--budget-first-request', type=float, default=400, help='milliseconds for the first request')
+    parser.add_argument('--top', type=int, default=10, help='slowest imports to list')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    environment = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(directory, 'startup.db'),
+                       SECRET_KEY='startup-benchmark', FLASK_APP='run')
+    environment.pop('FLASK_RUN_FROM_CLI', None)
+    try:
+        subprocess.run([sys.executable, '-m', 'flask', 'init-db'], cwd=ROOT, env=environment,
+                       capture_output=True, check=True)
+        runs = [run_once(environment) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(directory)
+
+    budgets = {'import': args.budget_import, 'create_app': args.budget_create_app,
+               'first_request': args.budget_first_request, 'process': None}
+    over = []
+    print(f'{args.runs} runs, medians:')
+    for name, budget in budgets.items():
+        median = statistics.median(timings[name] for timings, _ in runs)
+        verdict = '' if budget is None else f'  (budget {budget:.0f} ms{", OVER" if median > budget else ""})'
+        print(f'{name:<16}{median:>9.1f} ms{verdict}')
+        if budget is not None and median > budget:
+            over.append(name)
+
+    modules = {}
+    for _, imports in runs:
+        for module, cumulative in imports.items():
+            modules.setdefault(module, []).append(cumulative)
+    print('slowest imports (-X importtime, median cumulative):')
+    for module, values in sorted(modules.items(), key=lambda item: -statistics.median(item[1]))[:args.top]:
+        print(f'  {module:<40}{statistics.median(values) / 1000:>9.1f} ms')
+
+    if over:
+        sys.exit(f'Over budget: {", ".join(over)}')
+
+
+if __name__ == '__main__':
+    main()
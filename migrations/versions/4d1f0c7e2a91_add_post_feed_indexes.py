@@ -0,0 +1,28 @@
+"""add post feed indexes
+
+Revision ID: 4d1f0c7e2a91
+Revises: b2c688e11698
+Create Date: 2026-10-18 09:12:40.318205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d1f0c7e2a91'
+down_revision = 'b2c688e11698'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.create_index('ix_post_created_at_id', ['created_at', 'id'], unique=False)
+        batch_op.create_index('ix_post_category_created_at_id', ['category', 'created_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.drop_index('ix_post_category_created_at_id')
+        batch_op.drop_index('ix_post_created_at_id')
@@ -0,0 +1,24 @@
+"""add post image_name index
+
+Revision ID: 5e0b7d4a9c13
+Revises: c31f7a9d2e58
+Create Date: 2026-10-18 16:48:30.772914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e0b7d4a9c13'
+down_revision = 'c31f7a9d2e58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_post_image_name', 'post', ['image_name'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_post_image_name', table_name='post')
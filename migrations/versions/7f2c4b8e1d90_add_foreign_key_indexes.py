@@ -0,0 +1,49 @@
+"""add foreign key indexes
+
+Revision ID: 7f2c4b8e1d90
+Revises: 5e0b7d4a9c13
+Create Date: 2026-10-18 18:05:14.220431
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7f2c4b8e1d90'
+down_revision = '5e0b7d4a9c13'
+branch_labels = None
+depends_on = None
+
+
+# Plain CREATE INDEX on post and reply: recreating them in batch mode would drop their post_fts triggers
+def upgrade():
+    op.create_index('ix_post_created_by', 'post', ['created_by'], unique=False)
+    op.create_index('ix_reply_post_id_parent_reply_id_post_at', 'reply',
+                    ['post_id', 'parent_reply_id', 'post_at', 'id'], unique=False)
+    op.create_index('ix_reply_parent_reply_id_post_at', 'reply', ['parent_reply_id', 'post_at', 'id'], unique=False)
+    op.create_index('ix_reply_reply_by', 'reply', ['reply_by'], unique=False)
+    op.create_index('ix_task_assigned_to', 'task', ['assigned_to'], unique=False)
+    op.create_index('ix_post_like_post_id', 'post_like', ['post_id'], unique=False)
+    op.create_index('ix_reply_like_reply_id', 'reply_like', ['reply_id'], unique=False)
+
+    # Drop duplicate applications (keeping the first) so the unique constraint can be created
+    op.execute('DELETE FROM waiting_list WHERE id NOT IN '
+               '(SELECT min(id) FROM waiting_list GROUP BY task_id, user_id)')
+    with op.batch_alter_table('waiting_list', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_waiting_list_task_user', ['task_id', 'user_id'])
+        batch_op.create_index('ix_waiting_list_user_id', ['user_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('waiting_list', schema=None) as batch_op:
+        batch_op.drop_index('ix_waiting_list_user_id')
+        batch_op.drop_constraint('uq_waiting_list_task_user', type_='unique')
+
+    op.drop_index('ix_reply_like_reply_id', table_name='reply_like')
+    op.drop_index('ix_post_like_post_id', table_name='post_like')
+    op.drop_index('ix_task_assigned_to', table_name='task')
+    op.drop_index('ix_reply_reply_by', table_name='reply')
+    op.drop_index('ix_reply_parent_reply_id_post_at', table_name='reply')
+    op.drop_index('ix_reply_post_id_parent_reply_id_post_at', table_name='reply')
+    op.drop_index('ix_post_created_by', table_name='post')
@@ -0,0 +1,37 @@
+"""add reply counters
+
+Revision ID: 9b3e5a1c7d42
+Revises: 4d1f0c7e2a91
+Create Date: 2026-10-18 10:20:05.771942
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b3e5a1c7d42'
+down_revision = '4d1f0c7e2a91'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('reply_count', sa.Integer(), server_default='0', nullable=False))
+
+    with op.batch_alter_table('reply', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('child_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill the new counters from the existing replies
+    op.execute('UPDATE post SET reply_count = (SELECT count(*) FROM reply WHERE reply.post_id = post.id)')
+    op.execute('UPDATE reply SET child_count = '
+               '(SELECT count(*) FROM reply AS child WHERE child.parent_reply_id = reply.id)')
+
+
+def downgrade():
+    with op.batch_alter_table('reply', schema=None) as batch_op:
+        batch_op.drop_column('child_count')
+
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.drop_column('reply_count')
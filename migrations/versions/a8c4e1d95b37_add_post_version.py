@@ -0,0 +1,25 @@
+"""add post version
+
+Revision ID: a8c4e1d95b37
+Revises: f3b9d6c1e274
+Create Date: 2026-10-18 13:05:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8c4e1d95b37'
+down_revision = 'f3b9d6c1e274'
+branch_labels = None
+depends_on = None
+
+
+# Plain ALTER TABLE rather than batch mode: recreating post would drop its post_fts triggers
+def upgrade():
+    op.add_column('post', sa.Column('version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    op.drop_column('post', 'version')
@@ -0,0 +1,43 @@
+"""add image jobs
+
+Revision ID: c31f7a9d2e58
+Revises: a8c4e1d95b37
+Create Date: 2026-10-18 15:22:09.504117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c31f7a9d2e58'
+down_revision = 'a8c4e1d95b37'
+branch_labels = None
+depends_on = None
+
+
+# Plain ALTER TABLE rather than batch mode: recreating post would drop its post_fts triggers
+def upgrade():
+    op.add_column('post', sa.Column('image_state', sa.String(length=10), server_default='ready', nullable=False))
+    op.create_table('image_job',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('source', sa.String(length=255), nullable=False),
+    sa.Column('status', sa.String(length=10), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.ForeignKeyConstraint(['post_id'], ['post.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('image_job', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_image_job_post_id'), ['post_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('image_job', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_image_job_post_id'))
+
+    op.drop_table('image_job')
+    op.drop_column('post', 'image_state')
@@ -0,0 +1,43 @@
+"""unique likes
+
+Revision ID: c7a2e9f41b08
+Revises: 9b3e5a1c7d42
+Create Date: 2026-10-18 11:02:31.540617
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7a2e9f41b08'
+down_revision = '9b3e5a1c7d42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Drop duplicate likes (keeping the first) so the unique constraints can be created
+    op.execute('DELETE FROM post_like WHERE id NOT IN '
+               '(SELECT min(id) FROM post_like GROUP BY user_id, post_id)')
+    op.execute('DELETE FROM reply_like WHERE id NOT IN '
+               '(SELECT min(id) FROM reply_like GROUP BY user_id, reply_id)')
+
+    with op.batch_alter_table('post_like', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_post_like_user_post', ['user_id', 'post_id'])
+
+    with op.batch_alter_table('reply_like', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_reply_like_user_reply', ['user_id', 'reply_id'])
+
+    # like_count is now maintained from the like rows, so start it from them
+    op.execute('UPDATE post SET like_count = (SELECT count(*) FROM post_like WHERE post_like.post_id = post.id)')
+    op.execute('UPDATE reply SET like_count = '
+               '(SELECT count(*) FROM reply_like WHERE reply_like.reply_id = reply.id)')
+
+
+def downgrade():
+    with op.batch_alter_table('reply_like', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_reply_like_user_reply', type_='unique')
+
+    with op.batch_alter_table('post_like', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_post_like_user_post', type_='unique')
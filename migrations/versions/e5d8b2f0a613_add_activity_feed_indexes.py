@@ -0,0 +1,34 @@
+"""add activity feed indexes
+
+Revision ID: e5d8b2f0a613
+Revises: c7a2e9f41b08
+Create Date: 2026-10-18 11:48:12.095537
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5d8b2f0a613'
+down_revision = 'c7a2e9f41b08'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('activity', schema=None) as batch_op:
+        batch_op.create_index('ix_activity_target_user_id_timestamp', ['target_user_id', 'timestamp', 'id'], unique=False)
+        batch_op.create_index('ix_activity_user_id_timestamp', ['user_id', 'timestamp', 'id'], unique=False)
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('notifications_seen_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('notifications_seen_at')
+
+    with op.batch_alter_table('activity', schema=None) as batch_op:
+        batch_op.drop_index('ix_activity_user_id_timestamp')
+        batch_op.drop_index('ix_activity_target_user_id_timestamp')
@@ -0,0 +1,62 @@
+"""add post full-text search index
+
+Revision ID: f3b9d6c1e274
+Revises: e5d8b2f0a613
+Create Date: 2026-10-18 12:31:47.662180
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b9d6c1e274'
+down_revision = 'e5d8b2f0a613'
+branch_labels = None
+depends_on = None
+
+
+def fts5_supported(bind):
+    if bind.dialect.name != 'sqlite':
+        return False
+    return bind.exec_driver_sql("SELECT 1 FROM pragma_module_list WHERE name = 'fts5'").first() is not None
+
+
+def upgrade():
+    # Only SQLite builds with FTS5 get the index; other databases keep the LIKE search
+    if not fts5_supported(op.get_bind()):
+        return
+
+    # Rebuild from scratch in case create_all() already made an empty index
+    op.execute('DROP TABLE IF EXISTS post_fts')
+    op.execute("CREATE VIRTUAL TABLE post_fts USING fts5(title, content, username, prefix='2 3')")
+    op.execute("""CREATE TRIGGER IF NOT EXISTS post_fts_insert AFTER INSERT ON post BEGIN
+        INSERT INTO post_fts (rowid, title, content, username)
+        SELECT new.id, new.title, new.content, user.username FROM user WHERE user.id = new.created_by;
+    END""")
+    op.execute("""CREATE TRIGGER IF NOT EXISTS post_fts_update AFTER UPDATE OF title, content, created_by ON post BEGIN
+        DELETE FROM post_fts WHERE rowid = old.id;
+        INSERT INTO post_fts (rowid, title, content, username)
+        SELECT new.id, new.title, new.content, user.username FROM user WHERE user.id = new.created_by;
+    END""")
+    op.execute("""CREATE TRIGGER IF NOT EXISTS post_fts_delete AFTER DELETE ON post BEGIN
+        DELETE FROM post_fts WHERE rowid = old.id;
+    END""")
+    op.execute("""CREATE TRIGGER IF NOT EXISTS post_fts_username AFTER UPDATE OF username ON user BEGIN
+        UPDATE post_fts SET username = new.username WHERE rowid IN (SELECT id FROM post WHERE created_by = new.id);
+    END""")
+
+    # Index the existing posts
+    op.execute('INSERT INTO post_fts (rowid, title, content, username) '
+               'SELECT post.id, post.title, post.content, user.username FROM post JOIN user ON user.id = post.created_by')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    op.execute('DROP TRIGGER IF EXISTS post_fts_username')
+    op.execute('DROP TRIGGER IF EXISTS post_fts_delete')
+    op.execute('DROP TRIGGER IF EXISTS post_fts_update')
+    op.execute('DROP TRIGGER IF EXISTS post_fts_insert')
+    op.execute('DROP TABLE IF EXISTS post_fts')
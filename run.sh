@@ -101,6 +101,14 @@ install_dependencies() {
     }
 }
 
+initialize_database() {
+    echo "$(date): Initializing database..." >> $LOG_FILE
+    flask init-db >> $LOG_FILE 2>&1 && echo "$(date): Database is up to date." >> $LOG_FILE || {
+        echo "$(date): Failed to initialize the database." >> $LOG_FILE
+        exit 1
+    }
+}
+
 check_port_availability() {
     if netstat -tuln | grep -q ":$PORT\s"; then
         echo "$(date): Port $PORT is busy." >> $LOG_FILE
@@ -155,6 +163,7 @@ main() {
     setup_venv
     set_flask_env
     install_dependencies
+    initialize_database
     check_port_availability
     run_flask_app
     open_browser
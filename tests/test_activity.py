@@ -0,0 +1,102 @@
+import threading
+import unittest
+from app import create_app
+from app.activity import record_activity
+from app.models import db, User, Activity
+from app.config import TestingConfig
+
+
+class AsyncActivityConfig(TestingConfig):
+    ACTIVITY_ASYNC = True
+    ACTIVITY_BATCH_SIZE = 3
+    ACTIVITY_FLUSH_INTERVAL = 0.05
+    ACTIVITY_QUEUE_SIZE = 100
+
+
+class ActivityRecorderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up an app that logs activities through the background worker."""
+        self.app = create_app(AsyncActivityConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.recorder = self.app.extensions['activity_recorder']
+
+        self.user = User(username='testuser', email='test@example.com')
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        """Stop the worker and tear down the test database."""
+        self.recorder.shutdown()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_activities_are_written_after_commit(self):
+        """Test that recorded activities reach the database in batches once the session commits."""
+        for i in range(7):
+            record_activity(self.user.id, f'action {i}')
+        self.assertEqual(self.recorder.stats()['recorded'], 0)
+
+        db.session.commit()
+        self.recorder.shutdown()
+
+        stats = self.recorder.stats()
+        self.assertEqual(Activity.query.count(), 7)
+        self.assertEqual(stats['flushed'], 7)
+        self.assertGreaterEqual(stats['batches'], 3)
+        self.assertEqual(stats['queue_depth'], 0)
+
+    def test_rolled_back_activities_are_dropped(self):
+        """Test that activities recorded in a rolled back request are never written."""
+        record_activity(self.user.id, 'never happened')
+        db.session.rollback()
+        db.session.commit()
+        self.recorder.shutdown()
+
+        self.assertEqual(Activity.query.count(), 0)
+        self.assertEqual(self.recorder.stats()['recorded'], 0)
+
+    def test_full_queue_falls_back_to_inline_writes(self):
+        """Test that rows which don't fit in the queue are written by the caller and counted."""
+        self.recorder._queue.maxsize = 1
+        self.recorder._ensure_worker = lambda: None  # Keep the queue full
+
+        rows = [{'user_id': self.user.id, 'action': f'burst {i}', 'target_user_id': None, 'timestamp': None}
+                for i in range(4)]
+        self.recorder.enqueue(rows)
+
+        stats = self.recorder.stats()
+        self.assertEqual(stats['overflow'], 3)
+        self.assertEqual(stats['queue_depth'], 1)
+        self.assertEqual(Activity.query.count(), 3)
+
+        self.recorder.flush()
+        self.assertEqual(Activity.query.count(), 4)
+
+
+    def test_counts_add_up_across_threads(self):
+        """Test that rows queued from many request threads at once are all counted and written."""
+        user_id = self.user.id
+
+        def burst(thread):
+            for i in range(50):
+                self.recorder.enqueue([{'user_id': user_id, 'action': f'thread {thread} action {i}',
+                                        'target_user_id': None, 'timestamp': None}])
+
+        threads = [threading.Thread(target=burst, args=(thread,)) for thread in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.recorder.shutdown()
+
+        stats = self.recorder.stats()
+        self.assertEqual(stats['recorded'], 400)
+        self.assertEqual(stats['flushed'], 400)
+        self.assertEqual(Activity.query.count(), 400)
+
+if __name__ == '__main__':
+    unittest.main()
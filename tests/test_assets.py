@@ -0,0 +1,151 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+from flask import url_for
+from app import create_app
+from app.avatars import build_sprite
+from app.config import TestingConfig
+from app.images import Image
+from app.models import db, User, Post
+
+
+class StaticFolderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up an app serving a temporary static folder."""
+        self.app = create_app(TestingConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        self.directory = tempfile.mkdtemp()
+        self.assets = self.app.extensions['static_assets']
+        self.assets.folder = self.directory
+        os.makedirs(os.path.join(self.directory, 'css'))
+        self.write('css/site.css', b'body { color: #333; }\n' * 200)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def write(self, name, data):
+        with open(os.path.join(self.directory, name), 'wb') as asset:
+            asset.write(data)
+
+    def url(self, filename):
+        with self.app.test_request_context():
+            return url_for('static', filename=filename)
+
+
+class StaticAssetsTestCase(StaticFolderTestCase):
+
+    def test_url_for_fingerprints(self):
+        """Test that static URLs carry a content hash and missing files are left alone."""
+        self.assertRegex(self.url('css/site.css'), r'^/static/css/site\.[0-9a-f]{12}\.css$')
+        self.assertEqual(self.url('css/missing.css'), '/static/css/missing.css')
+
+    def test_missing_file_is_remembered(self):
+        """Test that a missing file is not looked for on every use, except while templates reload."""
+        self.assertIsNone(self.assets.digest('css/late.css'))
+        self.write('css/late.css', b'p { margin: 0; }\n')
+        self.assertIsNone(self.assets.digest('css/late.css'))
+        self.app.jinja_env.auto_reload = True
+        self.assertIsNotNone(self.assets.digest('css/late.css'))
+
+    def test_fingerprinted_file_is_immutable(self):
+        """Test that fingerprinted URLs are cached for good, with a strong ETag and ranges."""
+        url = self.url('css/site.css')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertIn('max-age=31536000', response.headers['Cache-Control'])
+        etag = response.headers['ETag']
+        self.assertFalse(etag.startswith('W/'))
+
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+        partial = self.client.get(url, headers={'Range': 'bytes=0-3'})
+        self.assertEqual((partial.status_code, partial.data), (206, b'body'))
+
+    def test_stale_fingerprint_and_plain_name_revalidate(self):
+        """Test that plain names and outdated fingerprints are served but not cached for good."""
+        old = self.url('css/site.css')
+        self.write('css/site.css', b'body { color: #000; }\n')
+        os.utime(os.path.join(self.directory, 'css/site.css'), ns=(1, 1))
+        self.app.debug = True  # Notice the change
+        for url in (old, '/static/css/site.css'):
+            response = self.client.get(url)
+            self.assertEqual(response.data, b'body { color: #000; }\n')
+            self.assertIn('no-cache', response.headers['Cache-Control'])
+        self.assertNotEqual(self.url('css/site.css'), old)
+
+    def test_precompressed_copies(self):
+        """Test that built gzip copies are sent to clients that accept them."""
+        list(self.assets.build())
+        url = self.url('css/site.css')
+        response = self.client.get(url, headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(gzip.decompress(response.data), b'body { color: #333; }\n' * 200)
+        self.assertNotIn('Content-Encoding', self.client.get(url).headers)
+
+    def test_x_accel_redirect(self):
+        """Test that the proxy mode sends headers only and names the file for nginx."""
+        self.assets.sendfile = 'x-accel-redirect'
+        response = self.client.get(self.url('css/site.css'))
+        self.assertEqual(response.headers['X-Accel-Redirect'], '/_static/css/site.css')
+        self.assertEqual(response.data, b'')
+        self.assertIn('immutable', response.headers['Cache-Control'])
+
+    def test_outside_static_folder_not_found(self):
+        """Test that paths escaping the static folder are rejected."""
+        self.assertEqual(self.client.get('/static/../config.py').status_code, 404)
+        self.assertEqual(self.client.get('/static/css/site.0123456789ab.js').status_code, 404)
+
+
+@unittest.skipIf(Image is None, 'Pillow is not installed')
+class AvatarSpriteTestCase(StaticFolderTestCase):
+
+    def setUp(self):
+        """Set up a temporary static folder holding copies of the built-in avatars."""
+        super().setUp()
+        self.avatars = os.path.join(self.directory, 'image', 'avatars')
+        shutil.copytree(os.path.join(self.app.static_folder, 'image', 'avatars'), self.avatars,
+                        ignore=shutil.ignore_patterns('sprite.*'))
+        user = User(username='testuser', email='test@example.com', user_image='avatar7.png')
+        user.password = 'password123'
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Post(title='Hello', content='World', created_by=user.id))
+        db.session.commit()
+
+    def test_feed_uses_images_until_sprite_is_built(self):
+        """Test that avatars are plain images when no sprite has been built."""
+        response = self.client.get('/')
+        self.assertRegex(response.data.decode(), r'<img src="/static/image/avatars/avatar7\.[0-9a-f]{12}\.png"')
+        self.assertNotIn(b'avatar-sprite', response.data)
+
+    def test_feed_uses_sprite(self):
+        """Test that after a build the feed shows avatars from the sprite and links its stylesheet."""
+        path, count, _ = build_sprite(self.avatars, self.directory)
+        self.assertEqual(count, 24)
+        with Image.open(path) as sprite:
+            self.assertEqual(sprite.size, (720, 480))
+
+        page = self.client.get('/').data.decode()
+        self.assertIn('<span class="avatar-sprite avatar-sprite-7 avatar" role="img" aria-label="User Avatar">', page)
+        self.assertNotIn('image/avatars/avatar7', page)
+        stylesheet = self.url('css/avatars.css')
+        self.assertIn(f'<link rel="stylesheet" href="{stylesheet}">', page)
+        css = self.client.get(stylesheet).data.decode()
+        self.assertIn('.avatar-sprite-7 { background-position: 0% 33.3333%; }', css)
+        sprite_url = '/static/css/' + css.split('url("')[1].split('"')[0]
+        self.assertEqual(self.client.get(os.path.normpath(sprite_url)).status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
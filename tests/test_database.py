@@ -0,0 +1,283 @@
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+from sqlalchemy import event
+from app import create_app
+from app.config import Config, TestingConfig
+from app.database import engine_options, self_check
+from app.models import db, User, Post, Reply
+from app.replicas import sync_sqlite_replicas
+from app.query_audit import audit_routes
+from app.seeder import Seeder, SEED_PASSWORD
+from app.counters import repair_reply_counts, repair_like_counts
+
+
+class DatabaseConfigTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up the test app and its database."""
+        self.app = create_app(TestingConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def pragma(self, name):
+        return db.session.execute(db.text(f'PRAGMA {name}')).scalar()
+
+    def test_sqlite_pragmas_are_applied(self):
+        """Test that every pooled SQLite connection runs in WAL mode with a busy timeout."""
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma('busy_timeout'), Config.SQLITE_PRAGMAS['busy_timeout'])
+        self.assertEqual(self.pragma('cache_size'), Config.SQLITE_PRAGMAS['cache_size'])
+
+    def test_postgresql_gets_a_tuned_pool(self):
+        """Test that PostgreSQL URLs get pool settings which explicit engine options override."""
+        config = dict(self.app.config, SQLALCHEMY_DATABASE_URI='postgresql+psycopg://forum@db/forum',
+                      SQLALCHEMY_ENGINE_OPTIONS={'pool_size': 20})
+        options = engine_options(config)
+        self.assertEqual(options['pool_size'], 20)
+        self.assertEqual(options['max_overflow'], Config.DB_MAX_OVERFLOW)
+        self.assertTrue(options['pool_pre_ping'])
+        self.assertEqual(engine_options(dict(config, SQLALCHEMY_DATABASE_URI='sqlite://')), {'pool_size': 20})
+
+    def test_self_check(self):
+        """Test that the self-check reports the settings and fails on the development secret key."""
+        settings, warnings = self_check(self.app)
+        self.assertEqual(dict(settings)['journal_mode'], 'wal')
+        self.assertEqual(warnings, [])
+
+        self.app.testing = False
+        result = self.app.test_cli_runner().invoke(args=['self-check'])
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn('busy_timeout', result.output)
+        self.assertIn('SECRET_KEY is the development default', result.output)
+
+
+class StartupTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'fresh.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_create_app_does_no_io(self):
+        """Test that creating the app neither opens nor creates the database."""
+        class FreshConfig(TestingConfig):
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + self.path
+        create_app(FreshConfig)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_init_db(self):
+        """Test that init-db makes a new database at the latest migration and can run again."""
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        environment = dict(os.environ, DATABASE_URL='sqlite:///' + self.path, FLASK_APP='run')
+        for _ in range(2):
+            subprocess.run([sys.executable, '-m', 'flask', 'init-db'], cwd=root, env=environment,
+                           capture_output=True, check=True)
+        with sqlite3.connect(self.path) as connection:
+            tables = {name for name, in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            revision = connection.execute('SELECT version_num FROM alembic_version').fetchall()
+        self.assertTrue({'user', 'post', 'reply', 'image_job'} <= tables)
+        self.assertEqual(len(revision), 1)
+
+    def test_init_db_refuses_a_database_without_a_revision(self):
+        """Test that init-db stops, rather than replaying every migration, on tables with an empty alembic_version."""
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        with sqlite3.connect(self.path) as connection:
+            connection.execute('CREATE TABLE user (id INTEGER PRIMARY KEY)')
+            connection.execute('CREATE TABLE alembic_version (version_num VARCHAR(32) NOT NULL PRIMARY KEY)')
+        environment = dict(os.environ, DATABASE_URL='sqlite:///' + self.path, FLASK_APP='run')
+        result = subprocess.run([sys.executable, '-m', 'flask', 'init-db'], cwd=root, env=environment,
+                                capture_output=True, text=True)
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn('flask db stamp', result.stderr)
+        with sqlite3.connect(self.path) as connection:
+            self.assertEqual(connection.execute('SELECT * FROM alembic_version').fetchall(), [])
+
+
+class ReplicaRoutingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up an app with an SQLite primary and one SQLite replica in a temporary directory."""
+        self.directory = tempfile.mkdtemp()
+        self.app = create_app(self.config_class())
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        user = User(username='testuser', email='test@example.com')
+        user.password = 'password123'
+        db.session.add(user)
+        db.session.flush()
+        user_id = user.id
+        db.session.add(Post(title='Replicated post', content='Everywhere', created_by=user_id))
+        db.session.commit()
+        self.sync()
+
+        # Written after the last sync, so only the primary has it
+        db.session.add(Post(title='Lagging post', content='Primary only', created_by=user_id))
+        db.session.commit()
+        db.session.remove()
+
+    def config_class(self):
+        class ReplicaConfig(TestingConfig):
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(self.directory, 'primary.db')
+            DB_REPLICAS = ['sqlite:///' + os.path.join(self.directory, 'replica.db')]
+        return ReplicaConfig
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def sync(self):
+        db.session.remove()
+        sync_sqlite_replicas(db.engine, self.app.extensions['replicas'].engines)
+
+    def test_reads_go_to_the_replica(self):
+        """Test that a GET sees the replica's data until the replica is synced."""
+        response = self.client.get('/')
+        self.assertIn(b'Replicated post', response.data)
+        self.assertNotIn(b'Lagging post', response.data)
+
+        self.sync()
+        self.assertIn(b'Lagging post', self.client.get('/').data)
+
+    def test_writer_reads_its_own_writes(self):
+        """Test that a client stays on the primary for a while after it writes."""
+        self.client.post('/login', data={'username': 'testuser', 'password': 'password123'})
+        self.client.post('/post_create', data={'title': 'Fresh post', 'content': 'Just written', 'category': 'Daily'})
+        page = self.client.get('/').data
+        self.assertIn(b'Fresh post', page)
+        self.assertIn(b'Lagging post', page)
+
+        self.assertNotIn(b'Fresh post', self.app.test_client().get('/').data)  # Someone else
+
+        with self.client.session_transaction() as session:
+            session['primary_until'] = 0
+        self.assertNotIn(b'Fresh post', self.client.get('/').data)
+
+    def test_unavailable_replica_falls_back_to_the_primary(self):
+        """Test that reads use the primary when the replica cannot be opened."""
+        replica = self.app.extensions['replicas'].engines[0]
+        replica.dispose()
+        os.remove(replica.url.database)
+        os.mkdir(replica.url.database)  # SQLite cannot open a directory
+
+        with self.assertLogs('app.replicas', 'WARNING'):
+            response = self.client.get('/')
+        self.assertIn(b'Lagging post', response.data)
+
+        # Skipped without another attempt until the retry interval is up
+        with self.assertNoLogs('app.replicas', 'WARNING'):
+            self.assertIn(b'Lagging post', self.client.get('/').data)
+
+    def test_read_request_connects_to_the_replica_once(self):
+        """Test that a replica is not probed ahead of the session's own connection."""
+        replica = self.app.extensions['replicas'].engines[0]
+        checkouts = []
+        event.listen(replica, 'checkout', lambda *args: checkouts.append(args))
+        self.client.get('/')
+        self.assertEqual(len(checkouts), 1)
+
+
+class SeederTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app(TestingConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def seed(self, seed=0):
+        return Seeder(users=30, posts=50, replies=400, post_likes=200, reply_likes=300, activities=100,
+                      seed=seed, chunk_size=64).run()
+
+    def snapshot(self):
+        return db.session.execute(db.text('SELECT id, post_id, parent_reply_id, content FROM reply ORDER BY id')).all()
+
+    def test_seed_is_deterministic_with_consistent_counters(self):
+        """Test that a seed always gives the same rows, with counters that need no repair."""
+        stats = self.seed()
+        self.assertEqual(stats['user'][0], 30)
+        self.assertEqual(stats['post'][0], 50)
+        self.assertEqual(stats['reply'][0], Reply.query.count())
+        self.assertEqual(repair_reply_counts() + repair_like_counts(), 0)
+        self.assertTrue(Reply.query.filter(Reply.parent_reply_id.is_not(None)).count())
+        avatars = set(os.listdir(self.app.config['AVATAR_FOLDER']))
+        self.assertTrue({user.user_image for user in User.query} <= avatars)
+        first = self.snapshot()
+
+        db.drop_all()
+        db.create_all()
+        self.seed()
+        self.assertEqual(self.snapshot(), first)
+
+    def test_seed_appends_to_existing_data(self):
+        """Test that a second run adds new rows after the existing ones, and seeded users can log in."""
+        self.seed()
+        self.seed(seed=1)
+        self.assertEqual(User.query.count(), 60)
+        self.assertEqual(Post.query.count(), 100)
+
+        response = self.app.test_client().post('/login', data={'username': 'seed45', 'password': SEED_PASSWORD})
+        self.assertEqual(response.status_code, 302)
+
+
+class QueryAuditTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up an app with a small seeded forum in a temporary directory."""
+        self.directory = tempfile.mkdtemp()
+
+        class AuditConfig(TestingConfig):
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(self.directory, 'audit.db')
+            FRAGMENT_CACHE_BACKEND = 'none'
+        self.app = create_app(AuditConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Seeder(users=20, posts=100, replies=500, post_likes=300, reply_likes=500, activities=500).run()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def test_routes_use_indexes(self):
+        """Test that no query made by the audited routes reads a whole table."""
+        results = audit_routes(self.app)
+        self.assertIn('post detail', results)
+        flagged = {label: lines for label, queries in results.items() for _, _, lines in queries if lines}
+        self.assertEqual(flagged, {})
+
+    def test_missing_index_is_reported(self):
+        """Test that the audit flags the queries which lose their index."""
+        db.session.execute(db.text('DROP INDEX ix_activity_user_id_timestamp'))
+        db.session.commit()
+        results = audit_routes(self.app)
+        self.assertIn('SCAN activity', [line for _, _, lines in results['activity'] for line in lines])
+
+
+if __name__ == '__main__':
+    unittest.main()
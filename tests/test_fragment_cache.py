@@ -0,0 +1,126 @@
+import os
+import tempfile
+import unittest
+from flask import url_for
+from app import create_app
+from app.fragment_cache import MemoryFragmentBackend, SqliteFragmentBackend
+from app.models import db, User, Post, Reply, ReplyLike
+from app.config import TestingConfig
+
+
+class FragmentBackendTestCase(unittest.TestCase):
+
+    def test_memory_backend_evicts_least_recently_used(self):
+        """Test that the LRU stays within its byte budget and keeps recently read entries."""
+        backend = MemoryFragmentBackend(max_bytes=10)
+        backend.set('a', 'aaaa', 4)
+        backend.set('b', 'bbbb', 4)
+        backend.get('a')
+        backend.set('c', 'cccc', 4)
+        self.assertEqual(backend.get('a'), 'aaaa')
+        self.assertIsNone(backend.get('b'))
+        self.assertEqual(backend.size, 8)
+
+        backend.set('huge', 'x' * 11, 11)
+        self.assertIsNone(backend.get('huge'))
+
+    def test_sqlite_backend_is_shared(self):
+        """Test that two backends on one file see each other's entries and prune to the budget."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'fragments.db')
+            first, second = SqliteFragmentBackend(path, 100), SqliteFragmentBackend(path, 100)
+            first.set(('post_card', 1, 0), ('<p>card</p>', None), 11)
+            self.assertEqual(second.get(('post_card', 1, 0)), ('<p>card</p>', None))
+
+            for i in range(20):
+                second.set(('post_card', i, 1), 'x' * 10, 10)
+            second.prune()
+            self.assertEqual(len(first), 10)
+            self.assertIsNotNone(first.get(('post_card', 19, 1)))
+
+
+class FragmentCacheRoutesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app(TestingConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+        self.cache = self.app.extensions['fragment_cache']
+
+        self.author = User(username='author', email='author@example.com')
+        self.author.password = 'password123'
+        self.reader = User(username='reader', email='reader@example.com')
+        self.reader.password = 'password123'
+        db.session.add_all([self.author, self.reader])
+        db.session.flush()
+        self.post = Post(title='Cached Post', content='Cached content', created_by=self.author.id)
+        db.session.add(self.post)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def login(self, username):
+        self.client.post('/login', data=dict(username=username, password='password123'), follow_redirects=True)
+
+    def test_post_cards_are_cached_until_liked(self):
+        """Test that a card is rendered once and rendered again after a like changes it."""
+        self.client.get('/')
+        self.client.get('/')
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+        self.login('reader')
+        self.client.post(f'/like_post/{self.post.id}')
+        response = self.client.get('/')
+        self.assertIn(b'<span id="likeCount">1</span>', response.data)
+        self.assertEqual(self.cache.stats()['misses'], 2)
+
+    def test_cached_replies_are_personalized(self):
+        """Test that viewers share cached reply markup but see only their own likes and delete buttons."""
+        reply = Reply(post_id=self.post.id, reply_by=self.author.id, content='First!')
+        db.session.add(reply)
+        db.session.flush()
+        db.session.add(ReplyLike(user_id=self.reader.id, reply_id=reply.id))
+        db.session.commit()
+
+        self.login('author')
+        as_author = self.client.get(f'/post/{self.post.id}').data
+        self.login('reader')
+        as_reader = self.client.get(f'/post/{self.post.id}').data
+
+        self.assertEqual(self.cache.stats()['misses'], 2)  # The thread and the home page card after login
+        self.assertIn(b'class="delete-icon delete-reply"', as_author)
+        self.assertNotIn(b'class="delete-icon delete-reply"', as_reader)
+        with self.app.test_request_context():
+            liked_icon = f'src="{url_for("static", filename="image/liked.png")}"'.encode()
+        self.assertIn(liked_icon, as_reader)
+        self.assertNotIn(liked_icon, as_author)
+        self.assertNotIn(b'<!--like-icon', as_reader)
+        self.assertNotIn(b'<!--owner', as_reader)
+
+    def test_new_reply_invalidates_thread(self):
+        """Test that posting a reply shows up despite the thread being cached."""
+        self.login('reader')
+        self.client.get(f'/post/{self.post.id}')
+        self.client.post(f'/reply/{self.post.id}', data={'content': 'Fresh reply'})
+        self.assertIn(b'Fresh reply', self.client.get(f'/post/{self.post.id}').data)
+
+    def test_stats_route(self):
+        """Test that the cache counters are exposed as JSON to operators, and to nobody else."""
+        self.app.config['OPERATOR_USERNAMES'] = {'author'}
+        self.login('reader')
+        self.client.get('/')
+        self.assertEqual(self.client.get('/fragment_cache/stats').status_code, 404)
+
+        self.login('author')
+        stats = self.client.get('/fragment_cache/stats').get_json()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['entries'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,232 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from app import create_app
+from app.images import Image
+from app.models import db, User, Post, ImageJob
+from app.config import TestingConfig
+
+
+class ImageTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up an app whose uploads and derivatives live in a temporary directory."""
+        self.directory = tempfile.mkdtemp()
+
+        self.app = create_app(self.config_class())
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        self.user = User(username='testuser', email='test@example.com')
+        self.user.password = 'password123'
+        db.session.add(self.user)
+        db.session.flush()
+        for name in ('first.png', 'copy.png'):
+            Image.new('RGBA', (1600, 1200), (200, 120, 40, 128)).save(os.path.join(self.app.config['UPLOAD_FOLDER'], name))
+        db.session.add(Post(title='Sunset', content='Look at this', image_name='first.png', created_by=self.user.id))
+        db.session.commit()
+
+    def config_class(self):
+        class ImageConfig(TestingConfig):
+            UPLOAD_FOLDER = os.path.join(self.directory, 'uploads')
+            IMAGE_CACHE_FOLDER = os.path.join(self.directory, 'derived')
+            IMAGE_INCOMING_FOLDER = os.path.join(self.directory, 'incoming')
+            IMAGE_FORMATS = ('webp', 'jpeg')
+        os.makedirs(ImageConfig.UPLOAD_FOLDER)
+        return ImageConfig
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def derived_files(self):
+        return [os.path.join(root, name) for root, _, names in os.walk(self.app.config['IMAGE_CACHE_FOLDER'])
+                for name in names]
+
+    def upload(self, data, filename='photo.jpg'):
+        self.client.post('/login', data=dict(username='testuser', password='password123'))
+        return self.client.post('/post_create', data={
+            'title': 'Uploaded', 'content': 'With a photo', 'category': 'Daily',
+            'image': (io.BytesIO(data), filename),
+        }, content_type='multipart/form-data')
+
+
+@unittest.skipIf(Image is None, 'Pillow is not installed')
+class ImageDerivativesTestCase(ImageTestCase):
+
+    def test_derivative_is_resized_and_cached(self):
+        """Test that a derivative is made at the requested width once and then served from disk."""
+        response = self.client.get('/image/first.png/480.webp')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/webp')
+        derived = self.derived_files()
+        self.assertEqual(len(derived), 1)
+        with Image.open(derived[0]) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (480, 360)))
+        response.close()
+
+        modified = os.path.getmtime(derived[0])
+        self.client.get('/image/first.png/480.webp').close()
+        self.assertEqual(os.path.getmtime(derived[0]), modified)
+
+    def test_identical_uploads_share_derivatives(self):
+        """Test that derivatives are addressed by content, not by upload name."""
+        store = self.app.extensions['image_derivatives']
+        self.assertEqual(store.get('first.png', 240, 'jpeg'), store.get('copy.png', 240, 'jpeg'))
+
+    def test_invalid_derivatives_are_not_found(self):
+        """Test that unknown widths, formats and uploads outside the folder are rejected."""
+        for url in ('/image/first.png/333.webp', '/image/first.png/480.tiff', '/image/missing.png/480.webp',
+                    '/image/../uploads/first.png/480.webp'):
+            self.assertEqual(self.client.get(url).status_code, 404, url)
+
+    def test_cards_emit_srcset(self):
+        """Test that feed cards offer WebP and JPEG derivatives instead of the original."""
+        response = self.client.get('/')
+        self.assertIn(b'<source type="image/webp" srcset="/image/first.png/240.webp 240w, '
+                      b'/image/first.png/480.webp 480w" sizes="200px">', response.data)
+        self.assertIn(b'src="/image/first.png/240.jpeg"', response.data)
+        self.assertNotIn(b'image/uploads/first.png', response.data)
+
+    def test_upload_is_processed_after_commit(self):
+        """Test that an upload loses its EXIF, is turned upright and gets every derivative."""
+        photo = io.BytesIO()
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90 degrees clockwise to display
+        exif[0x010F] = 'Camera Maker'
+        Image.new('RGB', (1600, 1200), (10, 120, 200)).save(photo, 'JPEG', exif=exif)
+        self.upload(photo.getvalue())
+
+        post = Post.query.filter_by(title='Uploaded').one()
+        self.assertEqual(post.image_state, 'ready')
+        self.assertEqual(ImageJob.query.count(), 0)
+        self.assertEqual(os.listdir(self.app.config['IMAGE_INCOMING_FOLDER']), [])
+        with Image.open(os.path.join(self.app.config['UPLOAD_FOLDER'], post.image_name)) as image:
+            self.assertEqual(image.size, (1200, 1600))
+            self.assertEqual(len(image.getexif()), 0)
+        self.assertEqual(len(self.derived_files()), 8)  # 4 widths in 2 formats
+
+    def test_unreadable_upload_fails(self):
+        """Test that a broken image is retried, then marked failed and shown as such."""
+        self.upload(b'not an image', 'broken.png')
+        post = Post.query.filter_by(title='Uploaded').one()
+        job = ImageJob.query.one()
+        self.assertEqual((post.image_state, job.status, job.attempts), ('failed', 'failed', 3))
+        self.assertIn(b'Image could not be processed', self.client.get('/').data)
+
+    def test_pending_jobs_are_resumed(self):
+        """Test that a job persisted by an earlier process is processed by resume()."""
+        os.makedirs(self.app.config['IMAGE_INCOMING_FOLDER'])
+        Image.new('RGB', (800, 600)).save(os.path.join(self.app.config['IMAGE_INCOMING_FOLDER'], 'left.png'))
+        post = Post(title='Left over', content='From before the restart', image_name='left.png',
+                    image_state='pending', created_by=self.user.id)
+        post.image_jobs.append(ImageJob(source='left.png'))
+        db.session.add(post)
+        db.session.commit()
+        self.assertIn(b'Processing image...', self.client.get('/').data)
+
+        self.assertEqual(self.app.extensions['image_jobs'].resume(), 1)
+        db.session.refresh(post)
+        self.assertEqual(post.image_state, 'ready')
+        self.assertIn(b'/image/left.png/240.jpeg', self.client.get('/').data)
+
+
+@unittest.skipIf(Image is None, 'Pillow is not installed')
+class UploadStorageTestCase(ImageTestCase):
+
+    def photo(self, color=(10, 120, 200)):
+        data = io.BytesIO()
+        Image.new('RGB', (300, 200), color).save(data, 'JPEG')
+        return data.getvalue()
+
+    def upload_files(self):
+        return sorted(os.path.relpath(os.path.join(root, name), self.app.config['UPLOAD_FOLDER'])
+                      for root, _, names in os.walk(self.app.config['UPLOAD_FOLDER']) for name in names)
+
+    def test_identical_uploads_are_stored_once(self):
+        """Test that a repeated upload reuses the stored file and needs no processing."""
+        self.upload(self.photo(), 'one.jpeg')
+        self.upload(self.photo(), 'two.jpg')
+        first, second = Post.query.filter_by(title='Uploaded').order_by(Post.id).all()
+        self.assertEqual(first.image_name, second.image_name)
+        self.assertRegex(first.image_name, r'^([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]{60}\.jpg$')
+        self.assertEqual(second.image_state, 'ready')
+        self.assertEqual(self.upload_files(), sorted(['copy.png', 'first.png', first.image_name]))
+
+    def test_file_is_deleted_with_its_last_post(self):
+        """Test that deleting a post keeps a shared file until no post refers to it."""
+        self.upload(self.photo())
+        self.upload(self.photo())
+        first, second = Post.query.filter_by(title='Uploaded').order_by(Post.id).all()
+        path = os.path.join(self.app.config['UPLOAD_FOLDER'], first.image_name)
+
+        self.client.post(f'/delete_post/{first.id}')
+        self.assertTrue(os.path.exists(path))
+        self.client.post(f'/delete_post/{second.id}')
+        self.assertFalse(os.path.exists(path))
+
+    def test_gc_uploads(self):
+        """Test that the collector removes unreferenced uploads and derivatives only."""
+        self.client.get('/image/first.png/240.jpeg')
+        self.client.get('/image/copy.png/240.jpeg')  # Same content, so the same derivative
+        stale = os.path.join(self.app.config['IMAGE_CACHE_FOLDER'], 'ab', 'stale.webp')
+        os.makedirs(os.path.dirname(stale))
+        open(stale, 'wb').close()
+
+        runner = self.app.test_cli_runner()
+        result = runner.invoke(args=['gc-uploads', '--grace', '0', '--dry-run'])
+        self.assertIn('Would delete 2 file(s).', result.output)
+        self.assertIn('copy.png', self.upload_files())
+
+        result = runner.invoke(args=['gc-uploads', '--grace', '0'])
+        self.assertIn('Deleted 2 file(s).', result.output)
+        self.assertEqual(self.upload_files(), ['first.png'])
+        self.assertEqual(len(self.derived_files()), 1)
+
+    def test_dedupe_uploads(self):
+        """Test that uuid-named uploads are moved to their content address and merged."""
+        db.session.add(Post(title='Copy', content='Same picture', image_name='copy.png', created_by=self.user.id))
+        db.session.commit()
+
+        result = self.app.test_cli_runner().invoke(args=['dedupe-uploads'])
+        self.assertIn('Moved 2 upload(s) into 1 stored file(s).', result.output)
+        names = {post.image_name for post in Post.query}
+        self.assertEqual(len(names), 1)
+        self.assertEqual(self.upload_files(), sorted(names))
+
+
+@unittest.skipIf(Image is None, 'Pillow is not installed')
+class ImageWorkerPoolTestCase(ImageTestCase):
+
+    def config_class(self):
+        class PoolConfig(super().config_class()):
+            IMAGE_JOBS_ASYNC = True
+            IMAGE_WORKERS = 1
+        return PoolConfig
+
+    def tearDown(self):
+        self.app.extensions['image_jobs'].shutdown()
+        super().tearDown()
+
+    def test_upload_is_processed_after_commit(self):
+        """Test that the request returns before the worker process marks the image ready."""
+        photo = io.BytesIO()
+        Image.new('RGB', (1000, 800), (90, 30, 60)).save(photo, 'PNG')
+        self.upload(photo.getvalue(), 'photo.png')
+        post = Post.query.filter_by(title='Uploaded').one()
+        self.assertEqual(post.image_state, 'pending')
+
+        self.app.extensions['image_jobs'].drain(timeout=60)
+        db.session.refresh(post)
+        self.assertEqual(post.image_state, 'ready')
+        self.assertEqual(len(self.derived_files()), 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,6 @@
 import unittest
-from app import create_app, db
-from app.models import User, Post, Task, WaitingList, Reply, PostLike, ReplyLike
+from app import create_app
+from app.models import db, User, Post, Task, WaitingList, Reply, PostLike, ReplyLike
 from sqlalchemy.exc import IntegrityError
 from app.config import TestingConfig
 
@@ -29,6 +29,7 @@ class ModelsTestCase(unittest.TestCase):
 
         self.assertEqual(User.query.count(), 1)
         self.assertTrue(user.check_password('password123'))
+        self.assertTrue(user.password_hash.startswith(TestingConfig.PASSWORD_HASH_METHOD + '$'))
 
     def test_user_model_unique_username(self):
         """Test that the username is unique in the User model."""
@@ -0,0 +1,135 @@
+import json
+import unittest
+from flask import render_template_string
+from app import create_app
+from app.models import db, User, Post, Activity
+from app.query_stats import statement_shape
+from app.config import TestingConfig
+
+
+class QueryStatsConfig(TestingConfig):
+    QUERY_STATS = True
+    QUERY_STATS_HEADER = True
+    QUERY_SLOW_MS = 10000
+    QUERY_N_PLUS_ONE_THRESHOLD = 3
+
+
+class QueryStatsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up an app with the SQL instrumentation on and a page that lazy loads in a loop."""
+        self.app = create_app(QueryStatsConfig)
+
+        @self.app.route('/lazy')
+        def lazy():
+            posts = Post.query.order_by(Post.id).all()
+            return render_template_string('{% for post in posts %}\n{{ post.user.username }}\n{% endfor %}',
+                                          posts=posts)
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.stats = self.app.extensions['query_stats']
+
+        users = [User(username=f'user{i}', email=f'user{i}@example.com') for i in range(5)]
+        db.session.add_all(users)
+        db.session.flush()
+        db.session.add_all([Post(title='Title', content='Content', created_by=user.id) for user in users])
+        db.session.commit()
+        db.session.expunge_all()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_statement_shape(self):
+        """Test that statements differing only in values or IN list length share a shape."""
+        self.assertEqual(statement_shape('SELECT a FROM t WHERE id IN (?, ?) LIMIT 20'),
+                         statement_shape('SELECT  a FROM t\nWHERE id IN (?, ?, ?) LIMIT 40'))
+        self.assertNotEqual(statement_shape('SELECT a FROM t'), statement_shape('SELECT b FROM t'))
+
+    def test_requests_are_counted(self):
+        """Test that responses carry the query count and the routes' totals add up."""
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        count = int(response.headers['X-Query-Count'])
+        self.assertGreater(count, 0)
+        self.assertTrue(response.headers['Server-Timing'].startswith('db;dur='))
+
+        self.client.get('/')
+        home = self.stats.stats()['home']
+        self.assertEqual(home['requests'], 2)
+        self.assertEqual(home['n_plus_one_requests'], 0)
+        self.assertTrue(home['slowest'][0]['statement'].startswith('SELECT'))
+
+    def test_queries_outside_requests_are_ignored(self):
+        """Test that only requests are instrumented, not work in a bare app context."""
+        User.query.all()
+        self.assertEqual(self.stats.stats(), {})
+
+    def test_n_plus_one_is_reported(self):
+        """Test that a lazy load in a template loop is logged with the template line that made it."""
+        with self.assertLogs('app.query_stats', 'WARNING') as logs:
+            response = self.client.get('/lazy')
+        self.assertEqual(response.status_code, 200)
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual(entry['event'], 'n_plus_one')
+        self.assertEqual(entry['route'], 'lazy')
+        self.assertEqual(entry['count'], 5)
+        self.assertEqual(entry['origin'], '<template>:2')
+        self.assertIn('FROM user', entry['statement'])
+        self.assertEqual(self.stats.stats()['lazy']['n_plus_one_requests'], 1)
+
+    def test_notifications_load_once(self):
+        """Test that the notification page does not reload each notification."""
+        db.session.add_all([Activity(user_id=user_id, action='liked a post from ', target_user_id=1)
+                            for user_id in range(2, 6)])
+        db.session.commit()
+        with self.client.session_transaction() as session:
+            session['_user_id'] = '1'
+        self.assertEqual(self.client.get('/notification').status_code, 200)
+        self.assertEqual(self.stats.stats()['notification']['n_plus_one_requests'], 0)
+
+    def test_slow_queries_are_logged(self):
+        """Test that statements over QUERY_SLOW_MS are logged as JSON, without their parameters."""
+        self.stats.slow_seconds = 0
+        with self.assertLogs('app.query_stats', 'WARNING') as logs:
+            self.client.get('/')
+        entries = [json.loads(record.getMessage()) for record in logs.records]
+        self.assertTrue(entries)
+        self.assertEqual({entry['event'] for entry in entries}, {'slow_query'})
+        self.assertEqual({entry['route'] for entry in entries}, {'home'})
+        self.assertNotIn('parameters', entries[0])
+
+    def test_stats_route(self):
+        """Test that the per-route statistics are served to operators."""
+        self.app.config['OPERATOR_USERNAMES'] = {'user0'}
+        with self.client.session_transaction() as session:
+            session['_user_id'] = '1'
+        self.client.get('/')
+        self.assertIn('home', self.client.get('/query_stats').get_json())
+
+    def test_stats_route_hidden_from_other_users(self):
+        """Test that the statistics, which show SQL, are a 404 for users who are not operators."""
+        self.app.config['OPERATOR_USERNAMES'] = {'user0'}
+        self.assertEqual(self.client.get('/query_stats').status_code, 404)
+        with self.client.session_transaction() as session:
+            session['_user_id'] = '2'
+        self.assertEqual(self.client.get('/query_stats').status_code, 404)
+
+    def test_off_by_default(self):
+        """Test that without QUERY_STATS nothing is hooked in."""
+        app = create_app(TestingConfig)
+        self.assertNotIn('query_stats', app.extensions)
+        client = app.test_client()
+        self.assertNotIn('X-Query-Count', client.get('/').headers)
+        app.config['OPERATOR_USERNAMES'] = {'user0'}
+        with client.session_transaction() as session:
+            session['_user_id'] = '1'
+        self.assertEqual(client.get('/query_stats').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
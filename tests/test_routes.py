@@ -1,6 +1,13 @@
+import threading
 import unittest
-from app import create_app, db
-from app.models import User, Post, Reply, Activity
+from datetime import datetime
+from flask import template_rendered
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+from app import create_app
+from app.models import db, User, Post, Task, Reply, WaitingList, PostLike, ReplyLike, Activity
+from app.counters import repair_reply_counts
+from app.reply_tree import reply_page
 from app.config import TestingConfig
 
 class RoutesTestCase(unittest.TestCase):
@@ -32,6 +39,91 @@ class RoutesTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn(b'Paw Forum', response.data)
 
+    def test_home_page_paginates(self):
+        """Test that the home page only renders the first page and links to the next one."""
+        self.app.config['POSTS_PER_PAGE'] = 5
+        for i in range(8):
+            db.session.add(Post(title=f'Paged Post {i}', content='Paged content',
+                                created_by=self.test_user.id, created_at=datetime(2024, 1, 1, 12, i)))
+        db.session.commit()
+
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Paged Post 7', response.data)
+        self.assertIn(b'Paged Post 3', response.data)
+        self.assertNotIn(b'Paged Post 2', response.data)
+        self.assertIn(b'Load more', response.data)
+
+    def test_feed_load_more(self):
+        """Test that the feed endpoint continues from the cursor and ends the feed."""
+        self.app.config['POSTS_PER_PAGE'] = 5
+        for i in range(8):
+            db.session.add(Post(title=f'Paged Post {i}', content='Paged content',
+                                created_by=self.test_user.id, created_at=datetime(2024, 1, 1, 12, i)))
+        db.session.commit()
+
+        first = self.client.get('/feed').get_json()
+        self.assertIsNotNone(first['next_cursor'])
+        second = self.client.get('/feed', query_string={'cursor': first['next_cursor']}).get_json()
+        self.assertIn('Paged Post 2', second['html'])
+        self.assertIn('Paged Post 0', second['html'])
+        self.assertNotIn('Paged Post 3', second['html'])
+        self.assertIsNone(second['next_cursor'])
+
+    def test_feed_invalid_cursor(self):
+        """Test that a malformed cursor falls back to the first page."""
+        response = self.client.get('/feed?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.get_json()['next_cursor'])
+
+    def count_queries(self, url):
+        """Return the response for `url` and the number of SQL statements it issued."""
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            response = self.client.get(url)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        return response, len(statements)
+
+    def add_posts_with_replies(self, count, start=0):
+        for i in range(start, start + count):
+            author = User(username=f'author{i}', email=f'author{i}@example.com', user_image='avatar2.png')
+            db.session.add(author)
+            db.session.flush()
+            post = Post(title=f'Counted Post {i}', content='Counted content', created_by=author.id)
+            db.session.add(post)
+            db.session.flush()
+            for j in range(3):
+                db.session.add(Reply(post_id=post.id, reply_by=author.id, content=f'Reply {j}'))
+        db.session.commit()
+
+    def test_home_page_query_count_is_fixed(self):
+        """Test that rendering a feed page costs the same number of queries for 2 or 10 posts."""
+        self.add_posts_with_replies(2)
+        response, small_page = self.count_queries('/')
+        self.assertEqual(response.status_code, 200)
+
+        self.add_posts_with_replies(8, start=2)
+        response, full_page = self.count_queries('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Counted Post 9', response.data)
+        self.assertEqual(small_page, full_page)
+        self.assertLessEqual(full_page, 2)
+
+    def test_search_query_count_is_fixed(self):
+        """Test that search results load authors and reply counts without per-post queries."""
+        self.add_posts_with_replies(10)
+        self.client.get('/search?query=warmup')  # The first search probes for the full-text index
+        response, queries = self.count_queries('/search?query=Counted')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'author9', response.data)
+        self.assertLessEqual(queries, 2)
+
     def test_signup_positive(self):
         """Test the signup route for a successful registration."""
         response = self.client.post('/signup', data=dict(
@@ -101,6 +193,39 @@ class RoutesTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn(b'Invalid username or password', response.data)
 
+    def test_login_rehashes_outdated_password(self):
+        """Test that logging in replaces a hash made with another cost by one made with the configured one."""
+        self.test_user.password_hash = generate_password_hash('password123', 'pbkdf2:sha256:1000')
+        db.session.commit()
+        response = self.client.post('/login', data=dict(username='testuser', password='password123'))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(db.session.get(User, self.test_user.id).password_hash.startswith('pbkdf2:sha256:1$'))
+
+    def test_login_succeeds_when_rehash_is_turned_away(self):
+        """Test that a correct password logs in, keeping the old hash, when hashing saturates after the check."""
+        old_hash = self.test_user.password_hash = generate_password_hash('password123', 'pbkdf2:sha256:1000')
+        db.session.commit()
+        hasher = self.app.extensions['password_hasher']
+        verify = hasher.verify
+
+        def verify_then_saturate(password_hash, password):
+            result = verify(password_hash, password)
+            hasher.queue_limit = 0
+            return result
+
+        hasher.verify = verify_then_saturate
+        response = self.client.post('/login', data=dict(username='testuser', password='password123'))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(db.session.get(User, self.test_user.id).password_hash, old_hash)
+
+    def test_login_turned_away_when_hashing_is_saturated(self):
+        """Test that a login is refused at once when too much password work is already queued."""
+        self.app.extensions['password_hasher'].queue_limit = 0
+        response = self.client.post('/login', data=dict(username='testuser', password='password123'))
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response.headers)
+        self.assertIn(b'Too many people are signing in', response.data)
+
     def test_logout_positive(self):
         """Test the logout route for a successful logout."""
         # First, log in the test user
@@ -134,6 +259,381 @@ class RoutesTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 302)  # Expecting a redirect after posting
         self.assertIn(b'Replied successfully!', self.client.get(f'/post/{post_id}').data)  # Check success message in post detail page
 
+    def test_reply_updates_counters(self):
+        """Test that top-level and nested replies bump the post and parent counters."""
+        post = Post(title='Counter Post', content='Counter content', created_by=self.test_user.id)
+        db.session.add(post)
+        db.session.commit()
+        self.client.post('/login', data=dict(
+            username='testuser',
+            password='password123'
+        ), follow_redirects=True)
+
+        self.client.post(f'/reply/{post.id}', data=dict(content='Top level'))
+        parent = Reply.query.filter_by(content='Top level').first()
+        self.client.post(f'/reply/{post.id}', data=dict(content='Nested', parent_reply_id=parent.id))
+
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Post, post.id).reply_count, 2)
+        self.assertEqual(db.session.get(Reply, parent.id).child_count, 1)
+
+    def add_thread(self, post_id, depth, parent_id=None, label='Depth'):
+        """Add a chain of `depth` replies, each one answering the previous one."""
+        replies = []
+        for i in range(depth):
+            reply = Reply(post_id=post_id, reply_by=self.test_user.id, content=f'{label} {i}',
+                          parent_reply_id=parent_id, post_at=datetime(2024, 1, 1, 12, 0, i % 60))
+            db.session.add(reply)
+            db.session.flush()
+            replies.append(reply)
+            parent_id = reply.id
+        return replies
+
+    def test_post_detail_renders_deep_threads(self):
+        """Test that a very deep thread renders to the depth limit and the rest loads on demand."""
+        self.app.config['REPLY_TREE_MAX_DEPTH'] = 3
+        post = Post(title='Deep Post', content='Deep content', created_by=self.test_user.id)
+        db.session.add(post)
+        db.session.flush()
+        chain = self.add_thread(post.id, 2000)
+        db.session.commit()
+        repair_reply_counts()
+        self.client.post('/login', data=dict(username='testuser', password='password123'), follow_redirects=True)
+
+        response = self.client.get(f'/post/{post.id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Depth 3<', response.data)
+        self.assertNotIn(b'Depth 4<', response.data)
+        self.assertIn(b'Show more replies', response.data)
+
+        more = self.client.get(f'/post/{post.id}/replies', query_string={'parent': chain[3].id}).get_json()
+        self.assertIn('Depth 4<', more['html'])
+        self.assertIn('Depth 7<', more['html'])
+        self.assertNotIn('Depth 8<', more['html'])
+
+    def test_post_detail_query_count_is_fixed(self):
+        """Test that the reply tree costs the same number of queries however many replies it has."""
+        post = Post(title='Thread Post', content='Thread content', created_by=self.test_user.id)
+        db.session.add(post)
+        db.session.flush()
+        self.add_thread(post.id, 2)
+        db.session.commit()
+        repair_reply_counts()
+        self.client.post('/login', data=dict(username='testuser', password='password123'), follow_redirects=True)
+        db.session.expire_all()
+        response, small_thread = self.count_queries(f'/post/{post.id}')
+        self.assertEqual(response.status_code, 200)
+
+        for i in range(5):
+            self.add_thread(post.id, 4, label=f'Branch {i}')
+        db.session.commit()
+        repair_reply_counts()
+        db.session.expire_all()
+        response, large_thread = self.count_queries(f'/post/{post.id}')
+        self.assertIn(b'Branch 4 3', response.data)
+        self.assertEqual(small_thread, large_thread)
+
+    def test_reply_pages(self):
+        """Test paging through top-level replies and the children of one reply."""
+        self.app.config['REPLIES_PER_PAGE'] = 2
+        self.app.config['REPLY_CHILDREN_PER_PAGE'] = 2
+        post = Post(title='Busy Post', content='Busy content', created_by=self.test_user.id)
+        db.session.add(post)
+        db.session.flush()
+        tops = [Reply(post_id=post.id, reply_by=self.test_user.id, content=f'Top {i}') for i in range(3)]
+        db.session.add_all(tops)
+        db.session.flush()
+        db.session.add_all([Reply(post_id=post.id, reply_by=self.test_user.id, content=f'Child {i}',
+                                  parent_reply_id=tops[0].id) for i in range(3)])
+        db.session.commit()
+        repair_reply_counts()
+
+        replies, next_cursor = reply_page(post.id)
+        self.assertEqual([reply.content for reply in replies], ['Top 0', 'Top 1'])
+        self.assertEqual([child.content for child in replies[0].children], ['Child 0', 'Child 1'])
+        self.assertEqual(replies[0].more_children, 1)
+
+        self.client.post('/login', data=dict(username='testuser', password='password123'), follow_redirects=True)
+        rest = self.client.get(f'/post/{post.id}/replies', query_string={'cursor': next_cursor}).get_json()
+        self.assertIn('Top 2', rest['html'])
+        self.assertNotIn('Top 1', rest['html'])
+        self.assertIsNone(rest['next_cursor'])
+
+        children = self.client.get(f'/post/{post.id}/replies', query_string={
+            'parent': tops[0].id, 'cursor': replies[0].children_cursor}).get_json()
+        self.assertIn('Child 2', children['html'])
+        self.assertNotIn('Child 1', children['html'])
+        self.assertIsNone(children['next_cursor'])
+
+    def test_delete_reply_updates_counters(self):
+        """Test that deleting a reply removes its subtree from the counters."""
+        post = Post(title='Counter Post', content='Counter content', created_by=self.test_user.id, reply_count=4)
+        db.session.add(post)
+        db.session.flush()
+        root = Reply(post_id=post.id, reply_by=self.test_user.id, content='Root', child_count=1)
+        db.session.add(root)
+        db.session.flush()
+        middle = Reply(post_id=post.id, reply_by=self.test_user.id, content='Middle', parent_reply_id=root.id,
+                       child_count=1)
+        db.session.add(middle)
+        db.session.flush()
+        leaf = Reply(post_id=post.id, reply_by=self.test_user.id, content='Leaf', parent_reply_id=middle.id)
+        other = Reply(post_id=post.id, reply_by=self.test_user.id, content='Other')
+        db.session.add_all([leaf, other])
+        db.session.commit()
+        self.client.post('/login', data=dict(
+            username='testuser',
+            password='password123'
+        ), follow_redirects=True)
+
+        self.client.post(f'/delete_reply/{middle.id}')
+
+        db.session.expire_all()
+        self.assertEqual(Reply.query.count(), 2)
+        self.assertEqual(db.session.get(Post, post.id).reply_count, 2)
+        self.assertEqual(db.session.get(Reply, root.id).child_count, 0)
+
+    def test_delete_task_post(self):
+        """Test that deleting a task post also deletes its task and waiting list."""
+        other = User(username='applicant', email='applicant@example.com')
+        post = Post(title='Task Post', content='Walk my dog', created_by=self.test_user.id, is_task=True)
+        db.session.add_all([other, post])
+        db.session.flush()
+        db.session.add_all([Task(id=post.id), WaitingList(task_id=post.id, user_id=other.id)])
+        db.session.commit()
+        self.client.post('/login', data=dict(username='testuser', password='password123'))
+
+        response = self.client.post(f'/delete_post/{post.id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((Post.query.count(), Task.query.count(), WaitingList.query.count()), (0, 0, 0))
+
+    def test_repair_counters_command(self):
+        """Test that the repair command recomputes counters from the reply table."""
+        post = Post(title='Counter Post', content='Counter content', created_by=self.test_user.id, reply_count=7)
+        db.session.add(post)
+        db.session.flush()
+        db.session.add(Reply(post_id=post.id, reply_by=self.test_user.id, content='Only reply', child_count=3))
+        db.session.commit()
+
+        result = self.app.test_cli_runner().invoke(args=['repair-counters'])
+        self.assertIn('Repaired 2 counter(s).', result.output)
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Post, post.id).reply_count, 1)
+        self.assertEqual(Reply.query.first().child_count, 0)
+
+    def test_like_post_toggle(self):
+        """Test that liking twice adds then removes the like and logs both in the activity feed."""
+        post = Post(title='Liked Post', content='Liked content', created_by=self.test_user.id)
+        db.session.add(post)
+        db.session.commit()
+        self.client.post('/login', data=dict(
+            username='testuser',
+            password='password123'
+        ), follow_redirects=True)
+
+        liked = self.client.post(f'/like_post/{post.id}').get_json()
+        self.assertEqual(liked, {'like_count': 1, 'liked': True})
+        unliked = self.client.post(f'/like_post/{post.id}').get_json()
+        self.assertEqual(unliked, {'like_count': 0, 'liked': False})
+        self.assertEqual(PostLike.query.count(), 0)
+        self.assertEqual(Activity.query.filter(Activity.action.like('%a post from%')).count(), 2)
+
+    def test_like_post_concurrent_toggles(self):
+        """Test that many threads toggling likes on one post leave like_count equal to the like rows."""
+        post = Post(title='Hot Post', content='Hot content', created_by=self.test_user.id)
+        db.session.add(post)
+        users = [User(username=f'liker{i}', email=f'liker{i}@example.com') for i in range(8)]
+        db.session.add_all(users)
+        db.session.commit()
+        post_id, user_ids = post.id, [user.id for user in users]
+        errors = []
+
+        def hammer(user_id):
+            client = self.app.test_client()
+            with client.session_transaction() as session:
+                session['_user_id'] = str(user_id)
+                session['_fresh'] = True
+            for _ in range(5):  # An odd number of toggles leaves every user liking the post
+                response = client.post(f'/like_post/{post_id}')
+                if response.status_code != 200:
+                    errors.append(response.get_json())
+
+        threads = [threading.Thread(target=hammer, args=(user_id,)) for user_id in user_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        db.session.expire_all()
+        self.assertEqual(errors, [])
+        self.assertEqual(PostLike.query.filter_by(post_id=post_id).count(), len(user_ids))
+        self.assertEqual(db.session.get(Post, post_id).like_count, len(user_ids))
+
+    def test_like_concurrent_toggles_by_one_user(self):
+        """Test that one user's simultaneous likes leave at most one like row, counted, and no errors."""
+        post = Post(title='Hot Post', content='Hot content', created_by=self.test_user.id)
+        db.session.add(post)
+        db.session.flush()
+        reply = Reply(content='Hot reply', post_id=post.id, reply_by=self.test_user.id)
+        db.session.add(reply)
+        db.session.commit()
+        post_id, reply_id, user_id = post.id, reply.id, self.test_user.id
+
+        cases = [(f'/like_post/{post_id}', Post, post_id, PostLike.query.filter_by(post_id=post_id)),
+                 (f'/like_reply/{reply_id}', Reply, reply_id, ReplyLike.query.filter_by(reply_id=reply_id))]
+        for url, model, target_id, likes in cases:
+            statuses = []
+            barrier = threading.Barrier(8)
+
+            def like():
+                client = self.app.test_client()
+                with client.session_transaction() as session:
+                    session['_user_id'] = str(user_id)
+                    session['_fresh'] = True
+                barrier.wait()
+                statuses.append(client.post(url).status_code)
+
+            threads = [threading.Thread(target=like) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            db.session.expire_all()
+            self.assertEqual(statuses, [200] * 8)
+            rows = likes.count()
+            self.assertIn(rows, (0, 1))
+            self.assertEqual(db.session.get(model, target_id).like_count, rows)
+
+    def add_notifications(self, count, start_minute=0):
+        actor = User(username='actor', email='actor@example.com')
+        db.session.add(actor)
+        db.session.flush()
+        for i in range(start_minute, start_minute + count):
+            db.session.add(Activity(user_id=actor.id, action=f'liked a post {i} from ', target_user_id=self.test_user.id,
+                                    timestamp=datetime(2024, 1, 1, 12, i)))
+        db.session.commit()
+
+    def test_notification_page_paginates_and_marks_read(self):
+        """Test that notifications are paged, show unread counts and are marked read on the first page."""
+        self.app.config['ACTIVITIES_PER_PAGE'] = 3
+        self.add_notifications(5)
+        self.client.post('/login', data=dict(
+            username='testuser',
+            password='password123'
+        ), follow_redirects=True)
+
+        self.assertEqual(self.client.get('/notification/unread').get_json()['unread'], 5)
+        response = self.client.get('/notification')
+        self.assertIn(b'liked a post 4 from', response.data)
+        self.assertIn(b'(5 new)', response.data)
+        self.assertNotIn(b'liked a post 1 from', response.data)
+        self.assertEqual(self.client.get('/notification/unread').get_json()['unread'], 0)
+
+    def test_notification_feed_continues_from_cursor(self):
+        """Test that the notification feed endpoint returns the remaining notifications."""
+        self.app.config['ACTIVITIES_PER_PAGE'] = 3
+        self.add_notifications(5)
+        self.client.post('/login', data=dict(
+            username='testuser',
+            password='password123'
+        ), follow_redirects=True)
+
+        first = self.client.get('/notification/feed').get_json()
+        second = self.client.get('/notification/feed', query_string={'cursor': first['next_cursor']}).get_json()
+        self.assertIn('liked a post 0 from', second['html'])
+        self.assertNotIn('liked a post 2 from', second['html'])
+        self.assertIsNone(second['next_cursor'])
+
+    def test_unread_count_is_capped(self):
+        """Test that the unread count stops at the configured limit."""
+        self.app.config['UNREAD_NOTIFICATION_LIMIT'] = 4
+        self.add_notifications(6)
+        self.client.post('/login', data=dict(
+            username='testuser',
+            password='password123'
+        ), follow_redirects=True)
+
+        self.assertEqual(self.client.get('/notification/unread').get_json()['unread'], 4)
+
+    def test_nav_is_rendered_once(self):
+        """Test that the navbar templates are rendered once per app, not on every page."""
+        rendered = []
+        def record(sender, template, context, **extra):
+            rendered.append(template.name)
+        template_rendered.connect(record, self.app)
+        try:
+            self.client.get('/')
+            self.client.get('/search?query=dog')
+            self.client.post('/login', data=dict(username='testuser', password='password123'), follow_redirects=True)
+            self.client.get('/')
+        finally:
+            template_rendered.disconnect(record, self.app)
+        self.assertEqual(rendered.count('components/nav_logged_out.html'), 1)
+        self.assertEqual(rendered.count('components/nav_logged_in.html'), 1)
+
+    def test_nav_badge_uses_cached_count(self):
+        """Test that the unread badge is counted once and reset when notifications are opened."""
+        self.add_notifications(3)
+        self.client.post('/login', data=dict(username='testuser', password='password123'), follow_redirects=True)
+
+        statements = []
+        def count(conn, cursor, statement, *args):
+            if 'FROM activity' in statement:
+                statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            response = self.client.get('/')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+        self.assertIn(b'<span class="nav-badge">3</span>', response.data)
+        self.assertEqual(statements, [])
+
+        self.client.get('/notification')
+        self.assertNotIn(b'nav-badge', self.client.get('/').data)
+
+    def test_logged_in_user_is_cached(self):
+        """Test that an authenticated request loads its user from the cache, not the database."""
+        self.client.post('/login', data=dict(username='testuser', password='password123'), follow_redirects=True)
+        self.client.get('/notification/unread')
+
+        statements = []
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            response = self.client.get('/notification/unread')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(statements, [])
+
+    def test_profile_update_refreshes_cached_user(self):
+        """Test that saving the profile drops the cached user, so the new name shows at once."""
+        user_cache = self.app.extensions['user_cache']
+        self.client.post('/login', data=dict(username='testuser', password='password123'), follow_redirects=True)
+        self.assertEqual(user_cache.get(self.test_user.id).username, 'testuser')
+        self.assertFalse(hasattr(user_cache.get(self.test_user.id), 'password_hash'))
+
+        self.client.post('/profile', data={'username': 'renamed', 'user_image': 'avatar2.png'})
+        principal = user_cache.get(self.test_user.id)
+        self.assertEqual((principal.username, principal.user_image), ('renamed', 'avatar2.png'))
+
+    def test_activity_page_shows_target_user(self):
+        """Test that the activity page names the user the activity was aimed at."""
+        other = User(username='otheruser', email='other@example.com')
+        db.session.add(other)
+        db.session.flush()
+        db.session.add(Activity(user_id=self.test_user.id, action='liked a post from', target_user_id=other.id))
+        db.session.commit()
+        self.client.post('/login', data=dict(
+            username='testuser',
+            password='password123'
+        ), follow_redirects=True)
+
+        response = self.client.get('/activity')
+        self.assertIn(b'You liked a post from otheruser.', response.data)
+
     def test_profile_page(self):
         """Test the profile page route for a successful response."""
         self.client.post('/login', data=dict(
@@ -173,6 +673,42 @@ class RoutesTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn(b'Test Post', response.data)
 
+    def test_search_ranks_and_highlights(self):
+        """Test that title matches rank first and snippets are highlighted without changing posts."""
+        body_match = Post(title='Daily walk', content='We met a corgi at the park today.', created_by=self.test_user.id)
+        title_match = Post(title='Corgi grooming tips', content='Brush twice a week.', created_by=self.test_user.id)
+        db.session.add_all([body_match, title_match])
+        db.session.commit()
+
+        response = self.client.get('/search?query=corg')
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(response.data.index(b'Corgi grooming tips'), response.data.index(b'Daily walk'))
+        self.assertIn(b'<mark>corgi</mark>', response.data)
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Post, body_match.id).content, 'We met a corgi at the park today.')
+
+    def test_search_escapes_content(self):
+        """Test that post content in snippets is escaped."""
+        db.session.add(Post(title='Unsafe', content='<script>alert(1)</script> hamster', created_by=self.test_user.id))
+        db.session.commit()
+
+        response = self.client.get('/search?query=hamster')
+        self.assertNotIn(b'<script>alert(1)</script>', response.data)
+        self.assertIn(b'<mark>hamster</mark>', response.data)
+
+    def test_search_paginates(self):
+        """Test that search results are split into pages."""
+        self.app.config['SEARCH_RESULTS_PER_PAGE'] = 2
+        for i in range(3):
+            db.session.add(Post(title=f'Parrot {i}', content='Talking bird', created_by=self.test_user.id))
+        db.session.commit()
+
+        first = self.client.get('/search?query=parrot')
+        self.assertIn(b'page=2', first.data)
+        second = self.client.get('/search?query=parrot&page=2')
+        self.assertEqual(second.data.count(b'<h2>Parrot'), 1)
+        self.assertNotIn(b'page=3', second.data)
+
     def test_search_no_query(self):
         """Test the search route with no query."""
         self.client.post('/login', data=dict(
@@ -0,0 +1,171 @@
+import os
+import tempfile
+import unittest
+from app import create_app
+from app.inverted_index import InvertedIndex
+from app.models import db, User, Post
+from app.search import parse_query, match_expression, search_posts, fts_enabled, _fts_search
+from app.config import TestingConfig
+
+
+class InvertedIndexSearchConfig(TestingConfig):
+    SEARCH_BACKEND = 'inverted_index'
+    SEARCH_INDEX_REFRESH_INTERVAL = 0
+
+
+class FtsCandidateLimitConfig(TestingConfig):
+    SEARCH_CANDIDATE_LIMIT = 3
+
+
+class QueryParsingTestCase(unittest.TestCase):
+
+    def test_parse_query(self):
+        """Test that OR splits the query into groups and other words are lowercased."""
+        self.assertEqual(parse_query('Corgi beach OR poodle'), [['corgi', 'beach'], ['poodle']])
+        self.assertEqual(parse_query('OR "dog" OR'), [['dog']])
+        self.assertEqual(parse_query('  !!  '), [])
+
+    def test_match_expression(self):
+        """Test that the FTS5 expression quotes each word as a prefix term."""
+        self.assertEqual(match_expression('corgi beach OR poo"dle'), '("corgi"* "beach"*) OR ("poo"* "dle"*)')
+
+
+class InvertedIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.index = InvertedIndex()
+        self.index.bulk_load([
+            (1, 'Corgi at the beach', 'Sandy paws everywhere', 'alice'),
+            (2, 'Poodle grooming', 'Brushing a corgi is easier', 'bob'),
+            (3, 'Beach day', 'The poodle loved the waves', 'carol'),
+        ])
+
+    def ids(self, query, k=10):
+        return [post_id for post_id, _ in self.index.search(parse_query(query), k)]
+
+    def test_prefix_and_ranking(self):
+        """Test that prefixes match whole words and title hits outrank body hits."""
+        self.assertEqual(self.ids('corg'), [1, 2])
+        self.assertEqual(self.ids('ali'), [1])
+        self.assertEqual(self.ids('hamster'), [])
+
+    def test_and_or(self):
+        """Test that words in a group must all match and OR'ed groups are combined."""
+        self.assertEqual(self.ids('corgi beach'), [1])
+        self.assertEqual(sorted(self.ids('corgi beach OR waves')), [1, 3])
+
+    def test_top_k(self):
+        """Test that only the best k results are returned."""
+        self.assertEqual(len(self.ids('the', k=1)), 1)
+
+    def test_incremental_updates(self):
+        """Test that re-adding and removing posts keeps posting lists consistent."""
+        self.index.add(2, 'Hamster wheel', 'Tiny and fast', 'bob')
+        self.assertEqual(self.ids('poodle'), [3])
+        self.assertEqual(self.ids('hamster'), [2])
+
+        self.index.remove(1)
+        self.assertEqual(self.ids('corgi'), [])
+        self.assertNotIn('corgi', self.index.postings)
+        self.assertEqual(self.index.expand('sand'), [])
+        self.assertEqual(list(self.index.postings['beach']), [3])
+
+    def test_snapshot_round_trip(self):
+        """Test that a saved snapshot loads back with the same contents."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'index.snapshot')
+            self.index.save(path)
+            loaded = InvertedIndex.load(path)
+        self.assertEqual(loaded.max_id, 3)
+        self.assertEqual(loaded.search(parse_query('corgi'), 10), self.index.search(parse_query('corgi'), 10))
+        self.assertIsNone(InvertedIndex.load(path))
+
+
+class InvertedIndexBackendTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up an app that searches with the in-process index."""
+        self.app = create_app(InvertedIndexSearchConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        self.user = User(username='testuser', email='test@example.com')
+        db.session.add(self.user)
+        db.session.add(Post(title='Corgi grooming tips', content='Brush twice a week.', user=self.user))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_search_route(self):
+        """Test that the search page uses the inverted index and highlights the match."""
+        response = self.client.get('/search?query=brus')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Corgi grooming tips', response.data)
+        self.assertIn(b'<mark>Brush</mark>', response.data)
+
+    def test_index_follows_commits(self):
+        """Test that created, edited and deleted posts and renamed authors update the index."""
+        search_posts('warmup')
+        post = Post(title='Parrot talk', content='Polly wants a cracker', user=self.user)
+        db.session.add(post)
+        db.session.commit()
+        self.assertEqual([p.id for p, _ in search_posts('polly')[0]], [post.id])
+
+        post.content = 'Polly learned a new word'
+        self.user.username = 'birdlover'
+        db.session.commit()
+        self.assertEqual(search_posts('cracker')[0], [])
+        self.assertEqual(len(search_posts('birdlover')[0]), 2)
+
+        db.session.delete(post)
+        db.session.commit()
+        self.assertEqual(search_posts('polly')[0], [])
+
+    def test_rolled_back_changes_are_not_indexed(self):
+        """Test that posts from a rolled back transaction never reach the index."""
+        search_posts('warmup')
+        db.session.add(Post(title='Ghost post', content='Never committed', user=self.user))
+        db.session.flush()
+        db.session.rollback()
+        backend = self.app.extensions['search_backend']
+        self.assertNotIn('ghost', backend.index.postings)
+
+
+class Fts5CandidateLimitTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up an app whose full-text search ranks only the newest three matches."""
+        self.app = create_app(FtsCandidateLimitConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        if not fts_enabled():
+            self.skipTest('SQLite here has no FTS5')
+
+        user = User(username='testuser', email='test@example.com')
+        db.session.add(user)
+        self.oldest = Post(title='Corgi corgi corgi', content='All about corgis.', user=user)
+        db.session.add(self.oldest)
+        db.session.flush()
+        self.newer = [Post(title=f'Walk {i}', content='Met a corgi in the park.', user=user) for i in range(4)]
+        db.session.add_all(self.newer)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_only_the_newest_matches_are_ranked(self):
+        """Test that matches older than SEARCH_CANDIDATE_LIMIT are left out, even the best one."""
+        results = _fts_search('corgi', 10, 0)
+        self.assertEqual(sorted(post.id for post, _ in results), [post.id for post in self.newer[1:]])
+
+
+if __name__ == '__main__':
+    unittest.main()